@@ -0,0 +1,259 @@
+"""
+Gravação/reprodução (cassete) das chamadas ao LLM.
+
+- record: chama o ChatOpenAI de verdade e grava impressão digital da
+  requisição + resposta (inclusive tool calls e uso de tokens) num JSONL.
+- replay: serve as respostas gravadas, sem rede, com latência sintética
+  configurável; requisição sem gravação levanta CassetteMiss.
+- auto: reproduz quando há gravação, senão grava.
+
+A impressão digital cobre modelo, tools vinculadas e o conteúdo das
+mensagens (tipo, texto, tool calls), ignorando ids gerados por execução.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, messages_from_dict, messages_to_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from observability.log import get_logger
+
+# off (padrão) | record | replay | auto
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH") or str(Path(__file__).resolve().parents[2] / "data" / "cassettes" / "llm.jsonl")
+# recorded | none | fixed:<ms> | uniform:<min>,<max> | normal:<média>,<desvio> | lognormal:<mediana>,<sigma>
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "recorded")
+LLM_REPLAY_SEED = os.getenv("LLM_REPLAY_SEED")
+
+logger = get_logger(__name__)
+
+
+class CassetteMiss(LookupError):
+    """Requisição sem resposta gravada no cassete (modo replay)."""
+
+
+class LatencyModel:
+    """Latência sintética do replay a partir de uma especificação textual."""
+
+    # Tipo -> formato esperado (o número de parâmetros sai do formato)
+    FORMATS = {
+        "recorded": "recorded",
+        "none": "none",
+        "fixed": "fixed:<ms>",
+        "uniform": "uniform:<min>,<max>",
+        "normal": "normal:<média>,<desvio>",
+        "lognormal": "lognormal:<mediana>,<sigma>",
+    }
+
+    def __init__(self, spec: str = LLM_REPLAY_LATENCY, seed: str | None = LLM_REPLAY_SEED):
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.rng = random.Random(seed)
+        if self.kind not in self.FORMATS:
+            raise ValueError(
+                f"LLM_REPLAY_LATENCY inválido: {spec!r} (use {' | '.join(self.FORMATS.values())})"
+            )
+        expected = self.FORMATS[self.kind]
+        try:
+            self.params = [float(p) for p in params.split(",") if p.strip()]
+        except ValueError:
+            self.params = None
+        if self.params is None or len(self.params) != expected.count("<"):
+            # Validado aqui, na inicialização, e não no meio de uma requisição
+            raise ValueError(f"LLM_REPLAY_LATENCY inválido: {spec!r} (esperado {expected})")
+
+    def sample_ms(self, recorded_ms: float) -> float:
+        if self.kind == "recorded":
+            return recorded_ms
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.params[0], self.params[1])
+        if self.kind == "normal":
+            return max(self.rng.gauss(self.params[0], self.params[1]), 0.0)
+        if self.kind == "lognormal":
+            # Parametrizada pela mediana (ms) e pelo sigma do log
+            return self.rng.lognormvariate(0.0, self.params[1]) * self.params[0]
+        return 0.0
+
+
+def _message_fingerprint(message) -> dict:
+    entry = {"type": message.type, "content": message.content}
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        entry["tool_calls"] = [{"name": call["name"], "args": call["args"]} for call in tool_calls]
+    return entry
+
+
+def fingerprint(model_name: str, tools: list[str], messages: list) -> str:
+    payload = {
+        "model": model_name,
+        "tools": sorted(tools),
+        "messages": [_message_fingerprint(m) for m in messages],
+    }
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """Arquivo JSONL de gravações: uma linha por chamada, indexado pela impressão digital."""
+
+    def __init__(self, path: str = LLM_CASSETTE_PATH):
+        self.path = Path(path)
+        self._entries = {}  # fingerprint -> [gravações]
+        self._served = {}  # fingerprint -> próxima gravação a servir
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["fingerprint"], []).append(entry)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def get(self, key: str) -> dict:
+        """Próxima gravação da impressão digital (várias gravações alternam em rodízio)."""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                raise CassetteMiss(
+                    f"Chamada ao LLM não gravada no cassete {self.path} ({key[:12]}). "
+                    "Grave com LLM_CASSETTE_MODE=record ou auto."
+                )
+            index = self._served.get(key, 0)
+            self._served[key] = index + 1
+            self.hits += 1
+            return entries[index % len(entries)]
+
+    def record(self, key: str, model_name: str, message: AIMessage, latency_ms: float, request_messages: int):
+        entry = {
+            "fingerprint": key,
+            "model": model_name,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "request_messages": request_messages,
+            "latency_ms": round(latency_ms, 1),
+            "response": messages_to_dict([message])[0],
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._entries.setdefault(key, []).append(entry)
+            self.recorded += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "fingerprints": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+            }
+
+
+class CassetteChatModel(BaseChatModel):
+    """Chat model que grava ou reproduz as respostas de outro (o ChatOpenAI)."""
+
+    inner: Any = None  # modelo real; pode faltar em replay
+    cassette: Any = None
+    mode: str = "replay"
+    latency: Any = None
+    model_name: str = "unknown"
+    bound_tools: list = []
+    bind_kwargs: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def bind_tools(self, tools, **kwargs):
+        # Guarda as tools e vincula no modelo real só na hora de gravar
+        return self.model_copy(update={"bound_tools": list(tools), "bind_kwargs": kwargs})
+
+    def _tool_names(self) -> list[str]:
+        return [convert_to_openai_tool(t)["function"]["name"] for t in self.bound_tools]
+
+    def _target(self):
+        if self.inner is None:
+            raise CassetteMiss("Sem modelo real para gravar (modo replay sem gravação)")
+        return self.inner.bind_tools(self.bound_tools, **self.bind_kwargs) if self.bound_tools else self.inner
+
+    def _should_replay(self, key: str) -> bool:
+        return self.mode == "replay" or (self.mode == "auto" and key in self.cassette)
+
+    def _replayed(self, key: str) -> tuple[ChatResult, float]:
+        entry = self.cassette.get(key)
+        message = messages_from_dict([entry["response"]])[0]
+        delay_ms = self.latency.sample_ms(entry.get("latency_ms", 0.0)) if self.latency else 0.0
+        return ChatResult(generations=[ChatGeneration(message=message)]), delay_ms / 1000
+
+    def _recorded(self, key: str, messages, message: AIMessage, start: float) -> ChatResult:
+        self.cassette.record(key, self.model_name, message, (time.perf_counter() - start) * 1000, len(messages))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = fingerprint(self.model_name, self._tool_names(), messages)
+        if self._should_replay(key):
+            result, delay = self._replayed(key)
+            time.sleep(delay)
+            return result
+        start = time.perf_counter()
+        message = self._target().invoke(messages, stop=stop, **kwargs)
+        return self._recorded(key, messages, message, start)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key = fingerprint(self.model_name, self._tool_names(), messages)
+        if self._should_replay(key):
+            result, delay = self._replayed(key)
+            await asyncio.sleep(delay)
+            return result
+        start = time.perf_counter()
+        message = await self._target().ainvoke(messages, stop=stop, **kwargs)
+        return self._recorded(key, messages, message, start)
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette(path: str = LLM_CASSETTE_PATH) -> Cassette:
+    """Cassete compartilhado pelo processo (carregado uma vez)."""
+    global _cassette
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(path)
+    return _cassette
+
+
+def with_cassette(model, mode: str = LLM_CASSETTE_MODE, model_name: str | None = None, path: str = LLM_CASSETTE_PATH):
+    """Envolve o modelo conforme LLM_CASSETTE_MODE; em "off" devolve o próprio modelo."""
+    if mode == "off":
+        return model
+    if mode not in {"record", "replay", "auto"}:
+        raise ValueError(f"LLM_CASSETTE_MODE inválido: {mode}")
+    cassette = get_cassette(path)
+    # O cassete é um por processo: reporta o arquivo que foi de fato carregado
+    logger.info("llm cassette", extra={"mode": mode, "path": str(cassette.path)})
+    return CassetteChatModel(
+        inner=model,
+        cassette=cassette,
+        mode=mode,
+        latency=LatencyModel(),
+        model_name=model_name or getattr(model, "model_name", None) or "unknown",
+    )
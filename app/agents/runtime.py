@@ -0,0 +1,39 @@
+import threading
+from dataclasses import dataclass
+from agents.sql_agent import build_agent
+from graph.graph import build_graph
+
+@dataclass
+class AgentRuntime:
+    """Agente, tools e grafo compilados uma única vez por processo.
+
+    Requisições concorrentes compartilham o grafo compilado e o cliente HTTP
+    do ChatOpenAI (keep-alive). O que muda por requisição (engine, etc.)
+    entra via `context=ContextSchema(...)` na invocação do grafo.
+    """
+    graph: any
+    agent: any
+    tools: list
+    llm: any
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def build_runtime(api_key: str) -> AgentRuntime:
+    agent, tools, model = build_agent(api_key)
+    graph = build_graph(agent, tools, model)
+    return AgentRuntime(graph=graph, agent=agent, tools=tools, llm=model)
+
+
+def get_agent_runtime(api_key: str) -> AgentRuntime:
+    """Retorna o runtime do processo, construindo na primeira chamada."""
+    global _runtime
+    if _runtime is not None:
+        return _runtime
+
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = build_runtime(api_key)
+    return _runtime
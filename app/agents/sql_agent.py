@@ -1,18 +1,21 @@
 from langchain_openai import ChatOpenAI
+from agents.cassette import LLM_CASSETTE_MODE, with_cassette
 from tools.sql_tool import build_sql_tool
-from graph.state import ContextSchema
 
-def build_agent(api_key: str, context: ContextSchema):
-    model = ChatOpenAI(
-        model="gpt-4o-mini",
+MODEL_NAME = "gpt-4o-mini"
+
+def build_agent(api_key: str):
+    # Replay puro do cassete: o ChatOpenAI nem é criado (sem chave nem rede)
+    model = None if LLM_CASSETTE_MODE == "replay" else ChatOpenAI(
+        model=MODEL_NAME,
         temperature=0,
         api_key=api_key, 
         verbose=True,
         cache=None
     )
+    model = with_cassette(model, model_name=MODEL_NAME)
 
-    sql_tool = build_sql_tool(context)
-    context.llm = model
+    sql_tool = build_sql_tool()
     model_with_tools = model.bind_tools([sql_tool])
 
-    return model_with_tools, [sql_tool], model
\ No newline at end of file
+    return model_with_tools, [sql_tool], model
@@ -1,20 +1,36 @@
 import os
-import traceback
+import json
+import logging
+from contextlib import aclosing
+from uuid import uuid4
 import uvicorn
 from dotenv import load_dotenv
-from langchain.messages import HumanMessage
-from agents.sql_agent import build_agent
-from graph.graph import build_graph
+from agents.runtime import get_agent_runtime
 from graph.state import ContextSchema
-from db.mysql import create_mysql_engine
-from fastapi import FastAPI, HTTPException
+from graph.deadline import Deadline, RequestCancelled, run_until_cancelled
+from graph.history import build_graph_messages, turn_sql
+from db.mysql import create_mysql_engine, get_mysql_engine, get_async_mysql_engine, get_pool_stats, dispose_engines
+from db.executor import run_blocking, shutdown_blocking_executor
+from db.backends import DB_BACKEND, MySQLBackend, get_duckdb_backend, close_duckdb_backend
+from db.chat_store import InvalidCursor, create_chat_store
+from db.rollups import get_rollup_router
+from db.sql_guard import parse_cache_stats
+from db.cost_guard import get_cost_guard
+from cache.sql_cache import get_sql_cache
+from cache.answer_cache import get_answer_cache, context_key
+from observability.metrics import CONTENT_TYPE, MetricsMiddleware, register_callback, render_metrics
+from observability.tracing import get_trace_store, record_span, span, start_trace
+from observability.log import dropped_records, get_logger, log_payload, setup_logging, shutdown_logging
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from uuid import uuid4
 from datetime import datetime
 from sqlalchemy import text
 
 load_dotenv()
+setup_logging()
+logger = get_logger("api")
 
 app = FastAPI(title="AI SQL Agent API - Olist", description="API para análise de dados Olist via IA")
 
@@ -30,6 +46,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 API_KEY = os.getenv("API_KEY")
 MYSQL_USER = os.getenv("MYSQL_USER")
@@ -39,11 +56,34 @@ HOST = str(os.getenv("HOST"))
 PORT = int(os.getenv("MYSQL_PORT", 3306))
 DATABASE = os.getenv("DATABASE")
 
-# Armazenar histórico de chats em memória (em produção, usar DB)
-chat_history = {}
+# Histórico de chats: memória limitada (LRU/TTL) ou SQLite compartilhado entre workers
+chat_store = create_chat_store()
+
+def get_app_engine():
+    """Engine compartilhado do processo para o usuário da aplicação."""
+    return get_mysql_engine(
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD or MYSQL_ROOT_PASSWORD,
+        host=HOST,
+        port=PORT,
+        database=DATABASE
+    )
+
+def get_app_async_engine():
+    """AsyncEngine compartilhado (aiomysql), ou None se o driver não estiver instalado."""
+    return get_async_mysql_engine(
+        user=MYSQL_USER,
+        password=MYSQL_PASSWORD or MYSQL_ROOT_PASSWORD,
+        host=HOST,
+        port=PORT,
+        database=DATABASE
+    )
 
-# Configuração de histórico
-MAX_HISTORY_MESSAGES = 10  # Últimas 5 interações (5 user + 5 assistant)
+def get_app_backend():
+    """Backend de execução do SQL da tool (DB_BACKEND=mysql|duckdb)."""
+    if DB_BACKEND == "duckdb":
+        return get_duckdb_backend()
+    return MySQLBackend(get_app_engine(), get_app_async_engine())
 
 def setup_database_permissions():
     """Configura permissões do banco de dados na inicialização."""
@@ -52,13 +92,7 @@ def setup_database_permissions():
         
         # Tentar conectar com o usuário normal primeiro
         try:
-            engine = create_mysql_engine(
-                user=MYSQL_USER,
-                password=MYSQL_PASSWORD or MYSQL_ROOT_PASSWORD,
-                host=HOST,
-                port=PORT,
-                database=DATABASE
-            )
+            engine = get_app_engine()
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             print(f"✅ Usuário '{MYSQL_USER}' tem acesso ao database '{DATABASE}'")
@@ -83,17 +117,14 @@ def setup_database_permissions():
                 conn.execute(text(f"GRANT ALL PRIVILEGES ON `{DATABASE}`.* TO '{MYSQL_USER}'@'%'"))
                 conn.execute(text("FLUSH PRIVILEGES"))
                 conn.commit()
+            # Engine root é usado só aqui; não fica no registro
+            engine_root.dispose()
             
             print(f"✅ Permissões concedidas para '{MYSQL_USER}' no database '{DATABASE}'")
             
-            # Verificar se funcionou
-            engine = create_mysql_engine(
-                user=MYSQL_USER,
-                password=MYSQL_PASSWORD or MYSQL_ROOT_PASSWORD,
-                host=HOST,
-                port=PORT,
-                database=DATABASE
-            )
+            # Verificar se funcionou (descarta conexões abertas antes do GRANT)
+            engine = get_app_engine()
+            engine.dispose()
             with engine.connect() as conn:
                 conn.execute(text("SELECT 1"))
             print(f"✅ Acesso confirmado!")
@@ -114,11 +145,37 @@ def setup_database_permissions():
 @app.on_event("startup")
 async def startup_event():
     """Executado quando a API inicia."""
-    try:
-        setup_database_permissions()
-    except Exception as e:
-        print(f"⚠️  Aviso: Não foi possível verificar permissões automaticamente")
-        print(f"   A API ainda pode funcionar se as permissões estão corretas")
+    if DB_BACKEND == "mysql":
+        try:
+            # Verificação bloqueante (driver síncrono) fora do event loop
+            await run_blocking(setup_database_permissions)
+        except Exception as e:
+            print(f"⚠️  Aviso: Não foi possível verificar permissões automaticamente")
+            print(f"   A API ainda pode funcionar se as permissões estão corretas")
+
+        # Registra o engine compartilhado uma única vez por processo
+        get_app_engine()
+        get_app_async_engine()
+
+    # Compila o grafo uma única vez por processo
+    get_agent_runtime(API_KEY)
+    backend = get_app_backend()
+    logger.info("sql backend", extra={"backend": backend.name})
+
+    # Versão do dataset (escrita pelo setup_database.py) para o cache de SQL
+    await run_blocking(get_sql_cache().refresh_version, backend)
+
+    # Rollups materializados pelo setup_database.py (roteador de consultas)
+    await run_blocking(get_rollup_router().refresh, backend)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Fecha os pools de conexão ao encerrar a API."""
+    await dispose_engines()
+    close_duckdb_backend()
+    shutdown_blocking_executor()
+    chat_store.close()
+    shutdown_logging()
 
 class QueryRequest(BaseModel):
     question: str
@@ -128,6 +185,8 @@ class QueryResponse(BaseModel):
     answer: str
     chat_id: str
     timestamp: str
+    cached: bool = False
+    request_id: str | None = None  # trace em /api/debug/trace/{request_id}
 
 class ChatMessage(BaseModel):
     role: str  # "user" ou "assistant"
@@ -139,34 +198,23 @@ class ChatResponse(BaseModel):
     created_at: str
     messages: list[ChatMessage]
 
-def get_or_create_chat(chat_id: str | None = None) -> str:
-    """Retorna chat_id existente ou cria um novo."""
-    if chat_id and chat_id in chat_history:
-        return chat_id
-    
-    new_chat_id = str(uuid4())
-    chat_history[new_chat_id] = {
-        "created_at": datetime.now().isoformat(),
-        "messages": []
-    }
-    return new_chat_id
-
 @app.post("/api/chat/new")
 async def create_new_chat():
     """Cria um novo chat."""
-    chat_id = get_or_create_chat()
+    chat_id = await chat_store.create()
+    chat = await chat_store.get(chat_id)
     return {
         "chat_id": chat_id,
-        "created_at": chat_history[chat_id]["created_at"]
+        "created_at": chat["created_at"]
     }
 
 @app.get("/api/chat/{chat_id}")
 async def get_chat(chat_id: str):
     """Recupera um chat específico com seu histórico."""
-    if chat_id not in chat_history:
+    chat = await chat_store.get(chat_id)
+    if chat is None:
         raise HTTPException(status_code=404, detail="Chat não encontrado")
     
-    chat = chat_history[chat_id]
     messages = [
         ChatMessage(role=msg["role"], content=msg["content"], timestamp=msg["timestamp"])
         for msg in chat["messages"]
@@ -179,27 +227,119 @@ async def get_chat(chat_id: str):
     )
 
 @app.get("/api/chats")
-async def list_chats():
-    """Lista todos os chats."""
-    chats = []
-    for chat_id, chat in chat_history.items():
-        chats.append({
-            "chat_id": chat_id,
-            "created_at": chat["created_at"],
-            "message_count": len(chat["messages"]),
-            "last_message": chat["messages"][-1]["content"] if chat["messages"] else None
-        })
-    return {"chats": chats}
+async def list_chats(limit: int | None = None, cursor: str | None = None):
+    """Lista os chats do mais recente para o mais antigo, paginados por cursor."""
+    try:
+        chats, next_cursor = await chat_store.list(limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"chats": chats, "next_cursor": next_cursor}
 
 @app.delete("/api/chat/{chat_id}")
 async def delete_chat(chat_id: str):
     """Deleta um chat."""
-    if chat_id not in chat_history:
+    if not await chat_store.delete(chat_id):
         raise HTTPException(status_code=404, detail="Chat não encontrado")
     
-    del chat_history[chat_id]
     return {"message": "Chat deletado com sucesso"}
 
+@app.get("/api/db/pool")
+async def pool_stats():
+    """Estatísticas ao vivo dos pools de conexão (checked-out, overflow, espera)."""
+    return {"pools": get_pool_stats()}
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Estatísticas do cache de resultados SQL (hits, misses, versão do dataset)."""
+    return {
+        "sql": get_sql_cache().stats(),
+        "answers": get_answer_cache().stats(),
+        "rollups": get_rollup_router().stats(),
+        "sql_parse": parse_cache_stats(),
+        "explain": get_cost_guard().stats(),
+        "chats": await run_blocking(chat_store.stats)
+    }
+
+def cache_lookup_samples() -> list:
+    """Lookups acumulados de cada cache (lidos no scrape do /metrics)."""
+    sql = get_sql_cache().stats()
+    answers = get_answer_cache().stats()
+    explain = get_cost_guard().stats()
+    return [
+        (("sql", "hit"), sql["hits"]),
+        (("sql", "disk_hit"), sql["disk_hits"]),
+        (("sql", "miss"), sql["misses"]),
+        (("answer", "hit"), answers["hits"]),
+        (("answer", "near_hit"), answers["near_hits"]),
+        (("answer", "miss"), answers["misses"]),
+        (("explain", "hit"), explain["hits"]),
+        (("explain", "miss"), explain["misses"]),
+    ]
+
+def cache_hit_ratio_samples() -> list:
+    return [
+        (("sql",), get_sql_cache().stats()["hit_ratio"]),
+        (("answer",), get_answer_cache().stats()["hit_ratio"]),
+        (("explain",), get_cost_guard().stats()["hit_ratio"]),
+    ]
+
+def pool_connection_samples() -> list:
+    samples = []
+    for pool in get_pool_stats():
+        for state in ("checked_out", "checked_in", "overflow"):
+            if state in pool:
+                samples.append(((pool["dsn"], state), pool[state]))
+    return samples
+
+def pool_timeout_samples() -> list:
+    return [((pool["dsn"],), pool["timeouts"]) for pool in get_pool_stats() if "timeouts" in pool]
+
+register_callback("copilot_cache_lookups_total", "Lookups por cache e resultado", "counter", ("cache", "result"), cache_lookup_samples)
+register_callback("copilot_cache_hit_ratio", "Taxa de acerto acumulada de cada cache", "gauge", ("cache",), cache_hit_ratio_samples)
+register_callback("copilot_db_pool_connections", "Conexões do pool por estado", "gauge", ("dsn", "state"), pool_connection_samples)
+register_callback("copilot_db_pool_timeouts_total", "Esperas por conexão que estouraram o DB_POOL_TIMEOUT", "counter", ("dsn",), pool_timeout_samples)
+register_callback("copilot_log_records_dropped_total", "Registros de log descartados com a fila cheia", "counter", (), lambda: [((), dropped_records())])
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas no formato de exposição do Prometheus."""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/api/debug/traces")
+async def list_traces(limit: int = 50, slowest: bool = False):
+    """Traces recentes no buffer (slowest=true ordena pela duração)."""
+    return {"traces": get_trace_store().recent(limit, slowest)}
+
+@app.get("/api/debug/trace/{request_id}")
+async def get_trace(request_id: str):
+    """Cascata de spans de uma requisição (/api/ask ou /api/ask/stream)."""
+    trace = get_trace_store().get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace não encontrado (expirou do buffer ou id inválido)")
+    return trace.waterfall()
+
+def messages_summary(messages: list) -> list[dict]:
+    """Resumo das mensagens do grafo para log (tipo, tamanho, tool calls e início do texto)."""
+    return [
+        {
+            "type": msg.type,
+            "chars": len(str(msg.content)),
+            "tool_calls": [call["name"] for call in getattr(msg, "tool_calls", None) or []],
+            "preview": str(msg.content)[:200],
+        }
+        for msg in messages
+    ]
+
+def request_id_for(http_request: Request) -> str:
+    """Id da requisição: o X-Request-ID do cliente, se veio, senão um novo."""
+    return http_request.headers.get("x-request-id") or uuid4().hex
+
+def record_request_parse(http_request: Request):
+    """Span da chegada até o handler (leitura e validação do corpo pelo FastAPI)."""
+    received_ns = getattr(http_request.state, "received_ns", None)
+    if received_ns:
+        record_span("request.parse", received_ns)
+
 def needs_database_query(question: str) -> bool:
     """Verifica se a pergunta realmente precisa de consulta ao banco."""
     question_lower = question.lower().strip()
@@ -244,49 +384,134 @@ def is_english(question: str) -> bool:
 
     return en_hits > pt_hits
 
+CASUAL_RESPONSES = {
+    "olá": "Olá! Sou seu assistente de análise de dados Olist. Como posso ajudar você hoje? Posso responder perguntas sobre categorias, vendas, GMV, estados, pagamentos e muito mais!",
+    "oi": "Oi! 👋 Estou aqui para ajudar com análises do dataset Olist. Pergunte-me sobre vendas, categorias, estados ou qualquer métrica!",
+    "meu nome": f"Prazer em conhecê-lo! Como posso ajudá-lo a analisar os dados do Olist hoje?",
+    "ta moscando": "Entendi. Quer que eu recalcule usando **apenas pedidos atrasados** (entregues após a data estimada)?",
+    "tá moscando": "Entendi. Quer que eu recalcule usando **apenas pedidos atrasados** (entregues após a data estimada)?",
+    "não é isso": "Ok. Você quer que eu refaça a análise? Posso calcular atraso por **estado (UF)** ou por **região macro**.",
+    "nao é isso": "Ok. Você quer que eu refaça a análise? Posso calcular atraso por **estado (UF)** ou por **região macro**.",
+    "nada a ver": "Desculpe pela resposta anterior. Você pode reformular a pergunta ou indicar o recorte desejado (estado, região macro, período)?",
+}
+
+def casual_answer(question: str) -> str:
+    """Resposta rápida para mensagens casuais (sem LLM nem banco)."""
+    for pattern, answer in CASUAL_RESPONSES.items():
+        if pattern in question.lower():
+            return answer
+    return "Entendi! Como posso ajudar você com a análise dos dados Olist?"
+
+def fix_answer_language(question: str, content: str) -> str:
+    """Se a pergunta for em inglês e a resposta for a negativa em PT-BR, corrige o idioma."""
+    pt_scope_message = "Desculpe, só tenho informações sobre os dados do Olist."
+    en_scope_message = "Sorry, I only have information about Olist data. I can assist with questions about Olist orders, deliveries, products, categories, reviews, and sales."
+    if is_english(question) and pt_scope_message in content:
+        return en_scope_message
+    return content
+
+async def save_turn(chat_id: str, question: str, answer: str, timestamp: str, sql: str | None = None):
+    """Salva pergunta e resposta (com o SQL executado, se houve) no histórico do chat."""
+    answer_message = {
+        "role": "assistant",
+        "content": answer,
+        "timestamp": timestamp
+    }
+    if sql:
+        answer_message["sql"] = sql
+    with span("history.save"):
+        await chat_store.append_messages(chat_id, [
+            {
+                "role": "user",
+                "content": question,
+                "timestamp": timestamp
+            },
+            answer_message
+        ])
+
+def build_request_context(deadline: Deadline | None = None) -> ContextSchema:
+    """Contexto por requisição; agente e grafo são compartilhados."""
+    if DB_BACKEND == "duckdb":
+        return ContextSchema(
+            deadline=deadline,
+            backend=get_duckdb_backend(),
+            sql_cache=get_sql_cache(),
+            rollup_router=get_rollup_router(),
+            cost_guard=get_cost_guard()
+        )
+
+    # Engine compartilhado do processo (pool reaproveitado entre perguntas)
+    try:
+        engine = get_app_engine()
+        async_engine = get_app_async_engine()
+    except Exception as db_error:
+        if "Access denied" in str(db_error):
+            raise HTTPException(
+                status_code=403,
+                detail=f"Erro de acesso ao database. Verifique se o usuário '{MYSQL_USER}' tem permissões no database '{DATABASE}'. Consulte setup_permissions.sql para corrigir."
+            )
+        elif "Unknown database" in str(db_error):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Database '{DATABASE}' não encontrado. Verifique a configuração no .env"
+            )
+        raise
+
+    return ContextSchema(
+        deadline=deadline,
+        db=engine,
+        async_db=async_engine,
+        backend=MySQLBackend(engine, async_engine),
+        sql_cache=get_sql_cache(),
+        rollup_router=get_rollup_router(),
+        cost_guard=get_cost_guard()
+    )
+
+def answer_cache_scope(question: str, chat_messages: list[dict]) -> dict:
+    """Escopo do cache de respostas: idioma, contexto recente do chat e versão do dataset."""
+    return {
+        "language": "en" if is_english(question) else "pt",
+        "context": context_key(chat_messages),
+        "version": get_sql_cache().version,
+    }
+
+async def rebuild_history(chat_id: str, chat: dict, question: str) -> list:
+    """Histórico do grafo dentro do orçamento de tokens; guarda o resumo no chat quando ele muda."""
+    with span("history.rebuild") as history_span:
+        messages, summary, changed = build_graph_messages(chat, question)
+        if changed:
+            # Só quando trocas saíram da janela: no máximo uma escrita por turno
+            await chat_store.set_summary(chat_id, summary)
+        history_span.set(messages=len(messages), summary_lines=len(summary["lines"]), summary_updated=changed)
+    return messages
+
 @app.post("/api/ask", response_model=QueryResponse)
-async def ask_database(request: QueryRequest):
+async def ask_database(request: QueryRequest, http_request: Request):
     """Consulta o dataset com suporte a múltiplos chats."""
+    request_id = request_id_for(http_request)
+    received_ns = getattr(http_request.state, "received_ns", None)
+    with start_trace(request_id, "POST /api/ask", received_ns, question_chars=len(request.question)) as root:
+        record_request_parse(http_request)
+        response = await answer_question(request, http_request)
+        response.request_id = request_id
+        root.set(chat_id=response.chat_id, cached=response.cached)
+        return response
+
+async def answer_question(request: QueryRequest, http_request: Request) -> QueryResponse:
+    """Fluxo do /api/ask: resposta casual, cache de respostas ou grafo (LLM + SQL)."""
     try:
         # Obter ou criar chat
-        chat_id = get_or_create_chat(request.chat_id)
+        with span("chat.resolve"):
+            chat_id = await chat_store.get_or_create(request.chat_id)
         timestamp = datetime.now().isoformat()
         
         # Verificar se precisa consultar o banco
         if not needs_database_query(request.question):
             # Resposta rápida para mensagens casuais
-            casual_responses = {
-                "olá": "Olá! Sou seu assistente de análise de dados Olist. Como posso ajudar você hoje? Posso responder perguntas sobre categorias, vendas, GMV, estados, pagamentos e muito mais!",
-                "oi": "Oi! 👋 Estou aqui para ajudar com análises do dataset Olist. Pergunte-me sobre vendas, categorias, estados ou qualquer métrica!",
-                "meu nome": f"Prazer em conhecê-lo! Como posso ajudá-lo a analisar os dados do Olist hoje?",
-                "ta moscando": "Entendi. Quer que eu recalcule usando **apenas pedidos atrasados** (entregues após a data estimada)?",
-                "tá moscando": "Entendi. Quer que eu recalcule usando **apenas pedidos atrasados** (entregues após a data estimada)?",
-                "não é isso": "Ok. Você quer que eu refaça a análise? Posso calcular atraso por **estado (UF)** ou por **região macro**.",
-                "nao é isso": "Ok. Você quer que eu refaça a análise? Posso calcular atraso por **estado (UF)** ou por **região macro**.",
-                "nada a ver": "Desculpe pela resposta anterior. Você pode reformular a pergunta ou indicar o recorte desejado (estado, região macro, período)?",
-            }
-            
-            # Encontrar resposta casual
-            response = None
-            for pattern, answer in casual_responses.items():
-                if pattern in request.question.lower():
-                    response = answer
-                    break
-            
-            if not response:
-                response = "Entendi! Como posso ajudar você com a análise dos dados Olist?"
+            response = casual_answer(request.question)
             
             # Salvar no histórico
-            chat_history[chat_id]["messages"].append({
-                "role": "user",
-                "content": request.question,
-                "timestamp": timestamp
-            })
-            chat_history[chat_id]["messages"].append({
-                "role": "assistant",
-                "content": response,
-                "timestamp": timestamp
-            })
+            await save_turn(chat_id, request.question, response, timestamp)
             
             return QueryResponse(
                 answer=response,
@@ -294,85 +519,54 @@ async def ask_database(request: QueryRequest):
                 timestamp=timestamp
             )
         
-        # Conectar ao database
-        try:
-            engine = create_mysql_engine(
-                user=MYSQL_USER,
-                password=MYSQL_PASSWORD or MYSQL_ROOT_PASSWORD,
-                host=HOST,
-                port=PORT,
-                database=DATABASE
+        with span("chat.load", chat_id=chat_id) as load_span:
+            chat = await chat_store.get(chat_id)
+            chat_messages = chat["messages"]
+            load_span.set(messages=len(chat_messages))
+
+        # Pergunta repetida (ou quase): responde do cache sem LLM nem SQL
+        with span("answer_cache.lookup") as lookup_span:
+            cache_scope = answer_cache_scope(request.question, chat_messages)
+            cached_answer = get_answer_cache().get(request.question, **cache_scope)
+            lookup_span.set(hit=cached_answer is not None)
+        if cached_answer is not None:
+            await save_turn(chat_id, request.question, cached_answer, timestamp)
+            return QueryResponse(
+                answer=cached_answer,
+                chat_id=chat_id,
+                timestamp=timestamp,
+                cached=True
             )
-        except Exception as db_error:
-            if "Access denied" in str(db_error):
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"Erro de acesso ao database. Verifique se o usuário '{MYSQL_USER}' tem permissões no database '{DATABASE}'. Consulte setup_permissions.sql para corrigir."
-                )
-            elif "Unknown database" in str(db_error):
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Database '{DATABASE}' não encontrado. Verifique a configuração no .env"
-                )
-            raise
-        
-        context = ContextSchema(llm=None, db=engine)
-        
-        # Reconstrói o agente para este contexto específico
-        agent, tools, model = build_agent(API_KEY, context=context)
-        app_graph = build_graph(agent, tools, model)
 
-        # Construir histórico de mensagens (limitado)
-        messages = []
-        chat_messages = chat_history[chat_id]["messages"]
-        
-        # Pegar apenas as últimas N mensagens para evitar excesso de tokens
-        recent_messages = chat_messages[-MAX_HISTORY_MESSAGES:] if len(chat_messages) > MAX_HISTORY_MESSAGES else chat_messages
-        
-        for msg in recent_messages:
-            if msg["role"] == "user":
-                messages.append(HumanMessage(content=msg["content"]))
-            elif msg["role"] == "assistant":
-                from langchain.messages import AIMessage
-                messages.append(AIMessage(content=msg["content"]))
-        
-        # Adicionar pergunta atual
-        messages.append(HumanMessage(content=request.question))
-
-        result = app_graph.invoke({
-            "messages": messages
-        }, config={"recursion_limit": 50})
-
-        print("=== DEBUG: Result completo ===")
-        print(result)
-        print("\n=== DEBUG: Messages ===")
-        print(result.get("messages", []))
-        print("\n=== DEBUG: Última mensagem ===")
-        if result.get("messages"):
-            last_msg = result["messages"][-1]
-            print(f"Tipo: {type(last_msg)}")
-            print(f"Content: {last_msg.content}")
-        
-        final_content = result["messages"][-1].content if result.get("messages") else ""
+        deadline = Deadline()
+        context = build_request_context(deadline)
+        app_graph = get_agent_runtime(API_KEY).graph
 
-        # Se a pergunta for em inglês e a resposta for a negativa em PT-BR, corrigir idioma
-        pt_scope_message = "Desculpe, só tenho informações sobre os dados do Olist."
-        en_scope_message = "Sorry, I only have information about Olist data. I can assist with questions about Olist orders, deliveries, products, categories, reviews, and sales."
-        if is_english(request.question) and pt_scope_message in final_content:
-            final_content = en_scope_message
+        # Histórico limitado por tokens: trocas antigas viram um resumo corrido
+        messages = await rebuild_history(chat_id, chat, request.question)
+
+        # Cliente saiu ou prazo estourou: cancela SQL (KILL QUERY) e a chamada ao LLM
+        with span("graph"):
+            result = await run_until_cancelled(
+                app_graph.ainvoke({"messages": messages}, config={"recursion_limit": 50}, context=context),
+                deadline,
+                http_request.is_disconnected
+            )
+
+        # Só monta o resumo se DEBUG estiver ativo e a requisição cair na amostra
+        log_payload(logger, logging.DEBUG, "graph result", lambda: {
+            "chat_id": chat_id,
+            "messages": messages_summary(result.get("messages", [])),
+        })
+
+        final_content = result["messages"][-1].content if result.get("messages") else ""
+        final_content = fix_answer_language(request.question, final_content)
+        if final_content:
+            get_answer_cache().put(request.question, answer=final_content, **cache_scope)
 
         # Salvar no histórico
         timestamp = datetime.now().isoformat()
-        chat_history[chat_id]["messages"].append({
-            "role": "user",
-            "content": request.question,
-            "timestamp": timestamp
-        })
-        chat_history[chat_id]["messages"].append({
-            "role": "assistant",
-            "content": final_content,
-            "timestamp": timestamp
-        })
+        await save_turn(chat_id, request.question, final_content, timestamp, turn_sql(result.get("messages", [])))
 
         return QueryResponse(
             answer=final_content,
@@ -382,10 +576,131 @@ async def ask_database(request: QueryRequest):
 
     except HTTPException:
         raise
+    except RequestCancelled as e:
+        logger.warning("request cancelled", extra={"reason": e.reason})
+        if e.reason == "deadline":
+            raise HTTPException(status_code=504, detail="Tempo limite da pergunta esgotado. Tente uma pergunta mais específica.")
+        # Cliente desconectado: ninguém vai ler a resposta
+        raise HTTPException(status_code=499, detail="Requisição cancelada pelo cliente.")
     except Exception as e:
-        print(f"Erro detalhado: {e}")
-        traceback.print_exc()
+        logger.exception("ask failed")
         raise HTTPException(status_code=500, detail=f"Erro ao processar a pergunta da IA: {str(e)}")
 
+def sse_event(event: str, data: dict) -> str:
+    """Formata um evento Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def chunk_text(chunk) -> str:
+    """Texto de um AIMessageChunk (ignora blocos de tool call)."""
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+@app.post("/api/ask/stream")
+async def ask_database_stream(request: QueryRequest, http_request: Request):
+    """Versão streaming (SSE) do /api/ask: progresso do SQL e tokens da narrativa."""
+    request_id = request_id_for(http_request)
+    received_ns = getattr(http_request.state, "received_ns", None)
+    chat_id = await chat_store.get_or_create(request.chat_id)
+
+    if not needs_database_query(request.question):
+        async def casual_events():
+            timestamp = datetime.now().isoformat()
+            response = casual_answer(request.question)
+            await save_turn(chat_id, request.question, response, timestamp)
+            yield sse_event("chat", {"chat_id": chat_id})
+            yield sse_event("token", {"text": response})
+            yield sse_event("done", {"answer": response, "chat_id": chat_id, "timestamp": timestamp})
+
+        return StreamingResponse(casual_events(), media_type="text/event-stream")
+
+    chat = await chat_store.get(chat_id)
+    chat_messages = chat["messages"]
+    cache_scope = answer_cache_scope(request.question, chat_messages)
+    cached_answer = get_answer_cache().get(request.question, **cache_scope)
+    if cached_answer is not None:
+        async def cached_events():
+            timestamp = datetime.now().isoformat()
+            await save_turn(chat_id, request.question, cached_answer, timestamp)
+            yield sse_event("chat", {"chat_id": chat_id})
+            yield sse_event("token", {"text": cached_answer})
+            yield sse_event("done", {"answer": cached_answer, "chat_id": chat_id, "timestamp": timestamp, "cached": True})
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream")
+
+    deadline = Deadline()
+    context = build_request_context(deadline)
+    app_graph = get_agent_runtime(API_KEY).graph
+    messages = await rebuild_history(chat_id, chat, request.question)
+
+    async def events():
+        # O trace cobre o stream inteiro (até o último evento enviado)
+        with start_trace(request_id, "POST /api/ask/stream", received_ns, chat_id=chat_id):
+            record_request_parse(http_request)
+            async with aclosing(graph_events()) as stream:
+                async for event in stream:
+                    yield event
+
+    async def graph_events():
+        yield sse_event("chat", {"chat_id": chat_id, "request_id": request_id})
+        final_content = ""
+        queries = []
+        finished = False
+        try:
+            async for mode, payload in app_graph.astream(
+                {"messages": messages},
+                config={"recursion_limit": 50},
+                context=context,
+                stream_mode=["messages", "updates", "custom"],
+            ):
+                if mode == "messages":
+                    # Tokens da narrativa gerados pelo nó de análise
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") == "unified_analysis":
+                        text_piece = chunk_text(chunk)
+                        if text_piece:
+                            yield sse_event("token", {"text": text_piece})
+                elif mode == "updates":
+                    for node, update in payload.items():
+                        if not update or node != "unified_analysis":
+                            continue
+                        last_msg = update["messages"][-1]
+                        if getattr(last_msg, "tool_calls", None):
+                            for call in last_msg.tool_calls:
+                                queries.append(call["args"].get("query", ""))
+                                yield sse_event("sql_start", {"sql": queries[-1]})
+                        else:
+                            final_content = last_msg.content
+                elif mode == "custom":
+                    # Eventos emitidos pela tool SQL (linhas, latência)
+                    yield sse_event(payload.get("event", "progress"), payload)
+
+            final_content = fix_answer_language(request.question, final_content)
+            if final_content:
+                get_answer_cache().put(request.question, answer=final_content, **cache_scope)
+            timestamp = datetime.now().isoformat()
+            await save_turn(chat_id, request.question, final_content, timestamp, ";\n".join(q for q in queries if q) or None)
+            finished = True
+            yield sse_event("done", {"answer": final_content, "chat_id": chat_id, "timestamp": timestamp})
+        except RequestCancelled as e:
+            finished = True
+            logger.warning("stream cancelled", extra={"reason": e.reason})
+            yield sse_event("error", {"detail": "Tempo limite da pergunta esgotado.", "reason": e.reason})
+        except Exception as e:
+            finished = True
+            logger.exception("stream failed")
+            yield sse_event("error", {"detail": f"Erro ao processar a pergunta da IA: {str(e)}"})
+        finally:
+            if not finished:
+                # O Starlette cancela o gerador quando o cliente desconecta
+                deadline.cancel_in_background("disconnect")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
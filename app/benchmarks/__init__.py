@@ -0,0 +1,8 @@
+"""
+Benchmark offline do /api/ask: LLM falso com tool calls roteirizadas, banco
+DuckDB de fixture gerado localmente e latência (p50/p95) por etapa.
+
+Uso (a partir de app/):
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --compare bench.json
+"""
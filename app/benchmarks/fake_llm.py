@@ -0,0 +1,75 @@
+"""
+Chat model falso e determinístico para o benchmark.
+
+Primeira passada (sem ToolMessage): devolve a tool call do_sql_query com o
+SQL roteirizado para a pergunta. Segunda passada (narrativa): monta uma
+resposta em markdown a partir do resultado da tool. Latência simulada
+opcional, para aproximar o tempo de parede de uma chamada real.
+
+Com --cassette o benchmark usa respostas reais gravadas (agents/cassette.py)
+no lugar do roteiro.
+"""
+
+import asyncio
+import time
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class PassTimer:
+    """Mixin para chat models: registra a duração de cada passada no `recorder`."""
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        # Mede a passada inteira (callbacks do LangChain incluídos)
+        start = time.perf_counter()
+        response = await super().ainvoke(input, config, **kwargs)
+        if self.recorder is not None:
+            narrative = any(isinstance(m, ToolMessage) for m in input)
+            self.recorder.record("narrative_pass" if narrative else "agent_pass", start)
+        return response
+
+
+class ScriptedChatModel(PassTimer, BaseChatModel):
+    """LLM roteirizado: pergunta -> SQL; resultado da tool -> narrativa."""
+
+    script: dict[str, str] = {}  # pergunta -> SQL
+    default_sql: str = "SELECT COUNT(*) AS orders FROM olist_orders_dataset"
+    latency_ms: float = 0.0  # latência simulada por chamada
+    recorder: object = None  # StageRecorder do benchmark (opcional)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages) -> AIMessage:
+        tool_results = [m for m in messages if isinstance(m, ToolMessage)]
+        if tool_results:
+            lines = str(tool_results[-1].content).splitlines() or [""]
+            if self.recorder is not None and not lines[0].startswith("rows:"):
+                # A tool devolveu erro/recusa em vez de tabela
+                self.recorder.errors.append(lines[0][:200])
+            return AIMessage(
+                content="## 📊 Resultado\n\n" + "\n".join(f"- {line}" for line in lines[:12]),
+                usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+            )
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        sql = self.script.get(question, self.default_sql)
+        return AIMessage(
+            content="",
+            tool_calls=[{"name": "do_sql_query", "args": {"query": sql}, "id": f"call_{abs(hash(question)) % 10**8}"}],
+            usage_metadata={"input_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
@@ -0,0 +1,152 @@
+"""
+Fixture Olist pequena e determinística (mesmo seed = mesmos CSVs).
+
+Gera os CSVs com o layout do Kaggle e monta o banco DuckDB com o
+build_duckdb do setup_database.py (tabelas tipadas, rollups e versão).
+"""
+
+import csv
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+from uuid import UUID
+
+ROOT_DIR = Path(__file__).resolve().parents[2]
+FIXTURE_DIR = ROOT_DIR / "data" / "benchmark"
+
+STATES = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "DF", "GO", "ES"]
+CATEGORIES = [
+    ("beleza_saude", "health_beauty"),
+    ("informatica_acessorios", "computers_accessories"),
+    ("moveis_decoracao", "furniture_decor"),
+    ("esporte_lazer", "sports_leisure"),
+    ("cama_mesa_banho", "bed_bath_table"),
+    ("utilidades_domesticas", "housewares"),
+    ("relogios_presentes", "watches_gifts"),
+    ("telefonia", "telephony"),
+    ("brinquedos", "toys"),
+    ("pc_gamer", None),  # sem tradução, como no dataset original
+]
+PAYMENT_TYPES = ["credit_card", "boleto", "voucher", "debit_card"]
+STATUSES = ["delivered", "shipped", "canceled", "unavailable", "invoiced", "processing"]
+FIRST_PURCHASE = datetime(2016, 9, 1)
+LAST_PURCHASE = datetime(2018, 12, 31)
+
+HEADERS = {
+    "olist_customers_dataset": ["customer_id", "customer_unique_id", "customer_zip_code_prefix", "customer_city", "customer_state"],
+    "olist_sellers_dataset": ["seller_id", "seller_zip_code_prefix", "seller_city", "seller_state"],
+    "olist_products_dataset": [
+        "product_id", "product_category_name", "product_name_lenght", "product_description_lenght",
+        "product_photos_qty", "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm",
+    ],
+    "product_category_name_translation": ["product_category_name", "product_category_name_english"],
+    "olist_orders_dataset": [
+        "order_id", "customer_id", "order_status", "order_purchase_timestamp", "order_approved_at",
+        "order_delivered_carrier_date", "order_delivered_customer_date", "order_estimated_delivery_date",
+    ],
+    "olist_order_items_dataset": ["order_id", "order_item_id", "product_id", "seller_id", "shipping_limit_date", "price", "freight_value"],
+    "olist_order_payments_dataset": ["order_id", "payment_sequential", "payment_type", "payment_installments", "payment_value"],
+    "olist_order_reviews_dataset": [
+        "review_id", "order_id", "review_score", "review_comment_title", "review_comment_message",
+        "review_creation_date", "review_answer_timestamp",
+    ],
+    "olist_geolocation_dataset": ["geolocation_zip_code_prefix", "geolocation_lat", "geolocation_lng", "geolocation_city", "geolocation_state"],
+}
+
+
+def _timestamp(value: datetime | None) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def generate_rows(orders: int, seed: int) -> dict[str, list[tuple]]:
+    """Linhas de cada tabela (proporções próximas às do dataset real)."""
+    rng = random.Random(seed)
+    new_id = lambda: UUID(int=rng.getrandbits(128)).hex
+    span_minutes = int((LAST_PURCHASE - FIRST_PURCHASE).total_seconds() // 60)
+
+    customers = [
+        (new_id(), new_id(), f"{rng.randint(1000, 99999):05d}", f"cidade_{rng.randint(1, 200)}", rng.choice(STATES))
+        for _ in range(max(orders * 9 // 10, 1))
+    ]
+    sellers = [
+        (new_id(), f"{rng.randint(1000, 99999):05d}", f"cidade_{rng.randint(1, 50)}", rng.choice(STATES))
+        for _ in range(max(orders // 30, 5))
+    ]
+    products = [
+        (
+            new_id(), rng.choice(CATEGORIES)[0] if rng.random() > 0.02 else "",
+            rng.randint(20, 60), rng.randint(100, 2000), rng.randint(1, 6) if rng.random() > 0.02 else "",
+            rng.randint(100, 20000), rng.randint(10, 80), rng.randint(2, 60), rng.randint(10, 60),
+        )
+        for _ in range(max(orders // 3, 10))
+    ]
+
+    rows = {name: [] for name in HEADERS}
+    rows["olist_customers_dataset"] = customers
+    rows["olist_sellers_dataset"] = sellers
+    rows["olist_products_dataset"] = products
+    rows["product_category_name_translation"] = [c for c in CATEGORIES if c[1]]
+    rows["olist_geolocation_dataset"] = [
+        (c[2], round(rng.uniform(-33, -3), 6), round(rng.uniform(-60, -35), 6), c[3], c[4]) for c in customers
+    ]
+
+    for _ in range(orders):
+        order_id, customer = new_id(), rng.choice(customers)
+        purchase = FIRST_PURCHASE + timedelta(minutes=rng.randint(0, span_minutes))
+        status = rng.choices(STATUSES, [90, 4, 3, 1, 1, 1])[0]
+        estimated = purchase + timedelta(days=rng.randint(10, 45))
+        delivered = purchase + timedelta(days=rng.randint(2, 50), hours=rng.randint(0, 23)) if status == "delivered" else None
+        rows["olist_orders_dataset"].append((
+            order_id, customer[0], status, _timestamp(purchase), _timestamp(purchase + timedelta(hours=1)),
+            _timestamp(purchase + timedelta(days=2)) if delivered else "", _timestamp(delivered), _timestamp(estimated),
+        ))
+        if status != "unavailable":
+            for item in range(rng.choice([1, 1, 1, 1, 2, 3])):
+                rows["olist_order_items_dataset"].append((
+                    order_id, item + 1, rng.choice(products)[0], rng.choice(sellers)[0],
+                    _timestamp(purchase + timedelta(days=5)), f"{rng.uniform(5, 600):.2f}", f"{rng.uniform(5, 60):.2f}",
+                ))
+        for sequential in range(rng.choice([1, 1, 1, 2])):
+            rows["olist_order_payments_dataset"].append((
+                order_id, sequential + 1, rng.choices(PAYMENT_TYPES, [74, 19, 5, 2])[0],
+                rng.randint(1, 10), f"{rng.uniform(10, 700):.2f}",
+            ))
+        if rng.random() > 0.01:
+            created = (delivered or estimated) + timedelta(days=1)
+            rows["olist_order_reviews_dataset"].append((
+                new_id(), order_id, rng.choices([1, 2, 3, 4, 5], [11, 3, 8, 19, 59])[0], "",
+                "produto chegou no prazo" if rng.random() > 0.6 else "",
+                _timestamp(created), _timestamp(created + timedelta(days=1)),
+            ))
+    return rows
+
+
+def write_fixture_csvs(directory: Path, orders: int, seed: int) -> list[Path]:
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for name, rows in generate_rows(orders, seed).items():
+        path = directory / f"{name}.csv"
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS[name])
+            writer.writerows(rows)
+        paths.append(path)
+    return paths
+
+
+def build_fixture(orders: int = 5000, seed: int = 42, directory: Path = FIXTURE_DIR) -> Path:
+    """Caminho do banco DuckDB da fixture; gera CSVs e banco só se ainda não existem."""
+    target = directory / f"olist_{orders}_{seed}"
+    db_path = target / "olist.duckdb"
+    if db_path.exists():
+        return db_path
+
+    print(f"🧪 Gerando fixture ({orders:,} pedidos, seed {seed}) em {target}")
+    csv_files = write_fixture_csvs(target / "csv", orders, seed)
+    # setup_database.py fica na raiz do repositório
+    if str(ROOT_DIR) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR))
+    from setup_database import build_duckdb
+    build_duckdb(csv_files, db_path)
+    return db_path
@@ -0,0 +1,272 @@
+"""
+Benchmark offline por etapa: executa as perguntas do Questions.md pelo
+build_graph com o LLM roteirizado e o banco de fixture (DuckDB) e mede
+p50/p95 de montagem do prompt, passada do agente, execução do SQL,
+serialização do resultado e passada da narrativa.
+
+    python -m benchmarks.run --iterations 20 --out bench.json
+    python -m benchmarks.run --compare bench.json   # diff contra um baseline
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from langchain_core.messages import HumanMessage
+import graph.nodes as graph_nodes
+import tools.sql_tool as sql_tool
+from agents.cassette import Cassette, CassetteChatModel, LatencyModel
+from benchmarks.fake_llm import PassTimer, ScriptedChatModel
+from benchmarks.fixture import build_fixture
+from benchmarks.scenarios import scenarios
+from db.backends import DuckDBBackend
+from db.cost_guard import CostGuard
+from db.rollups import RollupRouter
+from graph.graph import build_graph
+from graph.state import ContextSchema
+
+STAGES = ["prompt_assembly", "agent_pass", "sql_execution", "result_serialization", "narrative_pass", "total"]
+
+
+class TimedCassetteChatModel(PassTimer, CassetteChatModel):
+    """Replay do cassete com o tempo de cada passada registrado."""
+    recorder: object = None
+
+
+class StageRecorder:
+    """Acumula o tempo (ms) de cada etapa por execução e guarda as amostras."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # etapa -> [ms]
+        self.by_question = defaultdict(lambda: defaultdict(list))
+        self.current = None
+        self.errors = []  # respostas da tool que não foram tabela
+
+    def start_run(self):
+        self.current = defaultdict(float)
+
+    def record(self, stage: str, start: float):
+        if self.current is not None:
+            self.current[stage] += (time.perf_counter() - start) * 1000
+
+    def finish_run(self, question: str):
+        for stage in STAGES:
+            value = self.current.get(stage, 0.0)
+            self.samples[stage].append(value)
+            self.by_question[question][stage].append(value)
+        self.current = None
+
+    def discard_run(self):
+        self.current = None
+
+
+class TimedDuckDBBackend(DuckDBBackend):
+    """DuckDBBackend que registra o tempo de execução + leitura do SQL."""
+
+    def __init__(self, path: str, recorder: StageRecorder):
+        super().__init__(path)
+        self.recorder = recorder
+
+    async def fetch(self, sql, max_rows=None, max_bytes=None, deadline=None):
+        start = time.perf_counter()
+        try:
+            return await super().fetch(sql, max_rows, max_bytes, deadline)
+        finally:
+            self.recorder.record("sql_execution", start)
+
+
+def _timed(recorder: StageRecorder, stage: str, func):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            recorder.record(stage, start)
+    return wrapper
+
+
+def instrument(recorder: StageRecorder):
+    """Envolve as funções de cada etapa (nomes resolvidos em tempo de chamada pelos módulos)."""
+    graph_nodes.assemble_messages = _timed(recorder, "prompt_assembly", graph_nodes.assemble_messages)
+    graph_nodes.prompt_report = _timed(recorder, "prompt_assembly", graph_nodes.prompt_report)
+    sql_tool.tool_response = _timed(recorder, "result_serialization", sql_tool.tool_response)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Percentil com interpolação linear."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "n": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "max_ms": round(max(values), 3) if values else 0.0,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmark(args) -> dict:
+    db_path = build_fixture(args.orders, args.seed)
+    recorder = StageRecorder()
+    instrument(recorder)
+
+    cases = scenarios()
+    if args.cassette:
+        # Respostas reais gravadas (prompts de produção), sem rede
+        model = TimedCassetteChatModel(
+            cassette=Cassette(str(args.cassette)),
+            mode="replay",
+            latency=LatencyModel(args.replay_latency, str(args.seed)),
+            model_name=args.model_name,
+            recorder=recorder,
+        )
+    else:
+        model = ScriptedChatModel(script=dict(cases), latency_ms=args.llm_latency_ms, recorder=recorder)
+    tool = sql_tool.build_sql_tool()
+    app_graph = build_graph(model.bind_tools([tool]), [tool], model)
+
+    backend = TimedDuckDBBackend(str(db_path), recorder)
+    router = None
+    if not args.no_rollups:
+        router = RollupRouter()
+        router.refresh(backend)
+    # Sem cache de resultados: toda iteração executa o SQL
+    context = ContextSchema(backend=backend, rollup_router=router, cost_guard=CostGuard())
+
+    async def ask(question: str):
+        await app_graph.ainvoke(
+            {"messages": [HumanMessage(content=question)]},
+            config={"recursion_limit": 50},
+            context=context,
+        )
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        for _ in range(args.warmup):
+            for question, _ in cases:
+                recorder.start_run()
+                await ask(question)
+                recorder.discard_run()
+
+        for _ in range(args.iterations):
+            for question, _ in cases:
+                recorder.start_run()
+                start = time.perf_counter()
+                await ask(question)
+                recorder.record("total", start)
+                recorder.finish_run(question)
+    backend.close()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "orders": args.orders,
+            "seed": args.seed,
+            "llm_latency_ms": args.llm_latency_ms,
+            "cassette": str(args.cassette) if args.cassette else None,
+            "replay_latency": args.replay_latency if args.cassette else None,
+            "rollups": router is not None,
+            "questions": len(cases),
+            "tool_errors": len(recorder.errors),
+        },
+        "stages": {stage: summarize(recorder.samples[stage]) for stage in STAGES},
+        "questions": {
+            question: {stage: summarize(values[stage]) for stage in STAGES}
+            for question, values in recorder.by_question.items()
+        },
+    }
+
+
+def print_report(result: dict):
+    print(f"\n⏱️  {result['meta']['questions']} perguntas x {result['meta']['iterations']} iterações")
+    print(f"{'etapa':<22}{'p50 ms':>10}{'p95 ms':>10}{'média ms':>10}")
+    for stage, summary in result["stages"].items():
+        print(f"{stage:<22}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['mean_ms']:>10.2f}")
+    if result["meta"]["tool_errors"]:
+        print(f"⚠️  {result['meta']['tool_errors']} respostas da tool com erro (use --verbose para ver)")
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """Imprime a diferença por etapa; devolve as etapas com p95 piorando além do limite (%)."""
+    regressions = []
+    print(f"\n🔍 Comparando com {baseline['meta'].get('commit') or 'baseline'}")
+    print(f"{'etapa':<22}{'p50 Δ%':>10}{'p95 Δ%':>10}")
+    for stage, summary in result["stages"].items():
+        old = baseline["stages"].get(stage)
+        if not old:
+            continue
+        deltas = [
+            (summary[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            for key in ("p50_ms", "p95_ms")
+        ]
+        flag = ""
+        if deltas[1] > threshold:
+            flag = "  ⚠️"
+            regressions.append(stage)
+        print(f"{stage:<22}{deltas[0]:>+10.1f}{deltas[1]:>+10.1f}{flag}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline por etapa do /api/ask")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--orders", type=int, default=5000, help="pedidos na fixture")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="latência simulada por chamada ao LLM")
+    parser.add_argument("--cassette", type=Path, help="reproduz respostas gravadas (LLM_CASSETTE_MODE=record) em vez do roteiro")
+    parser.add_argument("--replay-latency", default="recorded", help="latência do replay: recorded, fixed:<ms>, lognormal:<mediana>,<sigma>...")
+    parser.add_argument("--model-name", default="gpt-4o-mini", help="modelo usado na gravação (entra na impressão digital)")
+    parser.add_argument("--no-rollups", action="store_true", help="executa sem reescrita para rollups")
+    parser.add_argument("--out", type=Path, help="grava o resultado em JSON")
+    parser.add_argument("--compare", type=Path, help="JSON de um baseline para comparar")
+    parser.add_argument("--threshold", type=float, default=10.0, help="piora de p95 (%%) que conta como regressão")
+    parser.add_argument("--verbose", action="store_true", help="mantém os logs da aplicação")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+
+    if args.out:
+        args.out.write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n💾 Resultado gravado em {args.out}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if compare(result, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
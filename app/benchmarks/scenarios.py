@@ -0,0 +1,126 @@
+"""
+Perguntas do Questions.md e o SQL que o LLM falso devolve para cada uma.
+
+Os SQLs seguem os padrões ensinados no prompt (OLIST_QUERY_EXAMPLES):
+joins pelas chaves, filtro de período e agregação.
+"""
+
+import re
+from pathlib import Path
+
+QUESTIONS_FILE = Path(__file__).resolve().parents[2] / "Questions.md"
+
+# Na ordem do Questions.md
+SCRIPTED_SQL = [
+    # 1. Frete x nota da avaliação
+    """SELECT
+    CASE WHEN oi.freight_value < 15 THEN '<15' WHEN oi.freight_value < 30 THEN '15-30' ELSE '30+' END AS freight_band,
+    COUNT(DISTINCT o.order_id) AS orders,
+    AVG(oi.freight_value) AS avg_freight,
+    AVG(r.review_score) AS avg_review
+FROM olist_orders_dataset o
+JOIN olist_order_items_dataset oi ON o.order_id = oi.order_id
+JOIN olist_order_reviews_dataset r ON o.order_id = r.order_id
+WHERE o.order_status = 'delivered'
+GROUP BY freight_band
+ORDER BY avg_freight""",
+    # 2. Preço x volume em jan/fev 2018
+    """SELECT
+    CASE WHEN oi.price < 50 THEN '<50' WHEN oi.price < 150 THEN '50-150' WHEN oi.price < 300 THEN '150-300' ELSE '300+' END AS price_band,
+    COUNT(*) AS items_sold,
+    COUNT(DISTINCT oi.order_id) AS orders,
+    AVG(oi.price) AS avg_price
+FROM olist_order_items_dataset oi
+JOIN olist_orders_dataset o ON o.order_id = oi.order_id
+WHERE o.order_purchase_timestamp >= '2018-01-01' AND o.order_purchase_timestamp < '2018-03-01'
+GROUP BY price_band
+ORDER BY avg_price""",
+    # 3. UF com entrega mais lenta
+    """SELECT
+    c.customer_state,
+    COUNT(DISTINCT o.order_id) AS orders,
+    AVG(DATEDIFF(o.order_delivered_customer_date, o.order_purchase_timestamp)) AS avg_delivery_days,
+    AVG(DATEDIFF(o.order_delivered_customer_date, o.order_estimated_delivery_date)) AS avg_days_vs_estimate
+FROM olist_orders_dataset o
+JOIN olist_customers_dataset c ON o.customer_id = c.customer_id
+WHERE o.order_status = 'delivered'
+GROUP BY c.customer_state
+ORDER BY avg_delivery_days DESC
+LIMIT 10""",
+    # 4. Ticket médio por tipo de pagamento
+    """SELECT
+    payment_type,
+    COUNT(DISTINCT order_id) AS orders,
+    SUM(payment_value) AS total_value,
+    AVG(payment_value) AS avg_ticket,
+    AVG(payment_installments) AS avg_installments
+FROM olist_order_payments_dataset
+GROUP BY payment_type
+ORDER BY avg_ticket DESC""",
+    # 5. Cancelamentos em 2018
+    """SELECT
+    DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m') AS month,
+    COUNT(*) AS orders,
+    SUM(CASE WHEN o.order_status = 'canceled' THEN 1 ELSE 0 END) AS canceled,
+    AVG(CASE WHEN o.order_status = 'canceled' THEN 1 ELSE 0 END) * 100 AS canceled_pct
+FROM olist_orders_dataset o
+WHERE o.order_purchase_timestamp >= '2018-01-01' AND o.order_purchase_timestamp < '2019-01-01'
+GROUP BY month
+ORDER BY month""",
+    # 5b. Gasto médio por UF no último trimestre de 2018
+    """SELECT
+    c.customer_state,
+    COUNT(DISTINCT c.customer_unique_id) AS customers,
+    SUM(oi.price + oi.freight_value) AS gmv,
+    SUM(oi.price + oi.freight_value) / COUNT(DISTINCT c.customer_unique_id) AS avg_spend
+FROM olist_orders_dataset o
+JOIN olist_customers_dataset c ON o.customer_id = c.customer_id
+JOIN olist_order_items_dataset oi ON o.order_id = oi.order_id
+WHERE o.order_purchase_timestamp >= '2018-10-01' AND o.order_purchase_timestamp < '2019-01-01'
+GROUP BY c.customer_state
+ORDER BY avg_spend DESC""",
+    # 6. Categorias com maior receita em nov/dez 2018 e fotos por anúncio
+    """SELECT
+    t.product_category_name_english,
+    SUM(oi.price + oi.freight_value) AS gmv,
+    COUNT(DISTINCT oi.order_id) AS orders,
+    AVG(p.product_photos_qty) AS avg_photos
+FROM olist_order_items_dataset oi
+JOIN olist_orders_dataset o ON o.order_id = oi.order_id
+JOIN olist_products_dataset p ON oi.product_id = p.product_id
+LEFT JOIN product_category_name_translation t ON p.product_category_name = t.product_category_name
+WHERE o.order_purchase_timestamp >= '2018-11-01' AND o.order_purchase_timestamp < '2019-01-01'
+GROUP BY t.product_category_name_english
+ORDER BY gmv DESC
+LIMIT 15""",
+]
+
+# Cenários extras fora do Questions.md
+EXTRA_SCENARIOS = [
+    # Padrão "Monthly GMV Trend" (elegível para os rollups)
+    ("How did monthly GMV evolve over time?", """SELECT
+    DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m') AS month,
+    COUNT(DISTINCT o.order_id) AS orders,
+    SUM(oi.price + oi.freight_value) AS gmv
+FROM olist_orders_dataset o
+JOIN olist_order_items_dataset oi ON o.order_id = oi.order_id
+GROUP BY month
+ORDER BY month"""),
+]
+
+
+def load_questions(path: Path = QUESTIONS_FILE) -> list[str]:
+    """Perguntas do Questions.md (texto após cada '### Question N')."""
+    text = path.read_text(encoding="utf-8") if path.exists() else ""
+    blocks = re.split(r"^###\s+Question\s+\d+\s*$", text, flags=re.MULTILINE)[1:]
+    return [" ".join(block.split()) for block in blocks if block.strip()]
+
+
+def scenarios() -> list[tuple[str, str]]:
+    """(pergunta, SQL roteirizado); perguntas sem SQL roteirizado usam a primeira consulta."""
+    questions = load_questions()
+    scripted = [
+        (question, SCRIPTED_SQL[i] if i < len(SCRIPTED_SQL) else SCRIPTED_SQL[0])
+        for i, question in enumerate(questions)
+    ]
+    return scripted + EXTRA_SCENARIOS
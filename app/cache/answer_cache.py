@@ -0,0 +1,336 @@
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2048))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.8))
+ANSWER_CACHE_CONTEXT_MESSAGES = int(os.getenv("ANSWER_CACHE_CONTEXT_MESSAGES", 2))
+
+# MinHash: 64 permutações em 16 bandas de 4 linhas (LSH).
+# Com limiar 0.8 a probabilidade de um par virar candidato é ~0.99.
+NUM_PERM = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+STOPWORDS = {
+    # pt-BR
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "no", "na", "nos", "nas",
+    "um", "uma", "por", "para", "que", "qual", "quais", "se", "ha", "existe", "algum",
+    # en
+    "the", "an", "of", "in", "on", "by", "for", "to", "and", "is", "are", "there", "any",
+    "what", "which", "does", "do", "me", "show", "per",
+}
+
+# Tokens que mudam o significado da pergunta: precisam bater exatamente
+# (ex.: "GMV em 2017" x "GMV em 2018" é quase idêntico em shingles)
+MONTHS = {
+    "janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto",
+    "setembro", "outubro", "novembro", "dezembro",
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+}
+UF_CODES = {
+    "ac", "al", "ap", "am", "ba", "ce", "df", "es", "go", "ma", "mt", "ms", "mg", "pa",
+    "pb", "pr", "pe", "pi", "rj", "rn", "rs", "ro", "rr", "sc", "sp", "se", "to",
+}
+
+
+# Polaridade e comparação: "com atraso" x "sem atraso", "maior" x "menor"...
+# diferem em um token só e passariam no limiar de similaridade.
+# Formas já normalizadas (sem acento); nenhuma pode estar em STOPWORDS.
+POLARITY = {
+    "com", "sem", "nao", "nunca",
+    "maior", "maiores", "menor", "menores",
+    "melhor", "melhores", "pior", "piores",
+    "mais", "menos",
+    "primeiro", "primeiros", "primeira", "primeiras",
+    "ultimo", "ultimos", "ultima", "ultimas",
+    "crescente", "decrescente", "antes", "depois",
+    "with", "without", "not", "never",
+    "higher", "highest", "lower", "lowest", "best", "worst",
+    "more", "most", "less", "least", "fewer", "fewest",
+    "first", "last", "ascending", "descending", "before", "after",
+}
+
+
+# Métricas e dimensões: "receita total por categoria em SP" x "frete total por
+# categoria em SP" diferem numa palavra e passariam no limiar. Cada termo vira
+# o conceito canônico (plural/sinônimo/inglês ainda casam entre si).
+_GUARD_CONCEPTS = {
+    # métricas
+    "receita": ("receita", "receitas", "faturamento", "revenue"),
+    "vendas": ("venda", "vendas", "vendido", "vendidos", "sales"),
+    "gmv": ("gmv",),
+    "frete": ("frete", "fretes", "freight", "shipping"),
+    "ticket": ("ticket",),
+    "preco": ("preco", "precos", "price", "prices"),
+    "valor": ("valor", "valores", "value"),
+    "pagamento": ("pagamento", "pagamentos", "parcela", "parcelas", "payment", "payments", "installments"),
+    "avaliacao": ("avaliacao", "avaliacoes", "nota", "notas", "review", "reviews", "rating", "score"),
+    "atraso": ("atraso", "atrasos", "atrasado", "atrasados", "late", "delay"),
+    "cancelamento": ("cancelado", "cancelados", "cancelamento", "cancelamentos", "canceled", "cancelled"),
+    "entrega": ("entrega", "entregas", "entregue", "entregues", "delivery", "delivered"),
+    # agregações
+    "total": ("total", "soma", "sum"),
+    "media": ("media", "medio", "medias", "medios", "average", "avg", "mean"),
+    "mediana": ("mediana", "median"),
+    "quantidade": ("quantidade", "numero", "contagem", "count", "number"),
+    "taxa": ("taxa", "percentual", "porcentagem", "proporcao", "rate", "percentage", "share"),
+    # entidades e dimensões
+    "pedido": ("pedido", "pedidos", "compra", "compras", "order", "orders"),
+    "item": ("item", "itens", "items"),
+    "cliente": ("cliente", "clientes", "comprador", "compradores", "customer", "customers"),
+    "vendedor": ("vendedor", "vendedores", "lojista", "lojistas", "seller", "sellers"),
+    "produto": ("produto", "produtos", "product", "products"),
+    "categoria": ("categoria", "categorias", "category", "categories"),
+    "estado": ("estado", "estados", "uf", "ufs", "state", "states"),
+    "cidade": ("cidade", "cidades", "city", "cities"),
+    "regiao": ("regiao", "regioes", "region", "regions"),
+    "dia": ("dia", "dias", "diario", "day", "days", "daily"),
+    "semana": ("semana", "semanas", "semanal", "week", "weekly"),
+    "mes": ("mes", "meses", "mensal", "month", "monthly"),
+    "trimestre": ("trimestre", "trimestres", "quarter", "quarterly"),
+    "ano": ("ano", "anos", "anual", "year", "yearly"),
+}
+GUARD_TERMS = {term: concept for concept, terms in _GUARD_CONCEPTS.items() for term in terms}
+
+
+def normalize_question(question: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação, espaços colapsados."""
+    text = unicodedata.normalize("NFKD", question.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def question_tokens(normalized: str) -> list[str]:
+    return [t for t in normalized.split() if t not in STOPWORDS]
+
+
+def guard_tokens(tokens: list[str]) -> frozenset:
+    guards = set()
+    for t in tokens:
+        if t.isdigit() or t in MONTHS or t in UF_CODES or t in POLARITY:
+            guards.add(t)
+        elif t in GUARD_TERMS:
+            guards.add(GUARD_TERMS[t])
+    return frozenset(guards)
+
+
+def shingles(tokens: list[str]) -> set[str]:
+    """Unigramas + bigramas de palavras."""
+    grams = set(tokens)
+    grams.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return grams
+
+
+def minhash(grams: set[str]) -> tuple[int, ...]:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big")
+        for g in grams
+    ] or [0]
+    return tuple(
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def estimated_jaccard(sig_a: tuple[int, ...], sig_b: tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def context_key(messages: list[dict], limit: int = ANSWER_CACHE_CONTEXT_MESSAGES) -> str:
+    """Hash das últimas `limit` mensagens do chat (contexto limitado)."""
+    if limit <= 0 or not messages:
+        return ""
+    digest = hashlib.sha256()
+    for msg in messages[-limit:]:
+        digest.update(msg["role"].encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(normalize_question(msg["content"]).encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()[:16]
+
+
+@dataclass
+class _Entry:
+    answer: str
+    expires_at: float
+    bucket: tuple
+    normalized: str
+    guards: frozenset
+    signature: tuple
+    bands: list = field(default_factory=list)
+
+
+class AnswerCache:
+    """Cache de respostas por pergunta normalizada + idioma + contexto do chat.
+
+    Busca exata pelo texto normalizado; se não achar, busca quase-duplicatas
+    via MinHash/LSH (local, sem serviço de embeddings). Cada entrada tem TTL.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: int = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_THRESHOLD
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (bucket, normalized) -> _Entry
+        self._lsh = {}  # (bucket, band_idx, band_hash) -> set de chaves
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, question: str, language: str, context: str = "", version: str | None = None) -> str | None:
+        bucket = (version, language, context)
+        normalized = normalize_question(question)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get((bucket, normalized))
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end((bucket, normalized))
+                    self.hits += 1
+                    return entry.answer
+                self._remove((bucket, normalized))
+                self.expired += 1
+
+        tokens = question_tokens(normalized)
+        if not tokens:
+            with self._lock:
+                self.misses += 1
+            return None
+        guards = guard_tokens(tokens)
+        signature = minhash(shingles(tokens))
+
+        with self._lock:
+            best_key, best_score = None, 0.0
+            for key in self._candidates(bucket, signature):
+                entry = self._entries.get(key)
+                if entry is None or entry.guards != guards:
+                    continue
+                if entry.expires_at <= now:
+                    self._remove(key)
+                    self.expired += 1
+                    continue
+                score = estimated_jaccard(signature, entry.signature)
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is not None and best_score >= self.threshold:
+                self._entries.move_to_end(best_key)
+                self.near_hits += 1
+                return self._entries[best_key].answer
+
+            self.misses += 1
+            return None
+
+    def put(
+        self,
+        question: str,
+        language: str,
+        answer: str,
+        context: str = "",
+        version: str | None = None,
+        ttl: int | None = None
+    ):
+        bucket = (version, language, context)
+        normalized = normalize_question(question)
+        tokens = question_tokens(normalized)
+        signature = minhash(shingles(tokens))
+        entry = _Entry(
+            answer=answer,
+            expires_at=time.monotonic() + (self.ttl if ttl is None else ttl),
+            bucket=bucket,
+            normalized=normalized,
+            guards=guard_tokens(tokens),
+            signature=signature,
+            bands=self._bands(signature),
+        )
+        key = (bucket, normalized)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for band in entry.bands:
+                self._lsh.setdefault((bucket, *band), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lsh.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "hit_ratio": round((self.hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _bands(signature: tuple) -> list[tuple[int, int]]:
+        return [
+            (i, hash(signature[i * LSH_ROWS:(i + 1) * LSH_ROWS]))
+            for i in range(LSH_BANDS)
+        ]
+
+    def _candidates(self, bucket: tuple, signature: tuple) -> set:
+        keys = set()
+        for band in self._bands(signature):
+            keys.update(self._lsh.get((bucket, *band), ()))
+        return keys
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in entry.bands:
+            lsh_key = (entry.bucket, *band)
+            members = self._lsh.get(lsh_key)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del self._lsh[lsh_key]
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Cache de respostas compartilhado pelo processo."""
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+import sqlglot
+from sqlglot.errors import SqlglotError
+
+# Tabela escrita pelo setup_database.py a cada (re)importação dos CSVs
+DATASET_VERSION_TABLE = "copilot_dataset_version"
+
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", 512))
+SQL_CACHE_MAX_BYTES = int(os.getenv("SQL_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+SQL_CACHE_DIR = os.getenv("SQL_CACHE_DIR")  # vazio = sem camada em disco
+DATASET_VERSION_TTL = int(os.getenv("DATASET_VERSION_TTL", 60))
+
+
+def canonicalize_sql(sql: str) -> str:
+    """Forma canônica do SQL para chave de cache.
+
+    Reescreve a partir da AST (dialeto MySQL): espaços, comentários, caixa de
+    palavras-chave/identificadores e aspas de literais ficam normalizados.
+    Se o parse falhar, cai para normalização de espaços.
+    """
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read="mysql") if e is not None]
+        if len(expressions) == 1:
+            return expressions[0].sql(dialect="mysql", normalize=True, comments=False)
+    except SqlglotError:
+        pass
+    return " ".join(sql.split())
+
+
+def read_dataset_version(backend) -> str | None:
+    """Lê o carimbo de versão do dataset (None se a tabela não existir)."""
+    try:
+        rows = backend.fetch_sync(
+            f"SELECT version FROM {DATASET_VERSION_TABLE} ORDER BY imported_at DESC LIMIT 1"
+        ).rows
+        return rows[0]["version"] if rows else None
+    except Exception:
+        return None
+
+
+class SqlResultCache:
+    """Cache de resultados do SQL: LRU em memória + camada opcional em disco.
+
+    As chaves combinam a versão do dataset com o SQL canônico, então uma
+    reimportação (nova versão) invalida tudo de uma vez.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = SQL_CACHE_MAX_ENTRIES,
+        max_bytes: int = SQL_CACHE_MAX_BYTES,
+        disk_dir: str | None = SQL_CACHE_DIR,
+        version_ttl: int = DATASET_VERSION_TTL
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.version_ttl = version_ttl
+        self.version = None
+        self._version_checked_at = 0.0
+        self._entries = OrderedDict()  # key -> (payload, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    # --- versão do dataset ---
+
+    def version_is_stale(self) -> bool:
+        return time.monotonic() - self._version_checked_at > self.version_ttl
+
+    def set_version(self, version: str | None):
+        """Atualiza a versão; se mudou, descarta todas as entradas."""
+        with self._lock:
+            self._version_checked_at = time.monotonic()
+            if version == self.version:
+                return
+            self.version = version
+            self._entries.clear()
+            self._bytes = 0
+        if self.disk_dir:
+            self._purge_disk(keep_version=version)
+
+    def refresh_version(self, backend):
+        """Relê a versão no banco (bloqueante; chamar via run_blocking)."""
+        self.set_version(read_dataset_version(backend))
+
+    # --- chaves ---
+
+    def key_for(self, sql: str) -> str:
+        canonical = canonicalize_sql(sql)
+        digest = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return f"{self.version or 'unversioned'}-{digest}"
+
+    # --- leitura/escrita (bloqueantes quando há disco) ---
+
+    def get(self, sql: str):
+        key = self.key_for(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.disk_dir:
+            payload = self._read_disk(key)
+            if payload is not None:
+                self._store(key, payload)
+                with self._lock:
+                    self.disk_hits += 1
+                return payload
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, sql: str, rows):
+        key = self.key_for(sql)
+        self._store(key, rows)
+        if self.disk_dir:
+            self._write_disk(key, rows)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _store(self, key: str, rows):
+        size = len(pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (rows, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    # --- camada em disco ---
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.pkl"
+
+    def _read_disk(self, key: str):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def _write_disk(self, key: str, rows):
+        path = self._disk_path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _purge_disk(self, keep_version: str | None):
+        prefix = f"{keep_version or 'unversioned'}-"
+        for path in self.disk_dir.glob("*.pkl"):
+            if not path.name.startswith(prefix):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+_sql_cache = None
+_sql_cache_lock = threading.Lock()
+
+
+def get_sql_cache() -> SqlResultCache:
+    """Cache de resultados compartilhado pelo processo."""
+    global _sql_cache
+    if _sql_cache is None:
+        with _sql_cache_lock:
+            if _sql_cache is None:
+                _sql_cache = SqlResultCache()
+    return _sql_cache
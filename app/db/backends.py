@@ -0,0 +1,308 @@
+"""
+Backends de execução do SQL da tool.
+
+- MySQLBackend: engines SQLAlchemy (aiomysql quando disponível, senão
+  pymysql no pool de threads).
+- DuckDBBackend: banco embarcado (colunar) gerado pelo setup_database.py a
+  partir dos mesmos CSVs. O SQL chega no dialeto MySQL (é o que o prompt
+  ensina) e é traduzido para DuckDB via sqlglot.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlalchemy import inspect, text
+from db.cost_guard import CostEstimate, duckdb_plan_estimate, mysql_plan_estimate
+from db.executor import run_blocking
+from db.sql_guard import with_max_execution_time
+from observability.log import get_logger
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+# mysql (padrão) | duckdb
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+DUCKDB_PATH = os.getenv("DUCKDB_PATH") or str(Path(__file__).resolve().parents[2] / "data" / "olist.duckdb")
+
+
+# Linhas pedidas ao driver por vez ao iterar um cursor de streaming
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", 500))
+
+logger = get_logger(__name__)
+
+
+class BackendError(Exception):
+    """Erro de execução do SQL em um backend que não é SQLAlchemy."""
+
+
+@dataclass
+class FetchResult:
+    """Linhas lidas e, se algum orçamento estourou, os dados do corte."""
+    rows: list[dict]
+    truncated: bool = False
+    reason: str | None = None  # "rows" | "bytes"
+    rows_seen: int = 0
+    bytes_seen: int = 0
+    estimated_total: int | None = None
+
+    def metadata(self) -> dict:
+        return {
+            "truncated": self.truncated,
+            "reason": self.reason,
+            "rows_returned": len(self.rows),
+            "rows_seen": self.rows_seen,
+            "estimated_total": self.estimated_total,
+        }
+
+
+def row_size(row: dict) -> int:
+    """Tamanho aproximado da linha como texto (o que chega ao LLM)."""
+    return sum(len(str(key)) + len(str(value)) + 4 for key, value in row.items())
+
+
+class _Collector:
+    """Acumula linhas até o orçamento de linhas/bytes; avisa quando parar."""
+
+    def __init__(self, max_rows: int | None, max_bytes: int | None):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = []
+        self.bytes = 0
+        self.seen = 0
+        self.reason = None
+
+    def add(self, row: dict) -> bool:
+        self.seen += 1
+        if self.max_rows is not None and len(self.rows) >= self.max_rows:
+            self.reason = "rows"
+            return False
+        size = row_size(row)
+        if self.max_bytes is not None and self.bytes + size > self.max_bytes:
+            self.reason = "bytes"
+            return False
+        self.rows.append(row)
+        self.bytes += size
+        return True
+
+    def result(self) -> FetchResult:
+        return FetchResult(
+            rows=self.rows,
+            truncated=self.reason is not None,
+            reason=self.reason,
+            rows_seen=self.seen,
+            bytes_seen=self.bytes,
+        )
+
+
+class SqlBackend:
+    """Interface comum: traduz e executa SQL (dialeto MySQL) devolvendo linhas como dicts.
+
+    `max_rows`/`max_bytes` limitam o que é lido: ao estourar, a leitura para,
+    o restante da consulta é cancelado e o FetchResult vem com truncated=True.
+    Com `deadline` (graph/deadline.py), cancelar a requisição interrompe a
+    consulta no servidor.
+    """
+
+    name = "base"
+
+    def translate(self, sql: str) -> str:
+        return sql
+
+    def fetch_sync(self, sql: str, max_rows: int | None = None, max_bytes: int | None = None, deadline=None) -> FetchResult:
+        """Execução bloqueante; chamar via run_blocking."""
+        raise NotImplementedError
+
+    async def fetch(self, sql: str, max_rows: int | None = None, max_bytes: int | None = None, deadline=None) -> FetchResult:
+        return await run_blocking(self.fetch_sync, sql, max_rows, max_bytes, deadline)
+
+    def table_names(self) -> set[str]:
+        raise NotImplementedError
+
+    def explain(self, sql: str) -> CostEstimate | None:
+        """Estimativa do planner (bloqueante); None se o backend não oferece."""
+        return None
+
+    def with_time_limit(self, sql: str, milliseconds: int) -> str:
+        """SQL com limite de tempo de execução, quando o backend suporta."""
+        return sql
+
+
+class MySQLBackend(SqlBackend):
+    name = "mysql"
+
+    def __init__(self, engine, async_engine=None):
+        self.engine = engine
+        self.async_engine = async_engine
+
+    def kill_query(self, thread_id: int):
+        """KILL QUERY na conexão que está executando (por outra conexão do pool)."""
+        with self.engine.connect() as conn:
+            conn.execute(text(f"KILL QUERY {int(thread_id)}"))
+        logger.info("kill query", extra={"thread_id": thread_id})
+
+    def _on_cancel_kill(self, driver_connection, deadline):
+        """Registra o KILL QUERY da conexão no deadline; devolve o 'desregistrar'."""
+        thread_id = getattr(driver_connection, "thread_id", None)
+        if deadline is None or thread_id is None:
+            return lambda: None
+        thread_id = thread_id()
+        return deadline.on_cancel(lambda: self.kill_query(thread_id))
+
+    def fetch_sync(self, sql: str, max_rows: int | None = None, max_bytes: int | None = None, deadline=None) -> FetchResult:
+        collector = _Collector(max_rows, max_bytes)
+        with self.engine.connect() as conn:
+            unregister = self._on_cancel_kill(conn.connection.driver_connection, deadline)
+            try:
+                # Cursor no servidor (SSCursor): as linhas chegam sob demanda
+                result = conn.execution_options(
+                    stream_results=True, max_row_buffer=STREAM_BATCH_ROWS
+                ).execute(text(sql))
+                for row in result.mappings():
+                    if deadline is not None and deadline.cancelled:
+                        # Descarta a conexão em vez de drenar o resto do resultado
+                        conn.invalidate()
+                        deadline.check()  # RequestCancelled(motivo)
+                    if not collector.add(dict(row)):
+                        conn.invalidate()
+                        break
+            finally:
+                unregister()
+        return collector.result()
+
+    async def fetch(self, sql: str, max_rows: int | None = None, max_bytes: int | None = None, deadline=None) -> FetchResult:
+        if self.async_engine is None:
+            # Fallback: driver síncrono no pool de threads limitado
+            return await run_blocking(self.fetch_sync, sql, max_rows, max_bytes, deadline)
+        collector = _Collector(max_rows, max_bytes)
+        async with self.async_engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            unregister = self._on_cancel_kill(raw.driver_connection, deadline)
+            try:
+                result = await conn.stream(text(sql))
+                async for row in result.mappings():
+                    if deadline is not None and deadline.cancelled:
+                        await conn.invalidate()
+                        deadline.check()  # RequestCancelled(motivo)
+                    if not collector.add(dict(row)):
+                        await conn.invalidate()
+                        break
+            finally:
+                unregister()
+        return collector.result()
+
+    def table_names(self) -> set[str]:
+        return set(inspect(self.engine).get_table_names())
+
+    def explain(self, sql: str) -> CostEstimate | None:
+        with self.engine.connect() as conn:
+            plan = conn.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar()
+        return mysql_plan_estimate(plan) if plan else None
+
+    def with_time_limit(self, sql: str, milliseconds: int) -> str:
+        # O servidor interrompe o SELECT (erro 3024) ao passar do tempo
+        return with_max_execution_time(sql, milliseconds)
+
+
+def _dayofweek_mysql(node):
+    # MySQL: 1 = domingo; DuckDB: 0 = domingo
+    if isinstance(node, exp.DayOfWeek):
+        return exp.Paren(this=exp.Add(this=node.copy(), expression=exp.Literal.number(1)))
+    return node
+
+
+@lru_cache(maxsize=1024)
+def mysql_to_duckdb(sql: str) -> str:
+    """Shim de dialeto: DATE_FORMAT, DATEDIFF, DATE_SUB, IF, etc. via sqlglot.
+
+    Se o parse falhar, devolve o SQL original (o erro aparece na execução).
+    """
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read="mysql") if e is not None]
+    except SqlglotError:
+        return sql
+    if len(expressions) != 1:
+        return sql
+    tree = expressions[0].transform(_dayofweek_mysql)
+    return tree.sql(dialect="duckdb")
+
+
+class DuckDBBackend(SqlBackend):
+    name = "duckdb"
+
+    def __init__(self, path: str = DUCKDB_PATH):
+        if not HAS_DUCKDB:
+            raise RuntimeError("DB_BACKEND=duckdb requer o pacote 'duckdb'")
+        if not Path(path).exists():
+            raise FileNotFoundError(f"Banco DuckDB não encontrado: {path} (rode setup_database.py com DB_BACKEND=duckdb)")
+        self.path = path
+        # Somente leitura: várias threads usam cursores da mesma conexão
+        self._conn = duckdb.connect(path, read_only=True)
+
+    def translate(self, sql: str) -> str:
+        return mysql_to_duckdb(sql)
+
+    def fetch_sync(self, sql: str, max_rows: int | None = None, max_bytes: int | None = None, deadline=None) -> FetchResult:
+        collector = _Collector(max_rows, max_bytes)
+        cursor = self._conn.cursor()
+        unregister = deadline.on_cancel(cursor.interrupt) if deadline is not None else (lambda: None)
+        try:
+            cursor.execute(self.translate(sql))
+            columns = [d[0] for d in cursor.description]
+            while True:
+                batch = cursor.fetchmany(STREAM_BATCH_ROWS)
+                if not batch:
+                    break
+                if not all(collector.add(dict(zip(columns, values))) for values in batch):
+                    break  # fechar o cursor interrompe o resto da consulta
+            return collector.result()
+        except duckdb.Error as e:
+            raise BackendError(str(e)) from e
+        finally:
+            unregister()
+            cursor.close()
+
+    def explain(self, sql: str) -> CostEstimate | None:
+        cursor = self._conn.cursor()
+        try:
+            rows = cursor.execute(f"EXPLAIN (FORMAT JSON) {self.translate(sql)}").fetchall()
+        except duckdb.Error as e:
+            raise BackendError(str(e)) from e
+        finally:
+            cursor.close()
+        return duckdb_plan_estimate(rows[0][1]) if rows else None
+
+    def table_names(self) -> set[str]:
+        return {row["table_name"] for row in self.fetch_sync("SELECT table_name FROM information_schema.tables").rows}
+
+    def close(self):
+        self._conn.close()
+
+
+_duckdb_backend = None
+_duckdb_lock = threading.Lock()
+
+
+def get_duckdb_backend(path: str = DUCKDB_PATH) -> DuckDBBackend:
+    """Backend DuckDB compartilhado pelo processo (abre o arquivo uma vez)."""
+    global _duckdb_backend
+    if _duckdb_backend is None:
+        with _duckdb_lock:
+            if _duckdb_backend is None:
+                _duckdb_backend = DuckDBBackend(path)
+    return _duckdb_backend
+
+
+def close_duckdb_backend():
+    global _duckdb_backend
+    with _duckdb_lock:
+        if _duckdb_backend is not None:
+            _duckdb_backend.close()
+            _duckdb_backend = None
@@ -0,0 +1,481 @@
+"""
+Histórico de chats: interface assíncrona e duas implementações.
+
+- InMemoryChatStore: LRU por última atividade + TTL de inatividade, com teto
+  de chats e orçamento de memória (tamanho aproximado das mensagens).
+- SqliteChatStore: persistente, em SQLite no modo WAL; vários workers do
+  uvicorn podem apontar para o mesmo arquivo.
+
+A listagem é paginada por cursor sobre um índice de recência (última
+atividade), então cada página custa O(página) seja qual for o total de chats.
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+from db.executor import run_blocking
+from observability.log import get_logger
+
+CHAT_STORE = os.getenv("CHAT_STORE", "memory").lower()  # memory | sqlite
+CHAT_STORE_PATH = os.getenv("CHAT_STORE_PATH") or str(Path(__file__).resolve().parents[2] / "data" / "chats.sqlite3")
+CHAT_STORE_MAX_CHATS = int(os.getenv("CHAT_STORE_MAX_CHATS", 10_000))
+CHAT_STORE_MAX_BYTES = int(os.getenv("CHAT_STORE_MAX_BYTES", 64 * 1024 * 1024))
+CHAT_STORE_TTL = int(os.getenv("CHAT_STORE_TTL", 7 * 24 * 3600))  # inatividade; 0 = sem expiração
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", 20))
+CHAT_PAGE_MAX = 100
+
+logger = get_logger(__name__)
+
+# Custo fixo aproximado de um dict de mensagem além do texto
+_MESSAGE_OVERHEAD = 200
+
+
+class InvalidCursor(ValueError):
+    """Cursor de paginação malformado."""
+
+
+def encode_cursor(*parts) -> str:
+    raw = "|".join(str(p) for p in parts)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, count: int) -> list[str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor(f"Cursor inválido: {cursor}") from e
+    if len(parts) != count:
+        raise InvalidCursor(f"Cursor inválido: {cursor}")
+    return parts
+
+
+def page_limit(limit: int | None) -> int:
+    return max(1, min(limit or CHAT_PAGE_SIZE, CHAT_PAGE_MAX))
+
+
+def _summary(chat_id: str, chat: dict) -> dict:
+    messages = chat["messages"]
+    return {
+        "chat_id": chat_id,
+        "created_at": chat["created_at"],
+        "updated_at": chat["updated_at"],
+        "message_count": len(messages),
+        "last_message": messages[-1]["content"] if messages else None,
+    }
+
+
+def _message_size(message: dict) -> int:
+    return len(message.get("content") or "") + len(message.get("sql") or "") + _MESSAGE_OVERHEAD
+
+
+class ChatStore:
+    """Interface do histórico de chats.
+
+    A interface é async para que implementações com I/O (banco, arquivo)
+    possam substituir a em memória sem mudar os endpoints.
+    """
+
+    async def get(self, chat_id: str) -> dict | None:
+        """{"created_at", "updated_at", "messages", "summary"} ou None se não existe (ou expirou)."""
+        raise NotImplementedError
+
+    async def create(self) -> str:
+        raise NotImplementedError
+
+    async def get_or_create(self, chat_id: str | None = None) -> str:
+        """Retorna chat_id existente ou cria um novo."""
+        if chat_id and await self.get(chat_id) is not None:
+            return chat_id
+        return await self.create()
+
+    async def append_messages(self, chat_id: str, messages: list[dict]):
+        """Mensagens {"role", "content", "timestamp"} e, nas respostas, "sql" opcional."""
+        raise NotImplementedError
+
+    async def set_summary(self, chat_id: str, summary: dict):
+        """Guarda o resumo corrido do histórico (graph/history.py)."""
+        raise NotImplementedError
+
+    async def list(self, limit: int | None = None, cursor: str | None = None) -> tuple[list[dict], str | None]:
+        """Página de chats do mais recente para o mais antigo e o cursor da próxima (None no fim)."""
+        raise NotImplementedError
+
+    async def delete(self, chat_id: str) -> bool:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class InMemoryChatStore(ChatStore):
+    """Chats em memória do processo, limitados por quantidade, bytes e inatividade."""
+
+    def __init__(self, max_chats: int = CHAT_STORE_MAX_CHATS, max_bytes: int = CHAT_STORE_MAX_BYTES, ttl: int = CHAT_STORE_TTL):
+        self.max_chats = max_chats
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._chats = OrderedDict()  # chat_id -> chat; ordem = última atividade (LRU no início)
+        self._sizes = {}
+        self._bytes = 0
+        # Índice de recência: (seq, chat_id) em ordem crescente de atividade. Cada
+        # atividade acrescenta uma entrada nova; as antigas ficam obsoletas e são
+        # puladas na leitura e removidas na compactação.
+        self._seq = 0
+        self._chat_seq = {}
+        self._recency = []
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def _expired(self, chat: dict) -> bool:
+        return bool(self.ttl) and time.time() - chat["touched"] > self.ttl
+
+    def _touch(self, chat_id: str, chat: dict):
+        chat["touched"] = time.time()
+        chat["updated_at"] = datetime.now().isoformat()
+        self._chats.move_to_end(chat_id)
+        self._seq += 1
+        self._chat_seq[chat_id] = self._seq
+        self._recency.append((self._seq, chat_id))
+        if len(self._recency) > 2 * len(self._chat_seq) + 64:
+            self._recency = [(seq, cid) for seq, cid in self._recency if self._chat_seq.get(cid) == seq]
+
+    def _remove(self, chat_id: str):
+        self._chats.pop(chat_id, None)
+        self._chat_seq.pop(chat_id, None)
+        self._bytes -= self._sizes.pop(chat_id, 0)
+
+    def _evict(self, keep: str | None = None):
+        # Inativos primeiro (estão no início), depois LRU até caber nos limites
+        while self._chats:
+            chat_id, chat = next(iter(self._chats.items()))
+            if chat_id == keep:
+                break
+            if self._expired(chat):
+                self.expired += 1
+            elif len(self._chats) > self.max_chats or self._bytes > self.max_bytes:
+                self.evicted += 1
+            else:
+                break
+            self._remove(chat_id)
+
+    async def get(self, chat_id: str) -> dict | None:
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                return None
+            if self._expired(chat):
+                self.expired += 1
+                self._remove(chat_id)
+                return None
+            return {
+                "created_at": chat["created_at"],
+                "updated_at": chat["updated_at"],
+                "messages": list(chat["messages"]),
+                "summary": chat.get("summary"),
+            }
+
+    async def create(self) -> str:
+        chat_id = str(uuid4())
+        with self._lock:
+            self._chats[chat_id] = {"created_at": datetime.now().isoformat(), "messages": []}
+            self._sizes[chat_id] = _MESSAGE_OVERHEAD
+            self._bytes += _MESSAGE_OVERHEAD
+            self._touch(chat_id, self._chats[chat_id])
+            self._evict(keep=chat_id)
+        return chat_id
+
+    async def append_messages(self, chat_id: str, messages: list[dict]):
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                # Expirou/foi despejado durante a requisição: recria com o mesmo id
+                chat = self._chats[chat_id] = {"created_at": datetime.now().isoformat(), "messages": []}
+                self._sizes[chat_id] = _MESSAGE_OVERHEAD
+                self._bytes += _MESSAGE_OVERHEAD
+            chat["messages"].extend(messages)
+            added = sum(_message_size(m) for m in messages)
+            self._sizes[chat_id] += added
+            self._bytes += added
+            self._touch(chat_id, chat)
+            self._evict(keep=chat_id)
+
+    async def set_summary(self, chat_id: str, summary: dict):
+        with self._lock:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                return
+            size = len(json.dumps(summary, ensure_ascii=False))
+            old = chat.get("summary_bytes", 0)
+            chat["summary"] = summary
+            chat["summary_bytes"] = size
+            self._sizes[chat_id] += size - old
+            self._bytes += size - old
+
+    async def list(self, limit: int | None = None, cursor: str | None = None) -> tuple[list[dict], str | None]:
+        limit = page_limit(limit)
+        with self._lock:
+            position = len(self._recency)
+            if cursor:
+                seq = decode_cursor(cursor, 1)[0]
+                if not seq.isdigit():
+                    raise InvalidCursor(f"Cursor inválido: {cursor}")
+                # Entradas com seq menor que o do último item já entregue
+                position = bisect_left(self._recency, (int(seq), ""))
+            page = []
+            last_seq = None
+            while position > 0 and len(page) < limit:
+                position -= 1
+                seq, chat_id = self._recency[position]
+                if self._chat_seq.get(chat_id) != seq:
+                    continue  # entrada obsoleta (chat teve atividade depois ou saiu)
+                chat = self._chats[chat_id]
+                if self._expired(chat):
+                    continue
+                page.append(_summary(chat_id, chat))
+                last_seq = seq
+            more = position > 0 and last_seq is not None
+            return page, encode_cursor(last_seq) if more else None
+
+    async def delete(self, chat_id: str) -> bool:
+        with self._lock:
+            if chat_id not in self._chats:
+                return False
+            self._remove(chat_id)
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "chats": len(self._chats),
+                "bytes": self._bytes,
+                "max_chats": self.max_chats,
+                "max_bytes": self.max_bytes,
+                "evicted": self.evicted,
+                "expired": self.expired,
+            }
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    touched REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    last_message TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS chats_recency ON chats (touched DESC, chat_id DESC);
+CREATE TABLE IF NOT EXISTS chat_messages (
+    chat_id TEXT NOT NULL REFERENCES chats (chat_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    sql TEXT,
+    PRIMARY KEY (chat_id, seq)
+) WITHOUT ROWID;
+"""
+
+
+class SqliteChatStore(ChatStore):
+    """Chats persistidos em SQLite (WAL: leitores não bloqueiam o escritor).
+
+    Uma conexão por thread do pool de bloqueantes; as chamadas rodam via
+    run_blocking para não travar o event loop.
+    """
+
+    PRUNE_INTERVAL = 60  # segundos entre limpezas de chats inativos
+
+    def __init__(self, path: str = CHAT_STORE_PATH, ttl: int = CHAT_STORE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._last_prune = 0.0
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _alive_since(self) -> float:
+        return time.time() - self.ttl if self.ttl else 0.0
+
+    def _get(self, chat_id: str) -> dict | None:
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT created_at, updated_at, summary FROM chats WHERE chat_id = ? AND touched >= ?",
+            (chat_id, self._alive_since())
+        ).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT role, content, timestamp, sql FROM chat_messages WHERE chat_id = ? ORDER BY seq",
+            (chat_id,)
+        ).fetchall()
+        return {
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "messages": [
+                {key: m[key] for key in m.keys() if key != "sql" or m[key] is not None}
+                for m in messages
+            ],
+            "summary": json.loads(row["summary"]) if row["summary"] else None,
+        }
+
+    def _create(self, chat_id: str):
+        now = datetime.now().isoformat()
+        self._connection().execute(
+            "INSERT INTO chats (chat_id, created_at, updated_at, touched) VALUES (?, ?, ?, ?)",
+            (chat_id, now, now, time.time())
+        )
+        self._maybe_prune()
+
+    def _append(self, chat_id: str, messages: list[dict]):
+        if not messages:
+            return
+        conn = self._connection()
+        now = datetime.now().isoformat()
+        # BEGIN IMMEDIATE: o próximo seq é lido e gravado sob o lock de escrita
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO chats (chat_id, created_at, updated_at, touched) VALUES (?, ?, ?, ?)",
+                (chat_id, now, now, time.time())
+            )
+            start = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE chat_id = ?", (chat_id,)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO chat_messages (chat_id, seq, role, content, timestamp, sql) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (chat_id, start + i + 1, m["role"], m["content"], m.get("timestamp") or now, m.get("sql"))
+                    for i, m in enumerate(messages)
+                ]
+            )
+            conn.execute(
+                "UPDATE chats SET updated_at = ?, touched = ?, message_count = message_count + ?, last_message = ? "
+                "WHERE chat_id = ?",
+                (now, time.time(), len(messages), messages[-1]["content"], chat_id)
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_prune()
+
+    def _set_summary(self, chat_id: str, summary: dict):
+        self._connection().execute(
+            "UPDATE chats SET summary = ? WHERE chat_id = ?",
+            (json.dumps(summary, ensure_ascii=False), chat_id)
+        )
+
+    def _list(self, limit: int, cursor: str | None) -> tuple[list[dict], str | None]:
+        conn = self._connection()
+        params = [self._alive_since()]
+        where = "touched >= ?"
+        if cursor:
+            touched, chat_id = decode_cursor(cursor, 2)
+            try:
+                touched = float(touched)
+            except ValueError as e:
+                raise InvalidCursor(f"Cursor inválido: {cursor}") from e
+            # Seek pelo índice (touched DESC, chat_id DESC): sem OFFSET
+            where += " AND (touched < ? OR (touched = ? AND chat_id < ?))"
+            params += [touched, touched, chat_id]
+        rows = conn.execute(
+            f"SELECT chat_id, created_at, updated_at, touched, message_count, last_message FROM chats "
+            f"WHERE {where} ORDER BY touched DESC, chat_id DESC LIMIT ?",
+            (*params, limit + 1)
+        ).fetchall()
+        page = [
+            {
+                "chat_id": r["chat_id"],
+                "created_at": r["created_at"],
+                "updated_at": r["updated_at"],
+                "message_count": r["message_count"],
+                "last_message": r["last_message"],
+            }
+            for r in rows[:limit]
+        ]
+        more = len(rows) > limit
+        last = rows[limit - 1] if more else None
+        return page, encode_cursor(repr(last["touched"]), last["chat_id"]) if more else None
+
+    def _delete(self, chat_id: str) -> bool:
+        return self._connection().execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,)).rowcount > 0
+
+    def _maybe_prune(self):
+        if not self.ttl or time.time() - self._last_prune < self.PRUNE_INTERVAL:
+            return
+        self._last_prune = time.time()
+        self._connection().execute("DELETE FROM chats WHERE touched < ?", (self._alive_since(),))
+
+    async def get(self, chat_id: str) -> dict | None:
+        return await run_blocking(self._get, chat_id)
+
+    async def create(self) -> str:
+        chat_id = str(uuid4())
+        await run_blocking(self._create, chat_id)
+        return chat_id
+
+    async def append_messages(self, chat_id: str, messages: list[dict]):
+        await run_blocking(self._append, chat_id, messages)
+
+    async def set_summary(self, chat_id: str, summary: dict):
+        await run_blocking(self._set_summary, chat_id, summary)
+
+    async def list(self, limit: int | None = None, cursor: str | None = None) -> tuple[list[dict], str | None]:
+        return await run_blocking(self._list, page_limit(limit), cursor)
+
+    async def delete(self, chat_id: str) -> bool:
+        return await run_blocking(self._delete, chat_id)
+
+    def stats(self) -> dict:
+        row = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(message_count), 0) FROM chats").fetchone()
+        return {"backend": "sqlite", "path": self.path, "chats": row[0], "messages": row[1]}
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+
+def create_chat_store(kind: str = CHAT_STORE) -> ChatStore:
+    """Store configurado por CHAT_STORE (memory | sqlite)."""
+    if kind == "sqlite":
+        store = SqliteChatStore()
+        logger.info("chat store", extra={"backend": "sqlite", "path": store.path})
+        return store
+    if kind != "memory":
+        raise ValueError(f"CHAT_STORE inválido: {kind}")
+    logger.info("chat store", extra={"backend": "memory"})
+    return InMemoryChatStore()
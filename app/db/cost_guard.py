@@ -0,0 +1,196 @@
+"""
+Guarda de custo antes da execução: o planner estima quantas linhas a consulta
+vai examinar (EXPLAIN) e consultas acima do limite são recusadas com uma
+mensagem que o agente usa para reescrever (filtro de período, join pelas
+chaves, agregação). O EXPLAIN de um mesmo SQL fica em cache.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+SQL_MAX_EXAMINED_ROWS = int(os.getenv("SQL_MAX_EXAMINED_ROWS", 5_000_000))  # 0 desativa
+EXPLAIN_CACHE_MAX_ENTRIES = int(os.getenv("EXPLAIN_CACHE_MAX_ENTRIES", 512))
+EXPLAIN_CACHE_TTL = int(os.getenv("EXPLAIN_CACHE_TTL", 600))
+
+
+@dataclass
+class CostEstimate:
+    """Estimativa do planner para uma consulta."""
+    rows_examined: int
+    full_scans: list[tuple[str, int]] = field(default_factory=list)  # (tabela, linhas)
+    query_cost: float | None = None
+
+
+class QueryTooExpensive(Exception):
+    """Consulta recusada pelo guarda de custo (mensagem pensada para o agente)."""
+
+    def __init__(self, estimate: CostEstimate, max_rows: int):
+        self.estimate = estimate
+        scans = ", ".join(f"{table} (~{rows:,} linhas)" for table, rows in estimate.full_scans[:3])
+        super().__init__(
+            f"Consulta recusada: o planner estima ~{estimate.rows_examined:,} linhas examinadas "
+            f"(limite {max_rows:,})."
+            + (f" Varredura completa em: {scans}." if scans else "")
+            + " Reescreva filtrando por período (ex.: order_purchase_timestamp >= '2018-01-01'),"
+            " fazendo os joins pelas chaves (order_id, customer_id, product_id, seller_id),"
+            " evitando produto cartesiano e agregando com GROUP BY em vez de listar linhas."
+        )
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _mysql_walk(node, estimate: CostEstimate):
+    """Soma as linhas examinadas em todos os blocos do plano (subconsultas, UNION, derivadas)."""
+    if isinstance(node, list):
+        for item in node:
+            _mysql_walk(item, estimate)
+        return
+    if not isinstance(node, dict):
+        return
+
+    for key, value in node.items():
+        if key == "nested_loop":
+            # Cada tabela é lida uma vez por linha produzida pelo join até ela
+            prefix = 1.0
+            for step in value:
+                table = step.get("table", {})
+                per_scan = _number(table.get("rows_examined_per_scan"))
+                estimate.rows_examined += int(prefix * per_scan)
+                if table.get("access_type") == "ALL":
+                    estimate.full_scans.append((table.get("table_name", "?"), int(per_scan)))
+                prefix = _number(table.get("rows_produced_per_join")) or prefix * per_scan
+                _mysql_walk({k: v for k, v in table.items() if isinstance(v, (dict, list))}, estimate)
+        elif key == "table" and isinstance(value, dict):
+            per_scan = _number(value.get("rows_examined_per_scan"))
+            estimate.rows_examined += int(per_scan)
+            if value.get("access_type") == "ALL":
+                estimate.full_scans.append((value.get("table_name", "?"), int(per_scan)))
+            _mysql_walk({k: v for k, v in value.items() if isinstance(v, (dict, list))}, estimate)
+        else:
+            _mysql_walk(value, estimate)
+
+
+def mysql_plan_estimate(plan: str | dict) -> CostEstimate:
+    """Estimativa a partir do `EXPLAIN FORMAT=JSON` do MySQL 8."""
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    estimate = CostEstimate(rows_examined=0)
+    _mysql_walk(plan, estimate)
+    cost = plan.get("query_block", {}).get("cost_info", {}).get("query_cost")
+    estimate.query_cost = _number(cost) if cost is not None else None
+    estimate.full_scans.sort(key=lambda scan: -scan[1])
+    return estimate
+
+
+def _duckdb_walk(node: dict, estimate: CostEstimate) -> int:
+    """Cardinalidade de saída do operador; acumula a de todos em `rows_examined`."""
+    children = [_duckdb_walk(child, estimate) for child in node.get("children", [])]
+    info = node.get("extra_info", {})
+    rows = int(_number(info.get("Estimated Cardinality")))
+    if not rows and children:
+        # CROSS_PRODUCT não informa cardinalidade: é o produto das entradas
+        rows = math.prod(children) if node.get("name") == "CROSS_PRODUCT" else max(children)
+    estimate.rows_examined += rows
+    if node.get("name") == "SEQ_SCAN" and "Filters" not in info:
+        estimate.full_scans.append((str(info.get("Table", "?")).split(".")[-1], rows))
+    return rows
+
+
+def duckdb_plan_estimate(plan: str | list) -> CostEstimate:
+    """Estimativa a partir do `EXPLAIN (FORMAT JSON)` do DuckDB.
+
+    O DuckDB só expõe a cardinalidade estimada de cada operador; a soma
+    delas aproxima o volume processado (um produto cartesiano aparece aqui).
+    """
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    estimate = CostEstimate(rows_examined=0)
+    for node in plan:
+        _duckdb_walk(node, estimate)
+    estimate.full_scans.sort(key=lambda scan: -scan[1])
+    return estimate
+
+
+class CostGuard:
+    """EXPLAIN com cache (LRU + TTL) e limite de linhas examinadas."""
+
+    def __init__(
+        self,
+        max_rows: int = SQL_MAX_EXAMINED_ROWS,
+        max_entries: int = EXPLAIN_CACHE_MAX_ENTRIES,
+        ttl: int = EXPLAIN_CACHE_TTL
+    ):
+        self.max_rows = max_rows
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # (backend, sql) -> (expires_at, CostEstimate | None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def estimate(self, backend, sql: str) -> CostEstimate | None:
+        """EXPLAIN do SQL no backend (bloqueante; chamar via run_blocking)."""
+        key = (backend.name, sql)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        estimate = backend.explain(sql)
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, estimate)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return estimate
+
+    def check(self, backend, sql: str) -> CostEstimate | None:
+        """Levanta QueryTooExpensive se a estimativa passar do limite."""
+        if self.max_rows <= 0:
+            return None
+        estimate = self.estimate(backend, sql)
+        if estimate is not None and estimate.rows_examined > self.max_rows:
+            with self._lock:
+                self.rejected += 1
+            raise QueryTooExpensive(estimate, self.max_rows)
+        return estimate
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "max_examined_rows": self.max_rows,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+_cost_guard = None
+_cost_guard_lock = threading.Lock()
+
+
+def get_cost_guard() -> CostGuard:
+    """Guarda de custo compartilhado pelo processo."""
+    global _cost_guard
+    if _cost_guard is None:
+        with _cost_guard_lock:
+            if _cost_guard is None:
+                _cost_guard = CostGuard()
+    return _cost_guard
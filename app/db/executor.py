@@ -0,0 +1,36 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Pool de threads limitado para chamadas bloqueantes (driver síncrono, I/O de arquivo).
+# Limitar evita que um pico de requisições crie threads sem controle e segura
+# a pressão sobre o pool de conexões do banco.
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 8))
+
+_executor = None
+
+
+def get_blocking_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Executa `func` no pool limitado sem travar o event loop.
+
+    Como asyncio.to_thread, leva o contexto atual (trace/request_id dos logs).
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_blocking_executor(), call)
+
+
+def shutdown_blocking_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
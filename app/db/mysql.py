@@ -1,5 +1,115 @@
+import os
+import threading
+import time
 from sqlalchemy import create_engine
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from observability.metrics import POOL_CHECKOUT_SECONDS
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import aiomysql  # noqa: F401 (driver do engine assíncrono)
+    HAS_ASYNC_DRIVER = True
+except ImportError:
+    HAS_ASYNC_DRIVER = False
+
+# Dimensionamento do pool a partir da concorrência dos workers
+# - WEB_CONCURRENCY: número de processos uvicorn (cada um tem o seu pool)
+# - DB_WORKER_CONCURRENCY: requisições simultâneas que um processo atende
+# - MYSQL_MAX_CONNECTIONS: orçamento total de conexões do servidor MySQL
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+DB_WORKER_CONCURRENCY = int(os.getenv("DB_WORKER_CONCURRENCY", 8))
+MYSQL_MAX_CONNECTIONS = int(os.getenv("MYSQL_MAX_CONNECTIONS", 151))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def pool_sizing(
+    concurrency: int = DB_WORKER_CONCURRENCY,
+    workers: int = WEB_CONCURRENCY,
+    max_connections: int = MYSQL_MAX_CONNECTIONS
+) -> tuple[int, int]:
+    """Calcula (pool_size, max_overflow) para um processo.
+
+    O pool base cobre a concorrência esperada do worker; o overflow absorve
+    picos (metade da concorrência). O total de todos os processos nunca passa
+    do orçamento de conexões do servidor (com folga de 10 para admin/setup).
+    """
+    per_worker_budget = max(2, (max_connections - 10) // max(1, workers))
+    pool_size = max(1, min(concurrency, per_worker_budget))
+    max_overflow = max(0, min(concurrency // 2, per_worker_budget - pool_size))
+    return pool_size, max_overflow
+
+
+class _PoolStatsMixin:
+    """Mede o tempo de espera por uma conexão livre no pool."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            POOL_CHECKOUT_SECONDS.observe(waited)
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_last = waited
+                if waited > self.wait_max:
+                    self.wait_max = waited
+
+    def recreate(self):
+        # Mantém as estatísticas acumuladas quando o engine recria o pool
+        new_pool = super().recreate()
+        new_pool.checkouts = self.checkouts
+        new_pool.timeouts = self.timeouts
+        new_pool.wait_total = self.wait_total
+        new_pool.wait_max = self.wait_max
+        new_pool.wait_last = self.wait_last
+        return new_pool
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            checkouts = self.checkouts
+            return {
+                "pool_size": self.size(),
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "max_overflow": self._max_overflow,
+                "checkouts": checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_last_ms": round(self.wait_last * 1000, 3),
+            }
+
+
+class InstrumentedQueuePool(_PoolStatsMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_PoolStatsMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def build_dsn(user: str, password: str, host: str, port: int, database: str, driver: str = "pymysql") -> str:
+    return f"mysql+{driver}://{user}:{password}@{host}:{port}/{database}"
+
 
 def create_mysql_engine(
     user: str,
@@ -8,18 +118,19 @@ def create_mysql_engine(
     port: int,
     database: str
 ):
-    connection_string = (
-        f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-    )
+    """Cria um engine novo (fora do registro). Prefira get_mysql_engine."""
+    connection_string = build_dsn(user, password, host, port, database)
+    pool_size, max_overflow = pool_sizing()
 
     engine = create_engine(
         connection_string,
-        poolclass=QueuePool,
-        pool_size=5,              # Conexões simultâneas
-        max_overflow=10,          # Conexões extras sob demanda
-        pool_pre_ping=True,       # Verifica conexão antes de usar
-        pool_recycle=3600,        # Recicla conexões a cada hora
-        echo=False,               # Desativa log SQL (performance)
+        poolclass=InstrumentedQueuePool,
+        pool_size=pool_size,          # Conexões simultâneas (concorrência do worker)
+        max_overflow=max_overflow,    # Conexões extras sob demanda
+        pool_timeout=DB_POOL_TIMEOUT, # Espera máxima por conexão livre
+        pool_pre_ping=True,           # Verifica conexão antes de usar
+        pool_recycle=3600,            # Recicla conexões a cada hora
+        echo=False,                   # Desativa log SQL (performance)
         connect_args={
             "connect_timeout": 10,
             "read_timeout": 30,
@@ -28,3 +139,105 @@ def create_mysql_engine(
     )
 
     return engine
+
+
+def get_mysql_engine(
+    user: str,
+    password: str,
+    host: str,
+    port: int,
+    database: str
+):
+    """Retorna o engine compartilhado do processo para este DSN (cria na primeira vez)."""
+    dsn = build_dsn(user, password, host, port, database)
+    engine = _engines.get(dsn)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(dsn)
+        if engine is None:
+            engine = create_mysql_engine(user, password, host, port, database)
+            _engines[dsn] = engine
+    return engine
+
+
+def create_async_mysql_engine(
+    user: str,
+    password: str,
+    host: str,
+    port: int,
+    database: str
+):
+    """Cria um AsyncEngine (aiomysql) com o mesmo dimensionamento do pool síncrono."""
+    connection_string = build_dsn(user, password, host, port, database, driver="aiomysql")
+    pool_size, max_overflow = pool_sizing()
+
+    return create_async_engine(
+        connection_string,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        echo=False,
+        connect_args={
+            "connect_timeout": 10,
+        }
+    )
+
+
+def get_async_mysql_engine(
+    user: str,
+    password: str,
+    host: str,
+    port: int,
+    database: str
+):
+    """AsyncEngine compartilhado para este DSN, ou None se o driver async não estiver instalado."""
+    if not HAS_ASYNC_DRIVER:
+        return None
+
+    dsn = build_dsn(user, password, host, port, database, driver="aiomysql")
+    engine = _engines.get(dsn)
+    if engine is not None:
+        return engine
+
+    with _engines_lock:
+        engine = _engines.get(dsn)
+        if engine is None:
+            engine = create_async_mysql_engine(user, password, host, port, database)
+            _engines[dsn] = engine
+    return engine
+
+
+def _sync_engine(engine):
+    # AsyncEngine expõe o pool através do engine síncrono interno
+    return getattr(engine, "sync_engine", engine)
+
+
+def get_pool_stats() -> list[dict]:
+    """Estatísticas ao vivo de todos os pools registrados."""
+    stats = []
+    for engine in list(_engines.values()):
+        sync_engine = _sync_engine(engine)
+        pool = sync_engine.pool
+        pool_stats = pool.stats() if hasattr(pool, "stats") else {"status": pool.status()}
+        stats.append({
+            "dsn": sync_engine.url.render_as_string(hide_password=True),
+            **pool_stats
+        })
+    return stats
+
+
+async def dispose_engines():
+    """Fecha todos os pools registrados (shutdown do processo)."""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        if hasattr(engine, "sync_engine"):
+            await engine.dispose()
+        else:
+            engine.dispose()
@@ -0,0 +1,76 @@
+"""
+Leitura do snapshot Parquet gerado pelo setup_database.py.
+
+Layout (hive): <PARQUET_DIR>/<tabela>/purchase_month=YYYY-MM/*.parquet para
+orders/items e <PARQUET_DIR>/<tabela>/*.parquet para as demais. Os arquivos
+são abertos com memory-map; só as colunas e partições pedidas são lidas.
+"""
+
+import os
+from pathlib import Path
+
+try:
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+PARQUET_DIR = os.getenv("PARQUET_DIR") or str(Path(__file__).resolve().parents[2] / "data" / "parquet")
+PARTITION_COLUMN = "purchase_month"
+
+
+def _require_pyarrow():
+    if not HAS_PYARROW:
+        raise RuntimeError("Leitura do snapshot Parquet requer o pacote 'pyarrow'")
+
+
+def available_tables(root: str = PARQUET_DIR) -> list[str]:
+    """Tabelas presentes no snapshot."""
+    path = Path(root)
+    if not path.exists():
+        return []
+    return sorted(p.name for p in path.iterdir() if p.is_dir())
+
+
+def partitions(table: str, root: str = PARQUET_DIR) -> list[str]:
+    """Meses (YYYY-MM) disponíveis para uma tabela particionada; [] se não for."""
+    prefix = f"{PARTITION_COLUMN}="
+    return sorted(
+        p.name[len(prefix):] for p in (Path(root) / table).iterdir()
+        if p.is_dir() and p.name.startswith(prefix)
+    )
+
+
+def open_dataset(table: str, root: str = PARQUET_DIR):
+    """Dataset Arrow da tabela (arquivos lidos via memory-map)."""
+    _require_pyarrow()
+    path = Path(root) / table
+    if not path.exists():
+        raise FileNotFoundError(f"Tabela '{table}' não encontrada no snapshot Parquet ({root})")
+    return ds.dataset(
+        str(path),
+        format="parquet",
+        partitioning="hive",
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_table(
+    table: str,
+    columns: list[str] | None = None,
+    months: list[str] | None = None,
+    root: str = PARQUET_DIR
+):
+    """Lê uma tabela do snapshot como pyarrow.Table.
+
+    `columns` limita as colunas lidas; `months` (YYYY-MM) poda partições de
+    orders/items sem abrir os demais arquivos.
+    """
+    dataset = open_dataset(table, root)
+    row_filter = None
+    if months is not None:
+        if PARTITION_COLUMN not in dataset.schema.names:
+            raise ValueError(f"Tabela '{table}' não é particionada por {PARTITION_COLUMN}")
+        row_filter = ds.field(PARTITION_COLUMN).isin(list(months))
+    return dataset.to_table(columns=columns, filter=row_filter)
@@ -0,0 +1,447 @@
+"""
+Roteador de consultas para as tabelas de agregação (rollups).
+
+O setup_database.py materializa agregados mensais por status/UF (e por
+categoria ou tipo de pagamento). Aqui consultas agregadas elegíveis sobre
+orders/items/customers/products/payments/reviews são reescritas para ler
+desses rollups. Qualquer construção não reconhecida torna a consulta
+inelegível e ela roda sem alteração.
+"""
+
+import re
+import threading
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+ROLLUP_ORDERS = "rollup_orders_monthly"
+ROLLUP_ITEMS = "rollup_items_monthly"
+ROLLUP_PAYMENTS = "rollup_payments_monthly"
+ROLLUP_TABLES = (ROLLUP_ORDERS, ROLLUP_ITEMS, ROLLUP_PAYMENTS)
+
+# Tabela de origem -> chave canônica usada nos padrões abaixo
+TABLE_KEYS = {
+    "olist_orders_dataset": "o",
+    "olist_order_items_dataset": "oi",
+    "olist_customers_dataset": "c",
+    "olist_products_dataset": "p",
+    "product_category_name_translation": "t",
+    "olist_order_payments_dataset": "pay",
+    "olist_order_reviews_dataset": "r",
+}
+
+TABLE_COLUMNS = {
+    "o": {
+        "order_id", "customer_id", "order_status", "order_purchase_timestamp", "order_approved_at",
+        "order_delivered_carrier_date", "order_delivered_customer_date", "order_estimated_delivery_date",
+    },
+    "oi": {"order_id", "order_item_id", "product_id", "seller_id", "shipping_limit_date", "price", "freight_value"},
+    "c": {"customer_id", "customer_unique_id", "customer_zip_code_prefix", "customer_city", "customer_state"},
+    "p": {
+        "product_id", "product_category_name", "product_name_lenght", "product_description_lenght",
+        "product_photos_qty", "product_weight_g", "product_length_cm", "product_height_cm", "product_width_cm",
+    },
+    "t": {"product_category_name", "product_category_name_english"},
+    "pay": {"order_id", "payment_sequential", "payment_type", "payment_installments", "payment_value"},
+    "r": {
+        "review_id", "order_id", "review_score", "review_comment_title", "review_comment_message",
+        "review_creation_date", "review_answer_timestamp",
+    },
+}
+
+# Joins aceitos: pares de chaves (tabela, coluna) nos dois sentidos
+JOIN_KEYS = {
+    frozenset({("o", "customer_id"), ("c", "customer_id")}),
+    frozenset({("oi", "order_id"), ("o", "order_id")}),
+    frozenset({("oi", "product_id"), ("p", "product_id")}),
+    frozenset({("p", "product_category_name"), ("t", "product_category_name")}),
+    frozenset({("pay", "order_id"), ("o", "order_id")}),
+    frozenset({("r", "order_id"), ("o", "order_id")}),
+}
+# LEFT JOIN só onde não muda o resultado (FK sempre presente) ou é tratado
+LEFT_JOIN_OK = {"c", "p", "t", "r"}
+
+# Dimensões: expressão canônica -> (expressão no rollup, rollups que têm a dimensão)
+_ALL = {ROLLUP_ORDERS, ROLLUP_ITEMS, ROLLUP_PAYMENTS}
+DIMENSIONS = {
+    "o.order_status": ("order_status", _ALL),
+    "c.customer_state": ("customer_state", _ALL),
+    "DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m')": ("purchase_month", _ALL),
+    "YEAR(o.order_purchase_timestamp)": ("CAST(SUBSTRING(purchase_month, 1, 4) AS UNSIGNED)", _ALL),
+    "MONTH(o.order_purchase_timestamp)": ("CAST(SUBSTRING(purchase_month, 6, 2) AS UNSIGNED)", _ALL),
+    "t.product_category_name_english": ("product_category_name_english", {ROLLUP_ITEMS}),
+    "pay.payment_type": ("payment_type", {ROLLUP_PAYMENTS}),
+}
+LATE_PREDICATE = "o.order_delivered_customer_date > o.order_estimated_delivery_date"
+_MONTH_START = re.compile(r"^(\d{4})-(\d{2})-01( 00:00:00)?$")
+
+_ITEM_AGGS = {
+    "SUM(oi.price)": "SUM(sum_price)",
+    "SUM(oi.freight_value)": "SUM(sum_freight)",
+    "SUM(oi.price + oi.freight_value)": "SUM(sum_price) + SUM(sum_freight)",
+    "AVG(oi.price)": "SUM(sum_price) / SUM(item_count)",
+    "AVG(oi.freight_value)": "SUM(sum_freight) / SUM(item_count)",
+    "AVG(oi.price + oi.freight_value)": "(SUM(sum_price) + SUM(sum_freight)) / SUM(item_count)",
+    "COUNT(*)": "COALESCE(SUM(item_count), 0)",
+    "COUNT(oi.order_id)": "COALESCE(SUM(item_count), 0)",
+    "COUNT(oi.order_item_id)": "COALESCE(SUM(item_count), 0)",
+}
+
+# Agregações por variante: expressão canônica -> (expressão no rollup, dimensão exigida)
+# A dimensão exigida vale para contagens distintas que não somam entre células
+# (um pedido pode ter itens de várias categorias / pagamentos de vários tipos).
+AGGREGATES = {
+    "orders": {
+        "COUNT(*)": "COALESCE(SUM(order_count), 0)",
+        "COUNT(o.order_id)": "COALESCE(SUM(order_count), 0)",
+        "COUNT(DISTINCT o.order_id)": "COALESCE(SUM(order_count), 0)",
+        "COUNT(o.order_delivered_customer_date)": "COALESCE(SUM(delivered_count), 0)",
+        "AVG(DATEDIFF(o.order_delivered_customer_date, o.order_purchase_timestamp))":
+            "SUM(sum_delivery_days) / SUM(delivered_count)",
+        "SUM(DATEDIFF(o.order_delivered_customer_date, o.order_purchase_timestamp))": "SUM(sum_delivery_days)",
+        "AVG(DATEDIFF(o.order_delivered_customer_date, o.order_estimated_delivery_date))":
+            "SUM(sum_delay_days) / SUM(delivered_count)",
+        "SUM(DATEDIFF(o.order_delivered_customer_date, o.order_estimated_delivery_date))": "SUM(sum_delay_days)",
+    },
+    "orders_items": {
+        **_ITEM_AGGS,
+        "COUNT(DISTINCT o.order_id)": "COALESCE(SUM(orders_with_items), 0)",
+        "COUNT(DISTINCT oi.order_id)": "COALESCE(SUM(orders_with_items), 0)",
+    },
+    "orders_reviews": {
+        "AVG(r.review_score)": "SUM(review_sum) / SUM(review_count)",
+        "SUM(r.review_score)": "SUM(review_sum)",
+        "COUNT(r.review_score)": "COALESCE(SUM(review_count), 0)",
+        "COUNT(DISTINCT o.order_id)": "COALESCE(SUM(order_count), 0)",
+    },
+    "orders_reviews_inner": {
+        "AVG(r.review_score)": "SUM(review_sum) / SUM(review_count)",
+        "SUM(r.review_score)": "SUM(review_sum)",
+        "COUNT(r.review_score)": "COALESCE(SUM(review_count), 0)",
+        "COUNT(DISTINCT o.order_id)": "COALESCE(SUM(orders_with_reviews), 0)",
+        "COUNT(DISTINCT r.order_id)": "COALESCE(SUM(orders_with_reviews), 0)",
+    },
+    "items": {
+        **_ITEM_AGGS,
+        "COUNT(DISTINCT o.order_id)": ("COALESCE(SUM(order_count), 0)", "product_category_name_english"),
+        "COUNT(DISTINCT oi.order_id)": ("COALESCE(SUM(order_count), 0)", "product_category_name_english"),
+        "AVG(p.product_photos_qty)": "SUM(sum_photos) / SUM(photo_items)",
+    },
+    "payments": {
+        "COUNT(*)": "COALESCE(SUM(payment_count), 0)",
+        "SUM(pay.payment_value)": "SUM(sum_payment_value)",
+        "AVG(pay.payment_value)": "SUM(sum_payment_value) / SUM(payment_count)",
+        "SUM(pay.payment_installments)": "SUM(sum_installments)",
+        "AVG(pay.payment_installments)": "SUM(sum_installments) / SUM(payment_count)",
+        "COUNT(DISTINCT o.order_id)": ("COALESCE(SUM(order_count), 0)", "payment_type"),
+        "COUNT(DISTINCT pay.order_id)": ("COALESCE(SUM(order_count), 0)", "payment_type"),
+    },
+}
+
+
+class Ineligible(Exception):
+    """A consulta não pode ser respondida por um rollup."""
+
+
+class _Scope:
+    """Tabelas do FROM/JOIN resolvidas para chaves canônicas."""
+
+    def __init__(self, select: exp.Select):
+        self.aliases = {}  # alias -> chave
+        self.inner = set()  # chaves com INNER JOIN (ou tabela do FROM)
+        self.keys = set()
+
+        from_ = select.args.get("from_") or select.args.get("from")
+        if from_ is None:
+            raise Ineligible("sem FROM")
+        self._add_table(from_.this)
+        self.inner.add(self._key_of(from_.this))
+
+        for join in select.args.get("joins") or []:
+            key = self._add_table(join.this)
+            side = (join.side or "").upper()
+            kind = (join.kind or "").upper()
+            if kind not in ("", "INNER") or side not in ("", "LEFT") or join.args.get("using"):
+                raise Ineligible("tipo de join não suportado")
+            if side == "LEFT" and key not in LEFT_JOIN_OK:
+                raise Ineligible("LEFT JOIN altera o resultado")
+            if side != "LEFT":
+                self.inner.add(key)
+            self._check_join_condition(join.args.get("on"), key)
+
+    def _key_of(self, table) -> str:
+        if not isinstance(table, exp.Table) or table.args.get("db"):
+            raise Ineligible("origem não é uma tabela simples")
+        key = TABLE_KEYS.get(table.name.lower())
+        if key is None:
+            raise Ineligible(f"tabela fora dos rollups: {table.name}")
+        return key
+
+    def _add_table(self, table) -> str:
+        key = self._key_of(table)
+        if key in self.keys:
+            raise Ineligible("self-join")
+        self.keys.add(key)
+        self.aliases[(table.alias or table.name).lower()] = key
+        return key
+
+    def _check_join_condition(self, on, new_key: str):
+        if not isinstance(on, exp.EQ):
+            raise Ineligible("condição de join não suportada")
+        left = self.resolve(on.this)
+        right = self.resolve(on.expression)
+        if frozenset({left, right}) not in JOIN_KEYS or new_key not in (left[0], right[0]):
+            raise Ineligible("join fora das chaves do modelo")
+
+    def resolve(self, column) -> tuple[str, str]:
+        if not isinstance(column, exp.Column):
+            raise Ineligible("esperada coluna")
+        name = column.name.lower()
+        if column.table:
+            key = self.aliases.get(column.table.lower())
+            if key is None or name not in TABLE_COLUMNS[key]:
+                raise Ineligible(f"coluna desconhecida: {column.sql()}")
+            return key, name
+        owners = [key for key in self.keys if name in TABLE_COLUMNS[key]]
+        if len(owners) != 1:
+            raise Ineligible(f"coluna ambígua ou desconhecida: {name}")
+        return owners[0], name
+
+    def canon(self, node) -> str:
+        """SQL da expressão com colunas qualificadas pelas chaves canônicas."""
+        node = node.copy()
+        if isinstance(node, exp.Column):
+            key, name = self.resolve(node)
+            return f"{key}.{name}"
+        for column in list(node.find_all(exp.Column)):
+            key, name = self.resolve(column)
+            column.replace(exp.column(name, table=key))
+        return node.sql(dialect="mysql", normalize=True)
+
+
+class RollupRouter:
+    """Reescreve consultas agregadas elegíveis para ler dos rollups."""
+
+    def __init__(self, available: set[str] | None = None):
+        self.available = set(available or ())
+        self._lock = threading.Lock()
+        self.rewrites = 0
+        self.passthrough = 0
+
+    def refresh(self, backend):
+        """Descobre quais rollups existem no banco (bloqueante; usar run_blocking)."""
+        try:
+            names = backend.table_names()
+        except Exception:
+            names = set()
+        self.available = names & set(ROLLUP_TABLES)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "available": sorted(self.available),
+                "rewrites": self.rewrites,
+                "passthrough": self.passthrough,
+            }
+
+    def rewrite(self, sql: str) -> tuple[str, str] | None:
+        """Retorna (sql_reescrito, rollup) ou None se a consulta não é elegível."""
+        if not self.available:
+            return None
+        try:
+            result = self._rewrite(sql)
+        except (Ineligible, SqlglotError):
+            result = None
+        with self._lock:
+            if result is None:
+                self.passthrough += 1
+            else:
+                self.rewrites += 1
+        return result
+
+    def _rewrite(self, sql: str) -> tuple[str, str]:
+        select = sqlglot.parse_one(sql, read="mysql")
+        if not isinstance(select, exp.Select):
+            raise Ineligible("não é um SELECT simples")
+        if select.args.get("with") or select.args.get("distinct"):
+            raise Ineligible("CTE/DISTINCT")
+        if select.find(exp.Subquery, exp.Window, exp.Union):
+            raise Ineligible("subconsulta/janela/union")
+        if any(isinstance(p, exp.Star) for p in select.expressions):
+            raise Ineligible("SELECT *")
+
+        scope = _Scope(select)
+        rollup, variant = self._choose_rollup(scope)
+        if rollup not in self.available:
+            raise Ineligible("rollup não materializado")
+
+        dims = {text: target for text, (target, rollups) in DIMENSIONS.items() if rollup in rollups}
+        aliases = {p.alias_or_name.lower() for p in select.expressions if p.alias_or_name}
+
+        # WHERE -> predicados sobre as dimensões do rollup
+        predicates, fixed_dims = self._rewrite_where(select.args.get("where"), scope, dims, rollup)
+        if "t" in scope.inner:
+            predicates.append("product_category_name_english IS NOT NULL")
+
+        grouped = set(fixed_dims)
+        group = select.args.get("group")
+        if group:
+            for node in group.expressions:
+                grouped.add(self._group_dim(node, select, scope, dims, aliases))
+
+        aggregates = AGGREGATES[variant]
+
+        def transform(node):
+            if isinstance(node, exp.Column) and not node.table and node.name.lower() in aliases:
+                return node
+            if isinstance(node, exp.AggFunc):
+                target = aggregates.get(scope.canon(node))
+                if isinstance(target, tuple):
+                    target, required = target
+                    if required not in grouped:
+                        raise Ineligible("contagem distinta não aditiva")
+                if target is None:
+                    raise Ineligible(f"agregação não suportada: {node.sql()}")
+                target = sqlglot.parse_one(target, read="mysql")
+                return exp.Paren(this=target) if isinstance(target, exp.Binary) else target
+            if isinstance(node, (exp.Column, exp.Func)):
+                text = scope.canon(node)
+                if text in dims:
+                    return sqlglot.parse_one(dims[text], read="mysql")
+                if isinstance(node, exp.Column):
+                    raise Ineligible(f"coluna fora das dimensões: {text}")
+            return node
+
+        projections = []
+        for projection in select.expressions:
+            inner = projection.unalias()
+            label = projection.alias if isinstance(projection, exp.Alias) else (
+                inner.name if isinstance(inner, exp.Column) else inner.sql(dialect="mysql")
+            )
+            rewritten = inner.copy().transform(transform)
+            if isinstance(rewritten, exp.Column) and rewritten.name == label:
+                projections.append(rewritten)
+            else:
+                quoted = not isinstance(projection, exp.Alias) and not isinstance(inner, exp.Column)
+                projections.append(exp.alias_(rewritten, label, quoted=quoted))
+
+        rewritten = exp.select(*projections).from_(rollup)
+        if predicates:
+            rewritten = rewritten.where(" AND ".join(predicates), dialect="mysql")
+        if group:
+            rewritten = rewritten.group_by(*[
+                node.copy() if self._is_alias_or_position(node, aliases) else node.copy().transform(transform)
+                for node in group.expressions
+            ])
+        having = select.args.get("having")
+        if having:
+            rewritten = rewritten.having(having.this.copy().transform(transform))
+        order = select.args.get("order")
+        if order:
+            rewritten = rewritten.order_by(*[
+                ordered.copy().transform(transform) for ordered in order.expressions
+            ])
+        for arg in ("limit", "offset"):
+            if select.args.get(arg):
+                rewritten.set(arg, select.args[arg].copy())
+
+        return rewritten.sql(dialect="mysql"), rollup
+
+    @staticmethod
+    def _choose_rollup(scope: _Scope) -> tuple[str, str]:
+        keys = scope.keys
+        if "pay" in keys:
+            if keys - {"pay", "o", "c"}:
+                raise Ineligible("pagamentos com itens/reviews")
+            return ROLLUP_PAYMENTS, "payments"
+        if "p" in keys or "t" in keys:
+            if "t" in keys and "p" not in keys or keys - {"oi", "p", "t", "o", "c"} or "oi" not in keys:
+                raise Ineligible("categoria sem itens")
+            return ROLLUP_ITEMS, "items"
+        if "oi" in keys:
+            if "r" in keys:
+                raise Ineligible("itens com reviews")
+            return ROLLUP_ORDERS, "orders_items"
+        if "r" in keys:
+            if "o" not in keys:
+                raise Ineligible("reviews sem pedidos")
+            return ROLLUP_ORDERS, "orders_reviews_inner" if "r" in scope.inner else "orders_reviews"
+        if "o" not in keys:
+            raise Ineligible("clientes sem pedidos")
+        return ROLLUP_ORDERS, "orders"
+
+    def _rewrite_where(self, where, scope: _Scope, dims: dict, rollup: str) -> tuple[list[str], set[str]]:
+        predicates, fixed = [], set()
+        if where is None:
+            return predicates, fixed
+
+        conjuncts = list(where.this.flatten()) if isinstance(where.this, exp.And) else [where.this]
+        for node in conjuncts:
+            if isinstance(node, exp.Paren):
+                node = node.unnest()
+            if rollup == ROLLUP_ORDERS and scope.canon(node) == LATE_PREDICATE:
+                predicates.append("is_late = 1")
+                continue
+
+            negated = isinstance(node, exp.Not)
+            inner = node.this if negated else node
+            if isinstance(inner, (exp.EQ, exp.NEQ, exp.GT, exp.GTE, exp.LT, exp.LTE, exp.In, exp.Is)):
+                subject = inner.this
+                values = inner.expressions if isinstance(inner, exp.In) else [inner.expression]
+                if not all(isinstance(v, (exp.Literal, exp.Null)) for v in values):
+                    raise Ineligible("predicado não literal")
+                text = scope.canon(subject)
+
+                if text == "o.order_purchase_timestamp" and isinstance(inner, (exp.GTE, exp.LT)) and not negated:
+                    match = _MONTH_START.match(values[0].name) if values[0].is_string else None
+                    if not match:
+                        raise Ineligible("intervalo de datas fora do limite de mês")
+                    op = ">=" if isinstance(inner, exp.GTE) else "<"
+                    predicates.append(f"purchase_month {op} '{match.group(1)}-{match.group(2)}'")
+                    continue
+
+                if text in dims:
+                    target = sqlglot.parse_one(dims[text], read="mysql")
+                    rewritten = inner.copy()
+                    rewritten.set("this", target)
+                    if negated:
+                        rewritten = exp.Not(this=rewritten)
+                    predicates.append(rewritten.sql(dialect="mysql"))
+                    if isinstance(inner, exp.EQ) and not negated:
+                        fixed.add(dims[text])
+                    continue
+            raise Ineligible(f"predicado não suportado: {node.sql()}")
+        return predicates, fixed
+
+    @staticmethod
+    def _is_alias_or_position(node, aliases: set[str]) -> bool:
+        if isinstance(node, exp.Literal) and not node.is_string:
+            return True
+        return isinstance(node, exp.Column) and not node.table and node.name.lower() in aliases
+
+    def _group_dim(self, node, select: exp.Select, scope: _Scope, dims: dict, aliases: set[str]) -> str:
+        """Dimensão do rollup correspondente a um item do GROUP BY."""
+        if self._is_alias_or_position(node, aliases):
+            if isinstance(node, exp.Literal):
+                projection = select.expressions[int(node.name) - 1]
+            else:
+                projection = next(p for p in select.expressions if p.alias_or_name.lower() == node.name.lower())
+            node = projection.unalias()
+        text = scope.canon(node)
+        if text not in dims:
+            raise Ineligible(f"GROUP BY fora das dimensões: {text}")
+        return dims[text]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_rollup_router() -> RollupRouter:
+    """Roteador compartilhado pelo processo."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = RollupRouter()
+    return _router
@@ -0,0 +1,134 @@
+"""
+Validação do SQL gerado pelo agente (parse real, dialeto MySQL, via sqlglot).
+
+Prova que a entrada é um único SELECT somente leitura (CTEs e UNION
+permitidos), aplica o LIMIT externo quando a consulta de fora não tem um e
+extrai tabelas/colunas referenciadas para as demais checagens. O parse fica
+num cache LRU: a mesma consulta repetida não é analisada de novo.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.tokens import TokenType
+
+SQL_DEFAULT_LIMIT = int(os.getenv("SQL_DEFAULT_LIMIT", 100))
+SQL_PARSE_CACHE_SIZE = int(os.getenv("SQL_PARSE_CACHE_SIZE", 1024))
+_EXECUTION_TIME_HINT = re.compile(r"/\*\+[^*]*\bMAX_EXECUTION_TIME\s*\(", re.IGNORECASE)
+
+# Nós que escrevem, travam ou saem do banco em qualquer ponto da árvore
+FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.TruncateTable, exp.Command, exp.Into, exp.Lock, exp.Placeholder,
+)
+# Funções com efeito colateral ou que seguram a conexão de propósito
+FORBIDDEN_FUNCTIONS = {
+    "SLEEP", "BENCHMARK", "LOAD_FILE", "GET_LOCK", "RELEASE_LOCK", "RELEASE_ALL_LOCKS",
+    "IS_FREE_LOCK", "IS_USED_LOCK", "MASTER_POS_WAIT", "SOURCE_POS_WAIT",
+}
+
+
+class SqlValidationError(ValueError):
+    """SQL rejeitado; a mensagem vai para o agente reescrever a consulta."""
+
+
+@dataclass(frozen=True)
+class ParsedQuery:
+    """Resultado da validação (compartilhado pelo cache: não alterar `ast`)."""
+    sql: str  # SQL a executar (original, com LIMIT externo se faltava)
+    ast: exp.Expression
+    tables: frozenset[str]
+    columns: frozenset[str]
+    limit: int | None  # LIMIT externo efetivo (None se não for literal)
+    limit_added: bool
+
+
+def _outer_limit(tree: exp.Expression) -> tuple[bool, int | None]:
+    """(tem LIMIT externo?, valor) — LIMITs em CTEs/subconsultas não contam."""
+    limit = tree.args.get("limit")
+    if limit is None:
+        return False, None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return True, int(value.this)
+    return True, None
+
+
+def _check_read_only(tree: exp.Expression):
+    if not isinstance(tree, (exp.Select, exp.SetOperation)):
+        raise SqlValidationError("Somente consultas SELECT são permitidas.")
+    for node in tree.walk():
+        if isinstance(node, FORBIDDEN_NODES):
+            raise SqlValidationError(f"Construção não permitida em consulta de leitura: {node.key.upper()}.")
+        if isinstance(node, exp.Func):
+            name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).upper()
+            if name in FORBIDDEN_FUNCTIONS:
+                raise SqlValidationError(f"Função não permitida: {name}.")
+
+
+@lru_cache(maxsize=SQL_PARSE_CACHE_SIZE)
+def parse_query(query: str) -> ParsedQuery:
+    """Valida e prepara o SQL. Levanta SqlValidationError se rejeitado."""
+    sql = (query or "").strip().rstrip(";").strip()
+    if not sql:
+        raise SqlValidationError("SQL vazio. Envie uma consulta SELECT.")
+
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="mysql") if s is not None]
+    except SqlglotError as e:
+        raise SqlValidationError(f"SQL inválido: {str(e).splitlines()[0]}") from e
+    if len(statements) != 1:
+        raise SqlValidationError("Envie uma única consulta SELECT por vez.")
+
+    tree = statements[0]
+    _check_read_only(tree)
+
+    # Nomes de CTE não são tabelas do banco
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    tables = frozenset(
+        t.name.lower() for t in tree.find_all(exp.Table) if t.name and t.name.lower() not in ctes
+    )
+    columns = frozenset(c.name.lower() for c in tree.find_all(exp.Column) if c.name)
+
+    has_limit, limit = _outer_limit(tree)
+    if not has_limit:
+        # Anexa ao texto original (quebra de linha encerra um eventual comentário "--")
+        sql = f"{sql}\nLIMIT {SQL_DEFAULT_LIMIT}"
+        limit = SQL_DEFAULT_LIMIT
+
+    return ParsedQuery(
+        sql=sql,
+        ast=tree,
+        tables=tables,
+        columns=columns,
+        limit=limit,
+        limit_added=not has_limit,
+    )
+
+
+def parse_cache_stats() -> dict:
+    info = parse_query.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+def with_max_execution_time(sql: str, milliseconds: int) -> str:
+    """Insere o hint /*+ MAX_EXECUTION_TIME(ms) */ no SELECT de nível superior (MySQL).
+
+    O SELECT de fora é o primeiro fora de parênteses (CTEs e subconsultas
+    ficam entre parênteses); o restante do texto não muda.
+    """
+    if milliseconds <= 0 or _EXECUTION_TIME_HINT.search(sql):
+        return sql
+    depth = 0
+    for token in sqlglot.tokenize(sql, read="mysql"):
+        if token.token_type == TokenType.L_PAREN:
+            depth += 1
+        elif token.token_type == TokenType.R_PAREN:
+            depth -= 1
+        elif token.token_type == TokenType.SELECT and depth == 0:
+            return f"{sql[:token.end + 1]} /*+ MAX_EXECUTION_TIME({int(milliseconds)}) */{sql[token.end + 1:]}"
+    return sql
@@ -0,0 +1,136 @@
+"""
+Prazo por requisição e cancelamento do trabalho em andamento.
+
+Cada /api/ask recebe um Deadline no contexto do grafo. Os nós e a tool SQL
+usam o tempo restante como timeout (chamada ao LLM, MAX_EXECUTION_TIME) e
+registram callbacks de cancelamento (ex.: KILL QUERY na conexão que está
+executando o SQL). Quando o prazo acaba ou o cliente desconecta, os
+callbacks rodam e a tarefa do grafo é cancelada, liberando conexões do pool.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from db.executor import get_blocking_executor, run_blocking
+from observability.log import get_logger
+
+REQUEST_TIMEOUT_S = float(os.getenv("REQUEST_TIMEOUT_S", 120))
+DISCONNECT_POLL_S = float(os.getenv("DISCONNECT_POLL_S", 0.5))
+
+logger = get_logger(__name__)
+
+
+class RequestCancelled(Exception):
+    """Trabalho interrompido: prazo esgotado ("deadline") ou cliente saiu ("disconnect")."""
+
+    def __init__(self, reason: str):
+        self.reason = reason
+        super().__init__(f"Requisição interrompida ({reason})")
+
+
+class Deadline:
+    """Prazo de uma requisição e callbacks a executar se ela for cancelada."""
+
+    def __init__(self, timeout: float | None = REQUEST_TIMEOUT_S):
+        self.expires_at = time.monotonic() + timeout if timeout else None
+        self.reason = None
+        self._callbacks = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float | None:
+        """Segundos restantes (None = sem prazo)."""
+        if self.expires_at is None:
+            return None
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def check(self):
+        """Levanta RequestCancelled se a requisição já foi cancelada ou expirou."""
+        if self.reason is not None:
+            raise RequestCancelled(self.reason)
+        if self.expired:
+            raise RequestCancelled("deadline")
+
+    def timeout(self, limit: float | None = None) -> float | None:
+        """Menor entre o tempo restante e `limit` (segundos)."""
+        remaining = self.remaining()
+        if remaining is None:
+            return limit
+        return remaining if limit is None else min(remaining, limit)
+
+    def on_cancel(self, callback):
+        """Registra `callback()` para o cancelamento; devolve a função que o remove.
+
+        Se já foi cancelada, o callback roda na hora.
+        """
+        with self._lock:
+            if self.reason is None:
+                callback_id = self._next_id
+                self._next_id += 1
+                self._callbacks[callback_id] = callback
+                return lambda: self._callbacks.pop(callback_id, None)
+        callback()
+        return lambda: None
+
+    def cancel(self, reason: str):
+        """Marca como cancelada e executa os callbacks (bloqueante: KILL QUERY etc.)."""
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks = list(self._callbacks.values())
+            self._callbacks.clear()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("cancel callback failed", extra={"reason": reason, "error": str(e)})
+
+    def cancel_in_background(self, reason: str):
+        """cancel() no pool de threads, sem esperar (para blocos que já foram cancelados)."""
+        # Copia o contexto: os logs dos callbacks levam o request_id
+        get_blocking_executor().submit(contextvars.copy_context().run, self.cancel, reason)
+
+
+async def run_until_cancelled(coro, deadline: Deadline, is_disconnected=None, poll: float = DISCONNECT_POLL_S):
+    """Executa `coro` vigiando o prazo e a desconexão do cliente.
+
+    Se um dos dois acontecer, cancela o trabalho pendente (callbacks e a
+    própria tarefa) e levanta RequestCancelled.
+    """
+    task = asyncio.ensure_future(coro)
+    reason = None
+    try:
+        while reason is None:
+            done, _ = await asyncio.wait({task}, timeout=deadline.timeout(poll))
+            if task in done:
+                return task.result()
+            if deadline.expired:
+                reason = "deadline"
+            elif is_disconnected is not None and await is_disconnected():
+                reason = "disconnect"
+    except BaseException:
+        # Quem chamou foi cancelado (ex.: shutdown do servidor): derruba o trabalho também
+        if not task.done():
+            deadline.cancel_in_background("cancelled")
+            task.cancel()
+        raise
+
+    logger.info("cancelling request", extra={"reason": reason})
+    await run_blocking(deadline.cancel, reason)
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, Exception):
+        pass
+    raise RequestCancelled(reason)
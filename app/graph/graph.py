@@ -1,6 +1,6 @@
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from graph.state import AgentState
+from graph.state import AgentState, ContextSchema
 from graph.nodes import unified_analysis_node
 
 
@@ -26,7 +26,7 @@ def should_continue(state: AgentState) -> str:
 
 def build_graph(agent, tools, llm):
     """Grafo simplificado com análise unificada em um único nó."""
-    graph = StateGraph(AgentState)
+    graph = StateGraph(AgentState, context_schema=ContextSchema)
 
     # Nó de análise e nó de execução de tools
     graph.add_node("unified_analysis", unified_analysis_node(agent, tools, llm))
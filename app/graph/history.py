@@ -0,0 +1,136 @@
+"""
+Histórico do chat para o prompt, limitado por tokens em vez de mensagens.
+
+As trocas mais recentes entram na íntegra até HISTORY_TOKEN_BUDGET; as que
+saem dessa janela são dobradas num resumo corrido (uma linha por troca com a
+pergunta, o SQL executado e os números em destaque da resposta), limitado a
+SUMMARY_TOKEN_BUDGET. O resumo fica guardado no chat junto com quantas
+mensagens ele já cobre, então cada turno só dobra as mensagens que acabaram
+de sair da janela.
+"""
+
+import os
+import re
+from langchain.messages import AIMessage, HumanMessage, SystemMessage
+from graph.prompts import count_tokens
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1500))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", 500))
+SUMMARY_MAX_FACTS = 6  # linhas com números por resposta
+
+_QUESTION_CHARS = 160
+_SQL_CHARS = 400
+_FACT_CHARS = 90
+_BOLD_NUMBER = re.compile(r"\*\*[^*]*\d[^*]*\*\*")
+_MARKDOWN = re.compile(r"[*#`>|]+")
+_SYMBOLS = re.compile(r"[^\w\s.,:;%$/()+\-–=<>']", re.UNICODE)
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def key_facts(answer: str, limit: int = SUMMARY_MAX_FACTS) -> list[str]:
+    """Linhas da resposta com números em negrito (o prompt pede números em **negrito**)."""
+    facts = []
+    for line in answer.splitlines():
+        if not _BOLD_NUMBER.search(line):
+            continue
+        # Sem markdown nem emojis: só o rótulo e o valor
+        fact = _clip(_SYMBOLS.sub("", _MARKDOWN.sub("", line)).strip(" -:"), _FACT_CHARS)
+        if fact:
+            facts.append(fact)
+        if len(facts) >= limit:
+            break
+    return facts
+
+
+def fold_turn(question: str, answer: str, sql: str | None = None) -> str:
+    """Uma troca (pergunta + resposta) resumida em uma linha."""
+    parts = [f"P: {_clip(question, _QUESTION_CHARS)}"]
+    if sql:
+        parts.append(f"SQL: {_clip(sql, _SQL_CHARS)}")
+    facts = key_facts(answer)
+    if facts:
+        parts.append("números: " + "; ".join(facts))
+    elif answer:
+        parts.append(f"R: {_clip(answer, _QUESTION_CHARS)}")
+    return "- " + " | ".join(parts)
+
+
+def _window_start(messages: list[dict], covered: int, budget: int) -> int:
+    """Início das mensagens mantidas na íntegra: trocas inteiras, das mais novas para trás."""
+    start = len(messages)
+    used = 0
+    index = len(messages)
+    while index > covered:
+        index -= 1
+        used += count_tokens(messages[index]["content"])
+        if used > budget:
+            break
+        if messages[index]["role"] == "user":
+            start = index  # a janela sempre começa numa pergunta
+    return start
+
+
+def compact_history(messages: list[dict], summary: dict | None, budget: int = HISTORY_TOKEN_BUDGET) -> tuple[list[dict], dict, bool]:
+    """(mensagens na íntegra, resumo atualizado, se o resumo mudou)."""
+    summary = summary or {"lines": [], "covered": 0}
+    covered = min(summary.get("covered", 0), len(messages))
+    start = _window_start(messages, covered, budget)
+    if start <= covered:
+        return messages[covered:], summary, False
+
+    # Dobra só o que acabou de sair da janela
+    lines = list(summary.get("lines", []))
+    pending = None
+    for message in messages[covered:start]:
+        if message["role"] == "user":
+            if pending is not None:
+                lines.append(fold_turn(pending, ""))
+            pending = message["content"]
+        elif message["role"] == "assistant":
+            lines.append(fold_turn(pending or "", message["content"], message.get("sql")))
+            pending = None
+    if pending is not None:
+        lines.append(fold_turn(pending, ""))
+
+    # Orçamento do resumo: as trocas mais antigas saem primeiro
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > SUMMARY_TOKEN_BUDGET:
+        lines.pop(0)
+    return messages[start:], {"lines": lines, "covered": start}, True
+
+
+def summary_message(summary: dict) -> SystemMessage | None:
+    lines = summary.get("lines") if summary else None
+    if not lines:
+        return None
+    return SystemMessage(content="Resumo das trocas anteriores desta conversa (mais antigas primeiro):\n" + "\n".join(lines))
+
+
+def build_graph_messages(chat: dict, question: str) -> tuple[list, dict, bool]:
+    """Resumo + trocas recentes + pergunta atual; devolve também o resumo para guardar no chat."""
+    recent, summary, changed = compact_history(chat["messages"], chat.get("summary"))
+    messages = []
+    folded = summary_message(summary)
+    if folded is not None:
+        messages.append(folded)
+    for msg in recent:
+        if msg["role"] == "user":
+            messages.append(HumanMessage(content=msg["content"]))
+        elif msg["role"] == "assistant":
+            messages.append(AIMessage(content=msg["content"]))
+    messages.append(HumanMessage(content=question))
+    return messages, summary, changed
+
+
+def turn_sql(messages) -> str | None:
+    """SQL executado neste turno (tool calls do agente), para guardar com a resposta."""
+    queries = [
+        call["args"].get("query", "")
+        for msg in messages
+        for call in getattr(msg, "tool_calls", None) or []
+    ]
+    queries = [q for q in queries if q]
+    return ";\n".join(queries) if queries else None
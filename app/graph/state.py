@@ -1,13 +1,18 @@
 from dataclasses import dataclass
-from typing import Annotated, Sequence, TypedDict
+from typing import Annotated, Any, Sequence, TypedDict
 from langgraph.graph.message import add_messages
 from langchain.messages import AnyMessage
-from langchain_openai import ChatOpenAI
 
 @dataclass
 class ContextSchema:
-    llm: ChatOpenAI
-    db: any
+    """Contexto por requisição injetado pelo LangGraph (runtime context)."""
+    db: Any = None
+    async_db: Any = None  # AsyncEngine (aiomysql); quando None, usa `db` em thread
+    backend: Any = None  # SqlBackend (db/backends.py); None = MySQL via db/async_db
+    sql_cache: Any = None  # SqlResultCache compartilhado; None desativa o cache
+    rollup_router: Any = None  # RollupRouter; None executa o SQL sem reescrita
+    cost_guard: Any = None  # CostGuard; None executa sem EXPLAIN prévio
+    deadline: Any = None  # Deadline (graph/deadline.py); None = sem prazo nem cancelamento
 
 class AgentState(TypedDict):
-    messages: Annotated[Sequence[AnyMessage], add_messages]
\ No newline at end of file
+    messages: Annotated[Sequence[AnyMessage], add_messages]
@@ -1,11 +1,11 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 from langchain.messages import HumanMessage, ToolMessage, SystemMessage, AIMessage
-from agents.sql_agent import build_agent
-from graph.graph import build_graph
+from agents.runtime import build_runtime
 from graph.state import ContextSchema
 from helpers.panda import excel_to_db
-from db.mysql import create_mysql_engine
+from db.mysql import get_mysql_engine
 
 load_dotenv()
 
@@ -16,19 +16,18 @@ HOST = os.getenv("HOST")
 PORT = os.getenv("PORT")
 DATABASE = os.getenv("DATABASE")
 
-engine = create_mysql_engine(user=MYSQL_USER, password=MYSQL_ROOT_PASSWORD, host=HOST, port=PORT, database=DATABASE)
-context=ContextSchema(llm=None, db=engine)
+engine = get_mysql_engine(user=MYSQL_USER, password=MYSQL_ROOT_PASSWORD, host=HOST, port=PORT, database=DATABASE)
+context=ContextSchema(db=engine)
 
-agent, tools, model = build_agent(API_KEY, context=context)
-app = build_graph(agent, tools, model)
+app = build_runtime(API_KEY).graph
 
 database = excel_to_db(engine=engine)
 
-result = app.invoke({
+result = asyncio.run(app.ainvoke({
     "messages": [
         HumanMessage(content="Which region is the most profitable?")
     ]
-}, context=context)
+}, context=context))
 
 print(result["messages"][-1].content)
 print("#### INSIGHT ABAIXO ####")
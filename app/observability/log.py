@@ -0,0 +1,157 @@
+"""
+Logs estruturados (uma linha JSON por registro) sem travar o event loop.
+
+- O handler da aplicação só enfileira (QueueHandler); a serialização JSON e a
+  escrita no stderr rodam na thread do QueueListener. Fila cheia descarta o
+  registro e conta o descarte, em vez de bloquear a requisição.
+- Cada registro leva o request_id do trace ativo (observability/tracing.py).
+- Payloads verbosos passam por `log_payload`: o payload só é montado se o
+  nível está ativo e o registro foi sorteado (LOG_SAMPLE_RATE), e os campos
+  são cortados (LOG_FIELD_MAX_CHARS / LOG_LIST_MAX_ITEMS) antes de enfileirar.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from observability.tracing import current_request_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 0.05))
+LOG_FIELD_MAX_CHARS = int(os.getenv("LOG_FIELD_MAX_CHARS", 2000))
+LOG_LIST_MAX_ITEMS = int(os.getenv("LOG_LIST_MAX_ITEMS", 20))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+ROOT_LOGGER = "app"
+
+# Atributos padrão do LogRecord: o resto veio de `extra=` e vira campo do JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def cap(value, max_chars: int = LOG_FIELD_MAX_CHARS, max_items: int = LOG_LIST_MAX_ITEMS):
+    """Corta strings longas e listas/dicts grandes (recursivo) para o log ficar limitado."""
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return value[:max_chars] + f"…(+{len(value) - max_chars} chars)"
+    if isinstance(value, dict):
+        items = list(value.items())
+        capped = {str(k): cap(v, max_chars, max_items) for k, v in items[:max_items]}
+        if len(items) > max_items:
+            capped["_truncated_keys"] = len(items) - max_items
+        return capped
+    if isinstance(value, (list, tuple)):
+        capped = [cap(v, max_chars, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            capped.append(f"…(+{len(value) - max_items} itens)")
+        return capped
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return cap(str(value), max_chars, max_items)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Anexa o request_id do trace ativo (None fora de uma requisição)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id()
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enfileira sem formatar; com a fila cheia descarta e conta."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Só o necessário na thread de origem: args resolvidos e traceback em texto
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+_handler = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """Liga o handler em fila do logger da aplicação (idempotente)."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is not None:
+            return
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(JsonFormatter())
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _handler = NonBlockingQueueHandler(log_queue)
+        _handler.addFilter(RequestIdFilter())
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(level)
+        logger.addHandler(_handler)
+        logger.propagate = False
+
+
+def shutdown_logging():
+    """Escreve o que ainda está na fila e para a thread do listener."""
+    global _listener, _handler
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger(ROOT_LOGGER).removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+
+def dropped_records() -> int:
+    return _handler.dropped if _handler is not None else 0
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def log_payload(logger: logging.Logger, level: int, msg: str, build, sample_rate: float = LOG_SAMPLE_RATE):
+    """Log de payload verboso: `build()` só roda se o nível está ativo e o registro foi sorteado."""
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    logger.log(level, msg, extra={"payload": cap(build()), "sample_rate": sample_rate})
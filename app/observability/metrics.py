@@ -0,0 +1,323 @@
+"""
+Métricas no formato de exposição do Prometheus (texto 0.0.4), sem dependência.
+
+- Counter / Gauge / Histogram com labels; cada série tem seu próprio lock,
+  então uma observação custa um bisect + um lock sem disputa (microssegundos).
+- Coletores de leitura (callback) para o que já é contado em outro lugar
+  (caches, pools): nenhum custo no caminho quente, lidos só no scrape.
+
+    from observability.metrics import SQL_EXECUTION_SECONDS
+    SQL_EXECUTION_SECONDS.labels("mysql").observe(0.12)
+"""
+
+import bisect
+import math
+import threading
+import time
+from observability.log import get_logger
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Segundos: de consultas em cache (~ms) a passadas do LLM (dezenas de s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+# Espera por conexão livre: quase sempre ~0, o que importa é a cauda
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+logger = get_logger(__name__)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Série para os valores de label (criada na primeira vez, depois só um dict.get)."""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperava labels {self.labelnames}, recebeu {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_label_text(labelnames, values)} {_format_value(self.value)}"]
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def track(self):
+        """Context manager: +1 ao entrar, -1 ao sair (requisições em andamento)."""
+        return _Tracked(self)
+
+
+class _Tracked:
+    __slots__ = ("gauge",)
+
+    def __init__(self, gauge: _GaugeChild):
+        self.gauge = gauge
+
+    def __enter__(self):
+        self.gauge.inc()
+
+    def __exit__(self, *exc):
+        self.gauge.dec()
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # último = +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager que observa a duração do bloco em segundos."""
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = _label_text(labelnames, values, f'le="{_format_value(bound)}"')
+            lines.append(f"{name}_bucket{le} {cumulative}")
+        labels = _label_text(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: _HistogramChild):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+    def track(self):
+        return self._default.track()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+
+class CallbackMetric:
+    """Série lida no scrape: `collect()` devolve [(valores dos labels, valor)]."""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: tuple, collect):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        try:
+            samples = self.collect()
+        except Exception as e:
+            # Um coletor quebrado não derruba o /metrics inteiro
+            logger.warning("metric collector failed", extra={"metric": self.name, "error": str(e)})
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in samples:
+            lines.append(f"{self.name}{_label_text(self.labelnames, tuple(values))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Reimportar o módulo (reload do uvicorn) não duplica a série
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def register_callback(name: str, documentation: str, kind: str, labelnames: tuple, collect) -> CallbackMetric:
+    return REGISTRY.register(CallbackMetric(name, documentation, kind, labelnames, collect))
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# Métricas da aplicação (nomes estáveis: dashboards dependem deles)
+REQUESTS_IN_FLIGHT = gauge("copilot_requests_in_flight", "Requisições HTTP em andamento")
+REQUEST_SECONDS = histogram("copilot_request_seconds", "Duração das requisições HTTP", ("route", "status"))
+GRAPH_NODE_SECONDS = histogram(
+    "copilot_graph_node_seconds",
+    "Duração de cada nó do grafo (agent_pass, narrative_pass, tools)",
+    ("node",),
+)
+SQL_EXECUTION_SECONDS = histogram("copilot_sql_execution_seconds", "Execução + leitura do SQL no banco", ("backend",))
+SQL_ROWS_RETURNED = histogram("copilot_sql_rows_returned", "Linhas devolvidas por consulta", ("backend",), ROW_BUCKETS)
+SQL_QUERIES = counter("copilot_sql_queries_total", "Consultas da tool SQL por desfecho", ("outcome",))
+LLM_TOKENS = counter("copilot_llm_tokens_total", "Tokens do LLM por passada e tipo", ("pass", "type"))
+POOL_CHECKOUT_SECONDS = histogram(
+    "copilot_db_pool_checkout_seconds",
+    "Espera por uma conexão livre no pool",
+    (),
+    POOL_WAIT_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: requisições em andamento e duração por rota (inclui o corpo em streaming)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        # Chegada da requisição (antes do parse do corpo), lida pelo trace da rota
+        scope.setdefault("state", {})["received_ns"] = time.time_ns()
+        with REQUESTS_IN_FLIGHT.track():
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # Template da rota (/api/chat/{chat_id}), não o path: cardinalidade fixa
+                route = getattr(scope.get("route"), "path", "unmatched")
+                REQUEST_SECONDS.labels(route, status).observe(time.perf_counter() - start)
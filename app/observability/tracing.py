@@ -0,0 +1,277 @@
+"""
+Trace por requisição: árvore de spans (cascata) de cada /api/ask.
+
+- `start_trace(request_id, ...)` abre o span raiz e ativa o trace no contexto
+  (contextvars: segue para as tasks do LangGraph sem passar nada adiante).
+- `span(nome, **atributos)` mede um trecho; sem trace ativo é um no-op.
+- Traces concluídos ficam num buffer circular (TRACE_BUFFER_SIZE) e, se
+  TRACE_EXPORT_PATH estiver definido, são gravados em JSONL no formato
+  OTLP/JSON por uma thread de fundo (fora do caminho da requisição).
+"""
+
+import hashlib
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 500))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "olist-sql-agent")
+
+_current_trace = ContextVar("current_trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # Gerador (stream) finalizado em outro contexto: nada a restaurar
+        pass
+
+
+def sql_hash(sql: str) -> str:
+    """Identificador curto do SQL (agrupa execuções da mesma consulta sem guardar o texto)."""
+    return hashlib.sha256(" ".join(sql.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def current_request_id() -> str | None:
+    """request_id do trace ativo (None fora de uma requisição rastreada)."""
+    trace = _current_trace.get()
+    return trace.request_id if trace is not None else None
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, name: str, parent_id: str | None, attributes: dict, start_ns: int | None = None):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = "ok"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    def set(self, **attributes):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []  # na ordem de término (list.append é atômico entre tasks/threads)
+        self.root = None
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms if self.root is not None else 0.0
+
+    def waterfall(self) -> dict:
+        """Spans ordenados pelo início, com deslocamento e profundidade para a cascata."""
+        origin = self.root.start_ns if self.root is not None else 0
+        depth = {}
+        spans = []
+        # Mesmo início: o span mais longo (o pai) vem primeiro
+        for span in sorted(self.spans, key=lambda s: (s.start_ns, -(s.end_ns or 0))):
+            depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+            spans.append({
+                "name": span.name,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "depth": depth[span.span_id],
+                "offset_ms": round((span.start_ns - origin) / 1e6, 3),
+                "duration_ms": round(span.duration_ms, 3),
+                "status": span.status,
+                "attributes": span.attributes,
+            })
+        return {
+            "request_id": self.request_id,
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": spans,
+        }
+
+
+@contextmanager
+def span(name: str, start_ns: int | None = None, **attributes):
+    """Span filho do span atual; sem trace ativo devolve um span que ignora tudo."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+    current = Span(name, _current_span.get(), attributes, start_ns)
+    token = _current_span.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _reset(_current_span, token)
+        trace.spans.append(current)
+
+
+def record_span(name: str, start_ns: int, end_ns: int | None = None, **attributes):
+    """Span já concluído (ex.: trecho medido antes do trace existir)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    done = Span(name, _current_span.get(), attributes, start_ns)
+    done.end_ns = end_ns or time.time_ns()
+    trace.spans.append(done)
+
+
+@contextmanager
+def start_trace(request_id: str, name: str, start_ns: int | None = None, **attributes):
+    """Abre o trace da requisição; ao sair guarda no buffer e exporta (se configurado)."""
+    trace = Trace(request_id)
+    trace_token = _current_trace.set(trace)
+    try:
+        with span(name, start_ns, request_id=request_id, **attributes) as root:
+            trace.root = root
+            yield root
+    finally:
+        _reset(_current_trace, trace_token)
+        get_trace_store().add(trace)
+
+
+class TraceStore:
+    """Buffer circular dos últimos traces, indexado pelo request_id."""
+
+    def __init__(self, max_traces: int = TRACE_BUFFER_SIZE, exporter=None):
+        self.max_traces = max_traces
+        self.exporter = exporter
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.request_id] = trace
+            self._traces.move_to_end(trace.request_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        if self.exporter is not None:
+            self.exporter.submit(trace)
+
+    def get(self, request_id: str) -> Trace | None:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 50, slowest: bool = False) -> list[dict]:
+        with self._lock:
+            traces = list(self._traces.values())
+        traces = sorted(traces, key=lambda t: t.duration_ms, reverse=True) if slowest else traces[::-1]
+        return [
+            {
+                "request_id": t.request_id,
+                "trace_id": t.trace_id,
+                "name": t.root.name if t.root is not None else None,
+                "duration_ms": round(t.duration_ms, 3),
+                "spans": len(t.spans),
+            }
+            for t in traces[:limit]
+        ]
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> dict:
+    """Trace no formato OTLP/JSON (ExportTraceServiceRequest), legível pelo file receiver do Collector."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "olist-sql-agent.tracing"},
+                "spans": [
+                    {
+                        "traceId": trace.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        "kind": 2 if s.parent_id is None else 1,  # SERVER na raiz, INTERNAL nos demais
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": 2 if s.status == "error" else 1},
+                    }
+                    for s in trace.spans
+                ],
+            }],
+        }]
+    }
+
+
+class OtlpFileExporter:
+    """Grava cada trace como uma linha OTLP/JSON; a escrita roda numa thread própria."""
+
+    def __init__(self, path: str):
+        # Import local: observability/log.py importa este módulo (request_id)
+        from observability.log import get_logger
+
+        self.logger = get_logger(__name__)
+        self.path = Path(path)
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def submit(self, trace: Trace):
+        self._queue.put(trace)
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                # Dentro do try: diretório inválido não mata a thread (a fila cresceria sem fim)
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(to_otlp(trace), ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                # Thread do exportador não tem trace ativo: request_id explícito
+                self.logger.warning("trace export failed", extra={"request_id": trace.request_id, "error": str(e)})
+
+
+_trace_store = None
+_trace_store_lock = threading.Lock()
+
+
+def get_trace_store() -> TraceStore:
+    """Buffer de traces compartilhado pelo processo."""
+    global _trace_store
+    if _trace_store is None:
+        with _trace_store_lock:
+            if _trace_store is None:
+                exporter = OtlpFileExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+                _trace_store = TraceStore(exporter=exporter)
+    return _trace_store
@@ -0,0 +1,157 @@
+"""
+Codificação compacta do resultado SQL para o LLM.
+
+Em vez do repr de uma lista de dicts (nome de coluna repetido em toda
+linha, Decimal('12.3400'), datetime.datetime(...)), gera uma tabela com
+cabeçalho único (TSV ou markdown), números arredondados, strings repetidas
+codificadas por dicionário e um bloco opcional de resumo numérico.
+"""
+
+import json
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, time as dtime
+from decimal import Decimal
+from graph.prompts import count_tokens
+
+SQL_RESULT_FORMAT = os.getenv("SQL_RESULT_FORMAT", "tsv")  # tsv | markdown | json (legado)
+SQL_RESULT_DECIMALS = int(os.getenv("SQL_RESULT_DECIMALS", 2))
+SQL_SUMMARY_MIN_ROWS = int(os.getenv("SQL_SUMMARY_MIN_ROWS", 10))
+
+# Dicionário só compensa com bastante repetição de strings longas
+DICT_MIN_ROWS = 8
+DICT_MIN_AVG_LENGTH = 6
+DICT_MAX_DISTINCT_RATIO = 0.5
+
+
+@dataclass
+class EncodedResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+    def stats(self) -> dict:
+        saved = self.tokens_before - self.tokens_after
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved_pct": round(saved / self.tokens_before * 100, 1) if self.tokens_before else 0.0,
+        }
+
+
+def legacy_text(payload: dict) -> str:
+    """Como o LangChain serializaria o dict da tool (JSON, ou repr se não der)."""
+    try:
+        return json.dumps(payload, ensure_ascii=False)
+    except (TypeError, ValueError):
+        return str(payload)
+
+
+def format_value(value, decimals: int = SQL_RESULT_DECIMALS) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, (float, Decimal)):
+        text = f"{round(float(value), decimals):.{decimals}f}"
+        return text.rstrip("0").rstrip(".") if "." in text else text
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d") if value.time() == dtime() else value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+def _dictionary(column: str, cells: list[str]) -> dict[str, str] | None:
+    """Códigos (~0, ~1, ...) para uma coluna de strings repetidas, se reduzir o texto."""
+    if len(cells) < DICT_MIN_ROWS:
+        return None
+    counts = Counter(c for c in cells if c != "null")
+    if len(counts) > len(cells) * DICT_MAX_DISTINCT_RATIO:
+        return None
+    if sum(len(c) for c in cells) / len(cells) < DICT_MIN_AVG_LENGTH:
+        return None
+
+    # Compara em tokens (não caracteres): palavras comuns já são 1 token
+    codes = {value: f"~{i}" for i, (value, _) in enumerate(counts.most_common())}
+    before = count_tokens("\n".join(cells))
+    legend = "; ".join(f"{code}={value}" for value, code in codes.items())
+    after = count_tokens("\n".join(codes.get(c, c) for c in cells)) + count_tokens(legend)
+    return codes if after < before * 0.8 else None
+
+
+def _summary(columns: list[str], rows: list[dict], decimals: int) -> list[str]:
+    lines = []
+    for column in columns:
+        values = [row[column] for row in rows if row[column] is not None]
+        if not values or not all(_is_number(v) for v in values):
+            continue
+        numbers = [float(v) for v in values]
+        total = sum(numbers)
+        lines.append(
+            f"{column}: min={format_value(min(numbers), decimals)} max={format_value(max(numbers), decimals)} "
+            f"sum={format_value(total, decimals)} avg={format_value(total / len(numbers), decimals)}"
+        )
+    return lines
+
+
+def encode_rows(
+    rows: list[dict],
+    truncated: dict | None = None,
+    fmt: str = SQL_RESULT_FORMAT,
+    decimals: int = SQL_RESULT_DECIMALS,
+    summary: bool = True
+) -> EncodedResult:
+    """Codifica as linhas e mede os tokens antes (repr/JSON legado) e depois."""
+    legacy = {"response": rows}
+    if truncated:
+        legacy["truncated"] = truncated
+    tokens_before = count_tokens(legacy_text(legacy))
+
+    if fmt == "json":
+        text = legacy_text(legacy)
+        return EncodedResult(text, tokens_before, tokens_before)
+
+    columns = list(rows[0].keys()) if rows else []
+    lines = [f"rows: {len(rows)} | columns: {len(columns)}"]
+
+    table = [[format_value(row[c], decimals) for c in columns] for row in rows]
+    for index, column in enumerate(columns):
+        if any(_is_number(row[column]) for row in rows):
+            continue
+        codes = _dictionary(column, [cells[index] for cells in table])
+        if codes:
+            lines.append(f"dict {column}: " + "; ".join(f"{code}={value}" for value, code in codes.items()))
+            for cells in table:
+                cells[index] = codes.get(cells[index], cells[index])
+
+    if fmt == "markdown":
+        lines.append("| " + " | ".join(columns) + " |")
+        lines.append("|" + "---|" * len(columns))
+        lines.extend("| " + " | ".join(c.replace("|", "\\|") for c in cells) + " |" for cells in table)
+    else:
+        lines.append("\t".join(columns))
+        lines.extend("\t".join(cells) for cells in table)
+
+    if summary and len(rows) >= SQL_SUMMARY_MIN_ROWS:
+        summary_lines = _summary(columns, rows, decimals)
+        if summary_lines:
+            lines.append(f"summary (n={len(rows)}):")
+            lines.extend(summary_lines)
+
+    if truncated:
+        total = truncated.get("estimated_total")
+        lines.append(
+            f"TRUNCATED ({truncated.get('reason')} budget): showing {truncated.get('rows_returned')} rows"
+            + (f" of ~{total}" if total else "; more rows exist")
+        )
+
+    text = "\n".join(lines)
+    return EncodedResult(text, tokens_before, count_tokens(text))
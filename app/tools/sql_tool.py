@@ -1,6 +1,19 @@
+import asyncio
+import os
+import time
+from langchain.tools import ToolRuntime
 from langchain_core.tools import tool
-from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
+from db.backends import BackendError, FetchResult, MySQLBackend
+from db.cost_guard import QueryTooExpensive
+from db.executor import run_blocking
+from db.sql_guard import SqlValidationError, parse_query
+from graph.deadline import RequestCancelled
+from graph.state import ContextSchema
+from observability.metrics import GRAPH_NODE_SECONDS, SQL_EXECUTION_SECONDS, SQL_QUERIES, SQL_ROWS_RETURNED
+from observability.log import get_logger
+from observability.tracing import span, sql_hash
+from tools.result_encoder import EncodedResult, encode_rows
 from domain.olist_ecommerce import (
     OLIST_SCHEMA, 
     OLIST_METRICS, 
@@ -8,33 +21,184 @@ from domain.olist_ecommerce import (
     OLIST_QUERY_EXAMPLES
 )
 
-def build_sql_tool(context):
-    """Factory to create Olist-specialized SQL tool with context injected."""
-    
-    @tool
-    def do_sql_query(query: str):
-        """Execute an optimized SQL query on Olist Brazilian E-Commerce database."""
+# Orçamento de leitura por consulta: o resultado vai inteiro para o prompt
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", 500))
+SQL_MAX_BYTES = int(os.getenv("SQL_MAX_BYTES", 64 * 1024))
+# Teto de tempo por consulta aceita (hint MAX_EXECUTION_TIME no MySQL)
+SQL_MAX_EXECUTION_MS = int(os.getenv("SQL_MAX_EXECUTION_MS", 15000))
 
-        raw_engine = context.db
-        sql = (query or "").strip().rstrip(";")
+logger = get_logger("sql_tool")
 
-        if not sql:
-            return {"response": "SQL vazio. Envie uma consulta SELECT."}
 
-        sql_lower = sql.lstrip().lower()
-        if not (sql_lower.startswith("select") or sql_lower.startswith("with")):
-            return {"response": "Somente consultas SELECT são permitidas."}
+def request_backend(context: ContextSchema):
+    """Backend da requisição; sem backend explícito, MySQL pelos engines do contexto."""
+    if context.backend is not None:
+        return context.backend
+    return MySQLBackend(context.db, context.async_db)
 
-        if "limit" not in sql_lower:
-            sql = f"{sql} LIMIT 100"
 
+async def cached_rows(cache, backend, sql: str):
+    """Consulta o cache de resultados (relendo a versão do dataset se expirou)."""
+    if cache.version_is_stale():
+        await run_blocking(cache.refresh_version, backend)
+    # Com camada em disco a leitura é I/O: vai para o pool de threads
+    if cache.disk_dir:
+        return await run_blocking(cache.get, sql)
+    return cache.get(sql)
+
+
+def estimate_total(limit: int | None, fetched: FetchResult) -> int | None:
+    """Estimativa do total quando o resultado foi cortado (limite externo, se houver)."""
+    if limit is not None:
+        return max(limit, fetched.rows_seen)
+    return None
+
+
+def execution_limit_ms(deadline) -> int:
+    """MAX_EXECUTION_TIME: o teto configurado ou o que resta do prazo da requisição."""
+    if deadline is None:
+        return SQL_MAX_EXECUTION_MS
+    return max(int(deadline.timeout(SQL_MAX_EXECUTION_MS / 1000) * 1000), 1)
+
+
+async def fetch_within_deadline(backend, sql: str, deadline) -> FetchResult:
+    """Leitura limitada ao prazo da requisição; ao estourar, cancela a consulta no servidor."""
+    fetch = backend.fetch(sql, max_rows=SQL_MAX_ROWS, max_bytes=SQL_MAX_BYTES, deadline=deadline)
+    if deadline is None:
+        return await fetch
+    try:
+        return await asyncio.wait_for(fetch, deadline.timeout())
+    except asyncio.TimeoutError:
+        await run_blocking(deadline.cancel, "deadline")
+        raise RequestCancelled("deadline")
+
+
+def tool_response(fetched: FetchResult) -> EncodedResult:
+    """Resposta da tool: tabela compacta e, se cortado, os metadados do corte para o LLM."""
+    with span("sql.encode", rows=len(fetched.rows)) as encode_span:
+        encoded = encode_rows(fetched.rows, fetched.metadata() if fetched.truncated else None)
+        encode_span.set(tokens_before=encoded.tokens_before, tokens_after=encoded.tokens_after)
+    logger.debug("result encoded", extra={"tokens_before": encoded.tokens_before, "tokens_after": encoded.tokens_after})
+    return encoded
+
+
+@tool
+async def do_sql_query(query: str, runtime: ToolRuntime[ContextSchema]):
+    """Execute an optimized SQL query on Olist Brazilian E-Commerce database."""
+    with span("tool.do_sql_query", sql_hash=sql_hash(query)) as tool_span:
+        try:
+            with span("sql.validate"):
+                parsed = parse_query(query)
+        except SqlValidationError as e:
+            SQL_QUERIES.labels("invalid").inc()
+            tool_span.set(outcome="invalid")
+            return {"response": str(e)}
+        sql = parsed.sql
+
+        # Engine vem do contexto da execução (por requisição), não de closure
+        context = runtime.context
+        backend = request_backend(context)
+        cache = context.sql_cache
+        deadline = context.deadline
+        start = time.perf_counter()
         try:
-            with raw_engine.connect() as conn:
-                result = conn.execute(text(sql))
-                rows = result.mappings().all()
+            if deadline is not None:
+                deadline.check()
+            fetched = None
+            if cache is not None:
+                with span("sql.cache_lookup") as cache_span:
+                    fetched = await cached_rows(cache, backend, sql)
+                    cache_span.set(hit=fetched is not None)
+            if fetched is not None:
+                SQL_QUERIES.labels("cached").inc()
+                tool_span.set(outcome="cached", rows=len(fetched.rows))
+                encoded = tool_response(fetched)
+                runtime.stream_writer({
+                    "event": "sql_result",
+                    "rows": len(fetched.rows),
+                    "sql_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "cached": True,
+                    "truncated": fetched.truncated,
+                    **encoded.stats()
+                })
+                return encoded.text
+
+            # Consultas agregadas elegíveis leem dos rollups (mesmo resultado, menos linhas)
+            routed = context.rollup_router.rewrite(sql) if context.rollup_router is not None else None
+            executed_sql, rollup = routed if routed else (sql, None)
+            if rollup:
+                logger.info("rollup rewrite", extra={"rollup": rollup})
 
-            return {"response": rows}
-        except SQLAlchemyError as e:
+            # EXPLAIN antes de executar: consultas caras voltam para o agente reescrever
+            if context.cost_guard is not None:
+                with span("sql.explain") as explain_span:
+                    estimate = await run_blocking(context.cost_guard.check, backend, executed_sql)
+                    if estimate is not None:
+                        explain_span.set(rows_examined=estimate.rows_examined)
+                if estimate is not None:
+                    logger.debug("planner estimate", extra={"rows_examined": estimate.rows_examined})
+            executed_sql = backend.with_time_limit(executed_sql, execution_limit_ms(deadline))
+
+            # SQL no dialeto MySQL; o backend traduz se precisar (ex.: DuckDB).
+            # Leitura em streaming com orçamento: memória constante seja qual for o SQL
+            execution_start = time.perf_counter()
+            with span("sql.execute", backend=backend.name, rollup=rollup or "") as execute_span:
+                fetched = await fetch_within_deadline(backend, executed_sql, deadline)
+                execute_span.set(rows=len(fetched.rows), truncated=fetched.truncated)
+            SQL_EXECUTION_SECONDS.labels(backend.name).observe(time.perf_counter() - execution_start)
+            SQL_ROWS_RETURNED.labels(backend.name).observe(len(fetched.rows))
+            SQL_QUERIES.labels("executed").inc()
+            tool_span.set(outcome="executed", rows=len(fetched.rows))
+            if fetched.truncated:
+                fetched.estimated_total = estimate_total(parsed.limit, fetched)
+                logger.info("result truncated", extra={
+                    "reason": fetched.reason, "rows": len(fetched.rows), "estimated_total": fetched.estimated_total
+                })
+
+            if cache is not None:
+                if cache.disk_dir:
+                    await run_blocking(cache.put, sql, fetched)
+                else:
+                    cache.put(sql, fetched)
+
+            # Progresso para o endpoint de streaming (no-op fora de stream_mode="custom")
+            encoded = tool_response(fetched)
+            runtime.stream_writer({
+                "event": "sql_result",
+                "rows": len(fetched.rows),
+                "sql_ms": round((time.perf_counter() - start) * 1000, 1),
+                "cached": False,
+                "rollup": rollup,
+                "truncated": fetched.truncated,
+                **encoded.stats()
+            })
+            return encoded.text
+        except QueryTooExpensive as e:
+            SQL_QUERIES.labels("rejected").inc()
+            tool_span.set(outcome="rejected")
+            logger.warning("query rejected by cost guard", extra={"rows_examined": e.estimate.rows_examined})
+            runtime.stream_writer({
+                "event": "sql_rejected",
+                "rows_examined": e.estimate.rows_examined,
+                "sql_ms": round((time.perf_counter() - start) * 1000, 1)
+            })
+            return {"response": str(e)}
+        except (SQLAlchemyError, BackendError) as e:
+            if deadline is not None and deadline.cancelled:
+                # Erro provocado pelo KILL QUERY/interrupt: a requisição já foi abandonada
+                raise RequestCancelled(deadline.reason) from e
+            SQL_QUERIES.labels("error").inc()
+            tool_span.set(outcome="error")
+            runtime.stream_writer({
+                "event": "sql_error",
+                "sql_ms": round((time.perf_counter() - start) * 1000, 1)
+            })
             return {"response": f"Erro SQL: {str(e)}"}
+        finally:
+            # Nó "tools" do grafo: cache, EXPLAIN, execução e serialização
+            GRAPH_NODE_SECONDS.labels("tools").observe(time.perf_counter() - start)
+
 
-    return do_sql_query
\ No newline at end of file
+def build_sql_tool():
+    """Retorna a tool SQL do Olist (o engine chega via contexto do LangGraph)."""
+    return do_sql_query
@@ -2,14 +2,28 @@
 """
 Script de Setup do Database Olist
 - Verifica se as tabelas existem
-- Importa arquivos CSV
+- Cria as tabelas com schema tipado (PKs/FKs) e importa os CSVs
+  em paralelo, lendo em blocos (memória limitada)
+- Manifesto de carga: CSVs inalterados são pulados; alterados são
+  sincronizados por chave primária (upsert/delete)
 - Aplica índices de performance
+- Materializa tabelas de agregação (rollups)
+- DB_BACKEND=duckdb: gera um banco DuckDB embarcado com os mesmos CSVs
+  (sem MySQL)
+- Exporta um snapshot Parquet (orders/items particionados por mês da compra)
 """
 
+import hashlib
 import os
+import re
+import shutil
 import sys
+import time
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
+from uuid import uuid4
 from sqlalchemy import create_engine, text, inspect
 from dotenv import load_dotenv
 
@@ -30,6 +44,213 @@ if not DATA_DIR.exists():
 
 print(f"🔍 Procurando dados em: {DATA_DIR}")
 
+# Backend da API: mysql (padrão) ou duckdb (arquivo embarcado, offline)
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+DUCKDB_PATH = Path(os.getenv("DUCKDB_PATH") or DATA_DIR / "olist.duckdb")
+
+# Snapshot Parquet lido por app/db/parquet.py (hive: purchase_month=YYYY-MM)
+PARQUET_DIR = Path(os.getenv("PARQUET_DIR") or DATA_DIR / "parquet")
+PARQUET_PARTITIONED = {"olist_orders_dataset", "olist_order_items_dataset"}
+
+# Carimbo de versão do dataset (lido pela API para invalidar o cache de SQL)
+DATASET_VERSION_TABLE = "copilot_dataset_version"
+
+# Manifesto de carga: tamanho, mtime e hash de cada CSV importado
+LOAD_MANIFEST_TABLE = "copilot_load_manifest"
+
+# Schema tipado das tabelas Olist: colunas, PK e FKs.
+# Tabelas fora deste mapa caem no import genérico via pandas.
+TABLE_SCHEMAS = {
+    "olist_customers_dataset": {
+        "columns": [
+            ("customer_id", "CHAR(32) NOT NULL"),
+            ("customer_unique_id", "CHAR(32) NOT NULL"),
+            ("customer_zip_code_prefix", "CHAR(5) NOT NULL"),
+            ("customer_city", "VARCHAR(64) NOT NULL"),
+            ("customer_state", "CHAR(2) NOT NULL"),
+        ],
+        "primary_key": ["customer_id"],
+    },
+    "olist_sellers_dataset": {
+        "columns": [
+            ("seller_id", "CHAR(32) NOT NULL"),
+            ("seller_zip_code_prefix", "CHAR(5) NOT NULL"),
+            ("seller_city", "VARCHAR(64) NOT NULL"),
+            ("seller_state", "CHAR(2) NOT NULL"),
+        ],
+        "primary_key": ["seller_id"],
+    },
+    "product_category_name_translation": {
+        "columns": [
+            ("product_category_name", "VARCHAR(64) NOT NULL"),
+            ("product_category_name_english", "VARCHAR(64) NOT NULL"),
+        ],
+        "primary_key": ["product_category_name"],
+    },
+    "olist_products_dataset": {
+        "columns": [
+            ("product_id", "CHAR(32) NOT NULL"),
+            # Sem FK para a tradução: há categorias sem tradução no dataset
+            ("product_category_name", "VARCHAR(64) NULL"),
+            ("product_name_lenght", "SMALLINT UNSIGNED NULL"),
+            ("product_description_lenght", "SMALLINT UNSIGNED NULL"),
+            ("product_photos_qty", "TINYINT UNSIGNED NULL"),
+            ("product_weight_g", "INT UNSIGNED NULL"),
+            ("product_length_cm", "SMALLINT UNSIGNED NULL"),
+            ("product_height_cm", "SMALLINT UNSIGNED NULL"),
+            ("product_width_cm", "SMALLINT UNSIGNED NULL"),
+        ],
+        "primary_key": ["product_id"],
+    },
+    "olist_orders_dataset": {
+        "columns": [
+            ("order_id", "CHAR(32) NOT NULL"),
+            ("customer_id", "CHAR(32) NOT NULL"),
+            ("order_status", "VARCHAR(16) NOT NULL"),
+            ("order_purchase_timestamp", "DATETIME NOT NULL"),
+            ("order_approved_at", "DATETIME NULL"),
+            ("order_delivered_carrier_date", "DATETIME NULL"),
+            ("order_delivered_customer_date", "DATETIME NULL"),
+            ("order_estimated_delivery_date", "DATETIME NULL"),
+        ],
+        "primary_key": ["order_id"],
+        "foreign_keys": [("customer_id", "olist_customers_dataset", "customer_id")],
+    },
+    "olist_order_items_dataset": {
+        "columns": [
+            ("order_id", "CHAR(32) NOT NULL"),
+            ("order_item_id", "SMALLINT UNSIGNED NOT NULL"),
+            ("product_id", "CHAR(32) NOT NULL"),
+            ("seller_id", "CHAR(32) NOT NULL"),
+            ("shipping_limit_date", "DATETIME NOT NULL"),
+            ("price", "DECIMAL(10,2) NOT NULL"),
+            ("freight_value", "DECIMAL(10,2) NOT NULL"),
+        ],
+        "primary_key": ["order_id", "order_item_id"],
+        "foreign_keys": [
+            ("order_id", "olist_orders_dataset", "order_id"),
+            ("product_id", "olist_products_dataset", "product_id"),
+            ("seller_id", "olist_sellers_dataset", "seller_id"),
+        ],
+    },
+    "olist_order_payments_dataset": {
+        "columns": [
+            ("order_id", "CHAR(32) NOT NULL"),
+            ("payment_sequential", "SMALLINT UNSIGNED NOT NULL"),
+            ("payment_type", "VARCHAR(16) NOT NULL"),
+            ("payment_installments", "SMALLINT UNSIGNED NOT NULL"),
+            ("payment_value", "DECIMAL(10,2) NOT NULL"),
+        ],
+        "primary_key": ["order_id", "payment_sequential"],
+        "foreign_keys": [("order_id", "olist_orders_dataset", "order_id")],
+    },
+    "olist_order_reviews_dataset": {
+        "columns": [
+            ("review_id", "CHAR(32) NOT NULL"),
+            ("order_id", "CHAR(32) NOT NULL"),
+            ("review_score", "TINYINT UNSIGNED NOT NULL"),
+            ("review_comment_title", "VARCHAR(255) NULL"),
+            ("review_comment_message", "TEXT NULL"),
+            ("review_creation_date", "DATETIME NOT NULL"),
+            ("review_answer_timestamp", "DATETIME NOT NULL"),
+        ],
+        # review_id se repete entre pedidos no dataset original
+        "primary_key": ["review_id", "order_id"],
+        "foreign_keys": [("order_id", "olist_orders_dataset", "order_id")],
+    },
+    "olist_geolocation_dataset": {
+        "columns": [
+            ("geolocation_zip_code_prefix", "CHAR(5) NOT NULL"),
+            ("geolocation_lat", "DOUBLE NOT NULL"),
+            ("geolocation_lng", "DOUBLE NOT NULL"),
+            ("geolocation_city", "VARCHAR(100) NOT NULL"),
+            ("geolocation_state", "CHAR(2) NOT NULL"),
+        ],
+        # Vários pontos por CEP: sem chave natural
+        "primary_key": [],
+    },
+}
+
+# Linhas por INSERT multi-row no fallback (sem LOAD DATA LOCAL INFILE)
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", 10000))
+# Linhas lidas do CSV por bloco (pandas) e tabelas importadas em paralelo
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", 100000))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 4))
+
+# Rollups mensais usados pelo roteador de consultas da API (app/db/rollups.py).
+# Grão comum: mês da compra x status do pedido x UF do cliente.
+ORDERS_SOURCE = """
+    FROM olist_orders_dataset o
+    JOIN olist_customers_dataset c ON c.customer_id = o.customer_id
+"""
+ROLLUPS = {
+    # Um registro por pedido antes de agregar: itens e reviews pré-agregados por pedido
+    "rollup_orders_monthly": f"""
+        SELECT
+            DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m') AS purchase_month,
+            o.order_status,
+            c.customer_state,
+            IF(o.order_delivered_customer_date > o.order_estimated_delivery_date, 1, 0) AS is_late,
+            COUNT(*) AS order_count,
+            COUNT(i.order_id) AS orders_with_items,
+            COALESCE(SUM(i.item_count), 0) AS item_count,
+            SUM(i.sum_price) AS sum_price,
+            SUM(i.sum_freight) AS sum_freight,
+            COUNT(o.order_delivered_customer_date) AS delivered_count,
+            SUM(DATEDIFF(o.order_delivered_customer_date, o.order_purchase_timestamp)) AS sum_delivery_days,
+            SUM(DATEDIFF(o.order_delivered_customer_date, o.order_estimated_delivery_date)) AS sum_delay_days,
+            COUNT(r.order_id) AS orders_with_reviews,
+            COALESCE(SUM(r.review_count), 0) AS review_count,
+            SUM(r.review_sum) AS review_sum
+        {ORDERS_SOURCE}
+        LEFT JOIN (
+            SELECT order_id, COUNT(*) AS item_count, SUM(price) AS sum_price, SUM(freight_value) AS sum_freight
+            FROM olist_order_items_dataset
+            GROUP BY order_id
+        ) i ON i.order_id = o.order_id
+        LEFT JOIN (
+            SELECT order_id, COUNT(review_score) AS review_count, SUM(review_score) AS review_sum
+            FROM olist_order_reviews_dataset
+            GROUP BY order_id
+        ) r ON r.order_id = o.order_id
+        GROUP BY 1, 2, 3, 4
+    """,
+    "rollup_items_monthly": f"""
+        SELECT
+            DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m') AS purchase_month,
+            o.order_status,
+            c.customer_state,
+            t.product_category_name_english,
+            COUNT(*) AS item_count,
+            COUNT(DISTINCT oi.order_id) AS order_count,
+            SUM(oi.price) AS sum_price,
+            SUM(oi.freight_value) AS sum_freight,
+            SUM(p.product_photos_qty) AS sum_photos,
+            COUNT(p.product_photos_qty) AS photo_items
+        FROM olist_order_items_dataset oi
+        JOIN olist_orders_dataset o ON o.order_id = oi.order_id
+        JOIN olist_customers_dataset c ON c.customer_id = o.customer_id
+        LEFT JOIN olist_products_dataset p ON p.product_id = oi.product_id
+        LEFT JOIN product_category_name_translation t ON t.product_category_name = p.product_category_name
+        GROUP BY 1, 2, 3, 4
+    """,
+    "rollup_payments_monthly": f"""
+        SELECT
+            DATE_FORMAT(o.order_purchase_timestamp, '%Y-%m') AS purchase_month,
+            o.order_status,
+            c.customer_state,
+            pay.payment_type,
+            COUNT(*) AS payment_count,
+            COUNT(DISTINCT pay.order_id) AS order_count,
+            SUM(pay.payment_value) AS sum_payment_value,
+            SUM(pay.payment_installments) AS sum_installments
+        FROM olist_order_payments_dataset pay
+        JOIN olist_orders_dataset o ON o.order_id = pay.order_id
+        JOIN olist_customers_dataset c ON c.customer_id = o.customer_id
+        GROUP BY 1, 2, 3, 4
+    """,
+}
+
 
 def create_connection(user, password, database):
     """Cria conexão com MySQL usando um database específico."""
@@ -38,7 +259,9 @@ def create_connection(user, password, database):
         connection_string,
         pool_pre_ping=True,
         pool_recycle=3600,
-        echo=False
+        pool_size=max(5, IMPORT_WORKERS),  # Uma conexão por tabela em importação
+        echo=False,
+        connect_args={"local_infile": True}  # LOAD DATA LOCAL INFILE
     )
     return engine
 
@@ -111,56 +334,488 @@ def table_exists(engine, table_name):
     return table_name in inspector.get_table_names()
 
 
-def import_csv(engine, csv_file, table_name):
-    """Importa um arquivo CSV para o banco de dados."""
+def create_table_sql(table_name):
+    """DDL tipado da tabela a partir de TABLE_SCHEMAS."""
+    schema = TABLE_SCHEMAS[table_name]
+    lines = [f"`{name}` {sql_type}" for name, sql_type in schema["columns"]]
+    if schema["primary_key"]:
+        lines.append(f"PRIMARY KEY ({', '.join(schema['primary_key'])})")
+    for column, ref_table, ref_column in schema.get("foreign_keys", []):
+        lines.append(f"FOREIGN KEY ({column}) REFERENCES {ref_table}({ref_column})")
+    body = ",\n    ".join(lines)
+    return f"CREATE TABLE {table_name} (\n    {body}\n) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+
+
+def read_csv_header(csv_file):
+    """Colunas do cabeçalho e terminador de linha do CSV."""
+    with open(csv_file, "rb") as f:
+        first_line = f.readline()
+    terminator = "\r\n" if first_line.endswith(b"\r\n") else "\n"
+    header = first_line.decode("utf-8-sig").strip()
+    columns = [c.strip().strip('"') for c in header.split(",")]
+    return columns, terminator
+
+
+def _column_types(table_name):
+    return dict(TABLE_SCHEMAS[table_name]["columns"])
+
+
+def load_data_infile(conn, csv_file, table_name, target=None):
+    """Carga em massa via LOAD DATA LOCAL INFILE (servidor precisa de local_infile=ON)."""
+    columns, terminator = read_csv_header(csv_file)
+    types = _column_types(table_name)
+
+    # Cada campo passa por variável para tratar vazio -> NULL e CEP sem zeros à esquerda
+    assignments = []
+    for column in columns:
+        value = f"@{column}"
+        if column.endswith("zip_code_prefix"):
+            value = f"LPAD({value}, 5, '0')"
+        elif "NOT NULL" not in types[column]:
+            value = f"NULLIF({value}, '')"
+        assignments.append(f"`{column}` = {value}")
+
+    path = csv_file.resolve().as_posix().replace("'", "\\'")
+    sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {target or table_name} "
+        f"CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+        f"LINES TERMINATED BY '{terminator.encode('unicode_escape').decode()}' "
+        f"IGNORE 1 LINES "
+        f"({', '.join('@' + c for c in columns)}) "
+        f"SET {', '.join(assignments)}"
+    )
+    return conn.exec_driver_sql(sql).rowcount
+
+
+def insert_batches(conn, csv_file, table_name, target=None):
+    """Fallback: INSERT multi-row em lotes grandes (executemany do PyMySQL).
+
+    O CSV é lido em blocos de CSV_CHUNK_ROWS para não carregar o arquivo
+    inteiro em memória.
+    """
+    types = _column_types(table_name)
+    columns, _ = read_csv_header(csv_file)
+
+    nullable = [("NOT NULL" not in types[c]) for c in columns]
+    zip_columns = [c.endswith("zip_code_prefix") for c in columns]
+
+    def convert(row):
+        return tuple(
+            value.zfill(5) if is_zip else (None if is_nullable and value == "" else value)
+            for value, is_nullable, is_zip in zip(row, nullable, zip_columns)
+        )
+
+    column_list = ", ".join(f"`{c}`" for c in columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    sql = f"INSERT INTO {target or table_name} ({column_list}) VALUES ({placeholders})"
+
+    total = 0
+    start = time.perf_counter()
+    chunks = pd.read_csv(
+        csv_file, encoding='utf-8-sig', dtype=str, keep_default_na=False, chunksize=CSV_CHUNK_ROWS
+    )
+    cursor = conn.connection.cursor()
     try:
-        print(f"  📥 Importando {csv_file.name} para tabela '{table_name}'...")
-        
-        # Ler CSV
-        df = pd.read_csv(csv_file, encoding='utf-8', on_bad_lines='skip')
-        
-        # Se falhar, tentar com latin1
-        if df.empty:
-            df = pd.read_csv(csv_file, encoding='latin1', on_bad_lines='skip')
-        
-        print(f"     └─ {len(df)} linhas lidas")
-        
-        # Salvar no banco
-        df.to_sql(table_name, con=engine, if_exists='replace', index=False, chunksize=1000)
-        print(f"     ✅ Tabela '{table_name}' criada com {len(df)} linhas")
-        
-        return True
+        for chunk in chunks:
+            values = chunk.itertuples(index=False, name=None)
+            while True:
+                batch = [convert(row) for _, row in zip(range(INSERT_BATCH_SIZE), values)]
+                if not batch:
+                    break
+                cursor.executemany(sql, batch)
+                total += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"     … {table_name}: {total:,} linhas ({total / elapsed:,.0f} linhas/s)")
+    finally:
+        cursor.close()
+    return total
+
+
+def load_into(conn, csv_file, table_name, target=None):
+    """Carrega o CSV em `target` (padrão: a própria tabela). Retorna (linhas, método)."""
+    target = target or table_name
+    try:
+        return load_data_infile(conn, csv_file, table_name, target), "LOAD DATA"
+    except Exception as e:
+        print(f"     ⚠️  LOAD DATA indisponível ({str(e)[:80]}); usando INSERT em lotes")
+        conn.rollback()
+        conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+        conn.exec_driver_sql(f"TRUNCATE TABLE {target}")
+        return insert_batches(conn, csv_file, table_name, target), f"INSERT x{INSERT_BATCH_SIZE}"
+
+
+def import_typed_csv(engine, csv_file, table_name):
+    """(Re)cria a tabela tipada e carrega o CSV (LOAD DATA; fallback em lotes)."""
+    with engine.connect() as conn:
+        # FKs são validadas pelo dataset; desligar permite carregar em qualquer ordem
+        # (e derrubar uma tabela antiga referenciada por outras)
+        conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}")
+        conn.exec_driver_sql(create_table_sql(table_name))
+        rows, method = load_into(conn, csv_file, table_name)
+        conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+        conn.commit()
+    return rows, method
+
+
+def sync_typed_csv(engine, csv_file, table_name):
+    """Aplica um CSV alterado sobre a tabela existente, por chave primária.
+
+    O CSV vai para uma tabela de staging; só linhas novas/alteradas são
+    gravadas (upsert) e linhas que sumiram do CSV são apagadas. Tabelas sem
+    PK são recarregadas por inteiro.
+    """
+    schema = TABLE_SCHEMAS[table_name]
+    primary_key = schema["primary_key"]
+    columns = [name for name, _ in schema["columns"]]
+    staging = f"{table_name}__stage"
+
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+        if not primary_key:
+            conn.exec_driver_sql(f"TRUNCATE TABLE {table_name}")
+            rows, method = load_into(conn, csv_file, table_name)
+            conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+            conn.commit()
+            return rows, f"{method}, recarga completa"
+
+        # CREATE TABLE ... LIKE copia PK/índices, mas não as FKs
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS {staging}")
+        conn.exec_driver_sql(f"CREATE TABLE {staging} LIKE {table_name}")
+        try:
+            rows, method = load_into(conn, csv_file, table_name, staging)
+
+            join = " AND ".join(f"t.`{c}` = s.`{c}`" for c in primary_key)
+            same = " AND ".join(f"t.`{c}` <=> s.`{c}`" for c in columns if c not in primary_key)
+            changed = f"t.`{primary_key[0]}` IS NULL" + (f" OR NOT ({same})" if same else "")
+            column_list = ", ".join(f"`{c}`" for c in columns)
+            updates = ", ".join(f"`{c}` = d.`{c}`" for c in columns if c not in primary_key) \
+                or f"`{primary_key[0]}` = d.`{primary_key[0]}`"
+
+            # Tabela derivada: o UPDATE referencia d.* sem ambiguidade com o alvo
+            upserted = conn.exec_driver_sql(f"""
+                INSERT INTO {table_name} ({column_list})
+                SELECT * FROM (
+                    SELECT {", ".join(f"s.`{c}`" for c in columns)}
+                    FROM {staging} s
+                    LEFT JOIN {table_name} t ON {join}
+                    WHERE {changed}
+                ) d
+                ON DUPLICATE KEY UPDATE {updates}
+            """).rowcount
+            deleted = conn.exec_driver_sql(f"""
+                DELETE t FROM {table_name} t
+                LEFT JOIN {staging} s ON {join}
+                WHERE s.`{primary_key[0]}` IS NULL
+            """).rowcount
+            conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+            conn.commit()
+        except Exception:
+            # DROP TABLE faz commit implícito: desfaz o upsert parcial antes
+            conn.rollback()
+            raise
+        finally:
+            conn.exec_driver_sql(f"DROP TABLE IF EXISTS {staging}")
+
+    # rowcount do ON DUPLICATE KEY conta 1 por inserção e 2 por atualização
+    print(f"     🔁 {table_name}: ~{upserted} linha(s) afetadas no upsert, {deleted} removida(s)")
+    return rows, f"{method}, upsert por PK"
+
+
+def import_generic_csv(engine, csv_file, table_name):
+    """Import genérico (tabela fora de TABLE_SCHEMAS) via pandas, em blocos."""
+    rows = 0
+    for encoding in ('utf-8', 'latin1'):
+        try:
+            chunks = pd.read_csv(csv_file, encoding=encoding, on_bad_lines='skip', chunksize=CSV_CHUNK_ROWS)
+            for i, chunk in enumerate(chunks):
+                chunk.to_sql(
+                    table_name, con=engine, if_exists='replace' if i == 0 else 'append',
+                    index=False, chunksize=1000, method='multi'
+                )
+                rows += len(chunk)
+            return rows, "pandas"
+        except UnicodeDecodeError:
+            rows = 0
+    raise ValueError("encoding não suportado (utf-8/latin1)")
+
+
+def file_sha256(csv_file):
+    """Hash do conteúdo do arquivo (lido em blocos de 1 MB)."""
+    digest = hashlib.sha256()
+    with open(csv_file, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ensure_manifest(engine):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {LOAD_MANIFEST_TABLE} (
+                source_file VARCHAR(255) PRIMARY KEY,
+                table_name VARCHAR(64) NOT NULL,
+                size_bytes BIGINT NOT NULL,
+                mtime DOUBLE NOT NULL,
+                sha256 CHAR(64) NOT NULL,
+                row_count BIGINT NULL,
+                loaded_at DATETIME NOT NULL
+            )
+        """))
+        conn.commit()
+
+
+def read_manifest(engine):
+    """Entradas do manifesto por nome de arquivo."""
+    with engine.connect() as conn:
+        result = conn.execute(text(
+            f"SELECT source_file, size_bytes, mtime, sha256 FROM {LOAD_MANIFEST_TABLE}"
+        ))
+        return {row.source_file: row for row in result}
+
+
+def record_manifest(engine, csv_file, table_name, sha256, row_count=None):
+    stat = csv_file.stat()
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            REPLACE INTO {LOAD_MANIFEST_TABLE}
+                (source_file, table_name, size_bytes, mtime, sha256, row_count, loaded_at)
+            VALUES (:source_file, :table_name, :size_bytes, :mtime, :sha256, :row_count, :loaded_at)
+        """), {
+            "source_file": csv_file.name,
+            "table_name": table_name,
+            "size_bytes": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "row_count": row_count,
+            "loaded_at": datetime.now(),
+        })
+        conn.commit()
+
+
+def _expected_column(sql_type):
+    """(tipo, nullable) de uma coluna de TABLE_SCHEMAS, no formato do information_schema."""
+    spec = sql_type.lower()
+    nullable = not spec.endswith("not null")
+    return re.sub(r"\s+(not\s+)?null$", "", spec).strip(), nullable
+
+
+def schema_mismatch(engine, table_name):
+    """Diferença entre a tabela existente e o schema tipado (None se bate).
+
+    Confere colunas, tipos, nulidade e a chave primária pelo
+    information_schema. Tabelas criadas pelo import antigo (pandas.to_sql)
+    têm colunas TEXT/BIGINT e nenhuma PK.
+    """
+    schema = TABLE_SCHEMAS[table_name]
+    with engine.connect() as conn:
+        columns = conn.execute(text("""
+            SELECT COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table
+            ORDER BY ORDINAL_POSITION
+        """), {"table": table_name}).fetchall()
+        primary_key = [row[0] for row in conn.execute(text("""
+            SELECT COLUMN_NAME
+            FROM information_schema.KEY_COLUMN_USAGE
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND CONSTRAINT_NAME = 'PRIMARY'
+            ORDER BY ORDINAL_POSITION
+        """), {"table": table_name})]
+
+    if primary_key != schema["primary_key"]:
+        return f"PK {primary_key or 'ausente'} != {schema['primary_key']}"
+    actual = {
+        name: (
+            # MySQL < 8.0.19 mostra a largura de exibição dos inteiros: smallint(5) unsigned
+            re.sub(r"\b(tinyint|smallint|mediumint|int|bigint)\(\d+\)", r"\1", column_type.lower()),
+            is_nullable == "YES",
+        )
+        for name, column_type, is_nullable in columns
+    }
+    if list(actual) != [name for name, _ in schema["columns"]]:
+        return "colunas diferentes"
+    for name, sql_type in schema["columns"]:
+        expected = _expected_column(sql_type)
+        if actual[name] != expected:
+            return f"coluna {name}: {actual[name][0]} != {expected[0]}"
+    return None
+
+
+def plan_import(engine, csv_file, table_name, manifest):
+    """Decide o que fazer com um CSV: ('full' | 'sync' | None para pular, sha256 já calculado ou None)."""
+    if not table_exists(engine, table_name):
+        return "full", None
+
+    if table_name in TABLE_SCHEMAS:
+        # Tabela fora do schema tipado (ex.: do import antigo, sem PK): upsert não
+        # funcionaria e ela nunca seria tipada; recria do zero
+        mismatch = schema_mismatch(engine, table_name)
+        if mismatch:
+            print(f"  🔄 Recriando '{table_name}' (fora do schema tipado: {mismatch})")
+            return "full", None
+
+    entry = manifest.get(csv_file.name)
+    stat = csv_file.stat()
+    # Tamanho e mtime iguais: inalterado sem nem ler o arquivo
+    if entry is not None and entry.size_bytes == stat.st_size and entry.mtime == stat.st_mtime:
+        print(f"  ⏭️  Pulando '{table_name}' (inalterado)")
+        return None, None
+
+    sha256 = file_sha256(csv_file)
+    if entry is None:
+        # Tabela de antes do manifesto (já no schema tipado): registra a linha de base
+        record_manifest(engine, csv_file, table_name, sha256)
+        print(f"  ⏭️  Pulando '{table_name}' (já existe; registrado no manifesto)")
+        return None, None
+    if entry.sha256 == sha256:
+        record_manifest(engine, csv_file, table_name, sha256)
+        print(f"  ⏭️  Pulando '{table_name}' (mtime mudou, conteúdo igual)")
+        return None, None
+
+    return "sync", sha256
+
+
+def import_csv(engine, csv_file, table_name, mode="full", sha256=None):
+    """Importa um arquivo CSV para o banco de dados.
+
+    mode='full' cria a tabela do zero; mode='sync' aplica um CSV alterado
+    sobre a tabela existente. `sha256` é o hash já calculado pelo
+    plan_import (evita ler o arquivo de novo). Retorna as estatísticas da
+    carga (linhas, bytes, segundos) ou None se falhar.
+    """
+    typed = table_name in TABLE_SCHEMAS
+    action = "Sincronizando" if mode == "sync" else "Importando"
+    print(f"  📥 {action} {csv_file.name} para tabela '{table_name}'{' (schema tipado)' if typed else ''}...")
+    size = csv_file.stat().st_size
+    start = time.perf_counter()
+    try:
+        if sha256 is None:
+            sha256 = file_sha256(csv_file)
+        if typed and mode == "sync":
+            rows, method = sync_typed_csv(engine, csv_file, table_name)
+        elif typed:
+            rows, method = import_typed_csv(engine, csv_file, table_name)
+        else:
+            # Tabelas genéricas não têm PK conhecida: sempre recarga completa
+            rows, method = import_generic_csv(engine, csv_file, table_name)
+        record_manifest(engine, csv_file, table_name, sha256, rows)
     except Exception as e:
         print(f"     ❌ Erro ao importar {csv_file.name}: {str(e)}")
-        return False
+        return None
+
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    stats = {
+        "table": table_name,
+        "rows": rows,
+        "bytes": size,
+        "seconds": elapsed,
+        "method": method,
+    }
+    print(
+        f"     ✅ Tabela '{table_name}' {'sincronizada' if mode == 'sync' else 'criada'} com {rows:,} linhas em {elapsed:.1f}s "
+        f"({rows / elapsed:,.0f} linhas/s, {size / elapsed / 1e6:.1f} MB/s, {method})"
+    )
+    return stats
+
+
+def import_all(engine, jobs, workers=IMPORT_WORKERS):
+    """Importa vários CSVs em paralelo (uma conexão do pool por tabela).
+
+    Os maiores arquivos começam primeiro para encurtar o tempo total.
+    Threads bastam: o trabalho pesado é I/O no servidor (LOAD DATA/INSERT).
+    """
+    jobs = sorted(jobs, key=lambda job: job[0].stat().st_size, reverse=True)
+    workers = max(1, min(workers, len(jobs)))
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import") as pool:
+        futures = [
+            pool.submit(import_csv, engine, csv_file, table_name, mode, sha256)
+            for csv_file, table_name, mode, sha256 in jobs
+        ]
+        for future in as_completed(futures):
+            stats = future.result()
+            if stats:
+                results.append(stats)
+
+    if results:
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        total_rows = sum(s["rows"] for s in results)
+        total_bytes = sum(s["bytes"] for s in results)
+        print(f"\n  📈 Throughput por tabela:")
+        for s in sorted(results, key=lambda s: s["seconds"], reverse=True):
+            print(
+                f"     - {s['table']}: {s['rows']:,} linhas | {s['seconds']:.1f}s | "
+                f"{s['rows'] / s['seconds']:,.0f} linhas/s | {s['bytes'] / s['seconds'] / 1e6:.1f} MB/s"
+            )
+        print(
+            f"     = Total: {total_rows:,} linhas, {total_bytes / 1e6:.1f} MB em {elapsed:.1f}s "
+            f"({total_rows / elapsed:,.0f} linhas/s, {total_bytes / elapsed / 1e6:.1f} MB/s, {workers} workers)"
+        )
+    return results
+
+
+def write_dataset_version(engine, force=False):
+    """Grava uma nova versão do dataset; invalida os caches de resultado da API."""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {DATASET_VERSION_TABLE} (
+                    version VARCHAR(64) PRIMARY KEY,
+                    imported_at DATETIME NOT NULL
+                )
+            """))
+            current = conn.execute(text(f"SELECT COUNT(*) FROM {DATASET_VERSION_TABLE}")).scalar()
+            if current and not force:
+                print("  ℹ️  Versão do dataset mantida (nenhuma tabela reimportada)")
+                return None
+
+            now = datetime.now()
+            version = f"{now:%Y%m%d%H%M%S}-{uuid4().hex[:8]}"
+            conn.execute(
+                text(f"INSERT INTO {DATASET_VERSION_TABLE} (version, imported_at) VALUES (:version, :imported_at)"),
+                {"version": version, "imported_at": now}
+            )
+            conn.commit()
+        print(f"  🏷️  Versão do dataset: {version}")
+        return version
+    except Exception as e:
+        print(f"  ⚠️  Não foi possível gravar a versão do dataset: {str(e)}")
+        return None
 
 
 def apply_indexes(engine):
-    """Aplica índices de performance no banco."""
+    """Aplica índices de performance no banco.
+
+    Colunas tipadas (CHAR/DATETIME) dispensam índices de prefixo; joins por
+    order_id/customer_id/seller_id já são cobertos pelas PKs e FKs.
+    """
     indexes = {
-        # Orders (usando prefixo para colunas TEXT)
-        "idx_orders_timestamp_status": "CREATE INDEX idx_orders_timestamp_status ON olist_orders_dataset(order_purchase_timestamp(20), order_status(20))",
-        "idx_orders_customer_id": "CREATE INDEX idx_orders_customer_id ON olist_orders_dataset(customer_id(50))",
+        # Orders
+        "idx_orders_timestamp_status": "CREATE INDEX idx_orders_timestamp_status ON olist_orders_dataset(order_purchase_timestamp, order_status)",
         
         # Order Items
-        "idx_order_items_product_order": "CREATE INDEX idx_order_items_product_order ON olist_order_items_dataset(product_id(50), order_id(50))",
-        "idx_order_items_seller": "CREATE INDEX idx_order_items_seller ON olist_order_items_dataset(seller_id(50))",
+        "idx_order_items_product_order": "CREATE INDEX idx_order_items_product_order ON olist_order_items_dataset(product_id, order_id)",
         
         # Customers
-        "idx_customers_state": "CREATE INDEX idx_customers_state ON olist_customers_dataset(customer_state(5))",
-        "idx_customers_unique_id": "CREATE INDEX idx_customers_unique_id ON olist_customers_dataset(customer_unique_id(50))",
+        "idx_customers_state": "CREATE INDEX idx_customers_state ON olist_customers_dataset(customer_state)",
+        "idx_customers_unique_id": "CREATE INDEX idx_customers_unique_id ON olist_customers_dataset(customer_unique_id)",
         
         # Products
-        "idx_products_category": "CREATE INDEX idx_products_category ON olist_products_dataset(product_category_name(100))",
+        "idx_products_category": "CREATE INDEX idx_products_category ON olist_products_dataset(product_category_name)",
         
         # Payments
-        "idx_payments_order_type": "CREATE INDEX idx_payments_order_type ON olist_order_payments_dataset(order_id(50), payment_type(20))",
+        "idx_payments_order_type": "CREATE INDEX idx_payments_order_type ON olist_order_payments_dataset(order_id, payment_type)",
         
         # Reviews
-        "idx_reviews_order_score": "CREATE INDEX idx_reviews_order_score ON olist_order_reviews_dataset(order_id(50), review_score)",
+        "idx_reviews_order_score": "CREATE INDEX idx_reviews_order_score ON olist_order_reviews_dataset(order_id, review_score)",
         
         # Sellers
-        "idx_sellers_state": "CREATE INDEX idx_sellers_state ON olist_sellers_dataset(seller_state(5))",
+        "idx_sellers_state": "CREATE INDEX idx_sellers_state ON olist_sellers_dataset(seller_state)",
+
+        # Geolocation
+        "idx_geo_zip": "CREATE INDEX idx_geo_zip ON olist_geolocation_dataset(geolocation_zip_code_prefix)",
     }
     
     print("\n📊 Aplicando índices de performance...")
@@ -197,6 +852,186 @@ def apply_indexes(engine):
         return False
 
 
+def build_rollups(engine, force=False):
+    """(Re)constrói as tabelas de agregação.
+
+    Cada rollup é montado numa tabela temporária e trocado via RENAME TABLE,
+    então a API nunca enxerga um rollup pela metade.
+    """
+    print("\n🧮 Materializando rollups...")
+    try:
+        with engine.connect() as conn:
+            for table_name, select_sql in ROLLUPS.items():
+                exists = table_exists(engine, table_name)
+                if exists and not force:
+                    print(f"  ⏭️  Pulando '{table_name}' (já existe)")
+                    continue
+
+                staging = f"{table_name}__new"
+                conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+                conn.execute(text(f"CREATE TABLE {staging} AS {select_sql}"))
+                conn.execute(text(f"CREATE INDEX idx_{table_name}_month ON {staging}(purchase_month(7))"))
+                if exists:
+                    conn.execute(text(
+                        f"RENAME TABLE {table_name} TO {table_name}__old, {staging} TO {table_name}"
+                    ))
+                    conn.execute(text(f"DROP TABLE {table_name}__old"))
+                else:
+                    conn.execute(text(f"RENAME TABLE {staging} TO {table_name}"))
+                conn.commit()
+
+                row_count = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar()
+                print(f"  ✅ {table_name}: {row_count:,} linhas")
+        return True
+    except Exception as e:
+        print(f"  ❌ Erro ao materializar rollups: {str(e)}")
+        return False
+
+
+def duckdb_type(sql_type):
+    """Tipo MySQL do TABLE_SCHEMAS -> tipo DuckDB."""
+    base = sql_type.upper().replace("NOT NULL", "").replace("NULL", "").strip()
+    if base.startswith(("CHAR", "VARCHAR", "TEXT")):
+        return "VARCHAR"
+    if base == "DATETIME":
+        return "TIMESTAMP"
+    if "INT" in base:
+        return "INTEGER"
+    return base  # DECIMAL(p,s), DOUBLE
+
+
+def duckdb_select(csv_file, table_name):
+    """SELECT sobre read_csv com os tipos do schema (vazio -> NULL, CEP com zeros)."""
+    source = f"read_csv('{csv_file.resolve().as_posix()}', header=true, all_varchar=true)"
+    if table_name not in TABLE_SCHEMAS:
+        return f"SELECT * FROM read_csv_auto('{csv_file.resolve().as_posix()}', header=true)"
+
+    expressions = []
+    for column, sql_type in TABLE_SCHEMAS[table_name]["columns"]:
+        target = duckdb_type(sql_type)
+        if column.endswith("zip_code_prefix"):
+            value = f'lpad("{column}", 5, \'0\')'
+        elif target == "VARCHAR":
+            value = f'NULLIF("{column}", \'\')' if "NOT NULL" not in sql_type else f'"{column}"'
+        else:
+            value = f'CAST(NULLIF("{column}", \'\') AS {target})'
+        expressions.append(f'{value} AS "{column}"')
+    return f"SELECT {', '.join(expressions)} FROM {source}"
+
+
+def build_duckdb(csv_files, path=DUCKDB_PATH):
+    """Gera o banco DuckDB (tabelas tipadas, rollups e versão) a partir dos CSVs.
+
+    O arquivo é montado ao lado e trocado no fim, então a API nunca abre um
+    banco pela metade.
+    """
+    import duckdb
+    import sqlglot
+
+    tmp_path = path.with_suffix(".tmp.duckdb")
+    tmp_path.unlink(missing_ok=True)
+    print(f"\n🦆 Gerando DuckDB em {path}...")
+    start = time.perf_counter()
+    conn = duckdb.connect(str(tmp_path))
+    try:
+        for csv_file in sorted(csv_files, key=lambda f: f.stat().st_size, reverse=True):
+            table_name = csv_file.stem
+            table_start = time.perf_counter()
+            conn.execute(f"CREATE TABLE {table_name} AS {duckdb_select(csv_file, table_name)}")
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            elapsed = max(time.perf_counter() - table_start, 1e-6)
+            size = csv_file.stat().st_size
+            print(
+                f"  ✅ {table_name}: {rows:,} linhas em {elapsed:.1f}s "
+                f"({rows / elapsed:,.0f} linhas/s, {size / elapsed / 1e6:.1f} MB/s)"
+            )
+
+        # Mesmos rollups do MySQL, traduzidos para o dialeto DuckDB
+        for table_name, select_sql in ROLLUPS.items():
+            select_duckdb = sqlglot.transpile(select_sql, read="mysql", write="duckdb")[0]
+            conn.execute(f"CREATE TABLE {table_name} AS {select_duckdb}")
+            rows = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            print(f"  🧮 {table_name}: {rows:,} linhas")
+
+        now = datetime.now()
+        version = f"{now:%Y%m%d%H%M%S}-{uuid4().hex[:8]}"
+        conn.execute(f"CREATE TABLE {DATASET_VERSION_TABLE} (version VARCHAR PRIMARY KEY, imported_at TIMESTAMP NOT NULL)")
+        conn.execute(f"INSERT INTO {DATASET_VERSION_TABLE} VALUES (?, ?)", [version, now])
+        conn.execute("CHECKPOINT")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, path)
+    print(f"  🏷️  Versão do dataset: {version}")
+    print(f"  ✅ DuckDB pronto em {time.perf_counter() - start:.1f}s")
+    return version
+
+
+def export_parquet(csv_files, path=PARQUET_DIR, force=False):
+    """Exporta cada CSV (já tipado) como Parquet; orders/items por mês da compra.
+
+    Lê direto dos CSVs com DuckDB em memória, sem passar pelo MySQL. O
+    snapshot é escrito ao lado e trocado no fim.
+    """
+    if path.exists() and not force:
+        print(f"\n📦 Snapshot Parquet mantido ({path})")
+        return False
+
+    try:
+        import duckdb
+    except ImportError:
+        print("\n⚠️  Snapshot Parquet ignorado: instale o pacote 'duckdb'")
+        return False
+
+    print(f"\n📦 Exportando snapshot Parquet em {path}...")
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    start = time.perf_counter()
+
+    conn = duckdb.connect()
+    try:
+        tables = {csv_file.stem: csv_file for csv_file in csv_files}
+        for table_name, csv_file in tables.items():
+            conn.execute(f"CREATE TABLE {table_name} AS {duckdb_select(csv_file, table_name)}")
+
+        month = "strftime(o.order_purchase_timestamp, '%Y-%m')"
+        for table_name in sorted(tables):
+            target = (tmp_path / table_name).as_posix()
+            if table_name == "olist_orders_dataset":
+                select_sql = f"SELECT o.*, {month} AS purchase_month FROM olist_orders_dataset o"
+            elif table_name == "olist_order_items_dataset" and "olist_orders_dataset" in tables:
+                select_sql = f"""
+                    SELECT oi.*, COALESCE({month}, 'unknown') AS purchase_month
+                    FROM olist_order_items_dataset oi
+                    LEFT JOIN olist_orders_dataset o ON o.order_id = oi.order_id
+                """
+            else:
+                select_sql = f"SELECT * FROM {table_name}"
+
+            if table_name in PARQUET_PARTITIONED and "purchase_month" in select_sql:
+                conn.execute(
+                    f"COPY ({select_sql}) TO '{target}' "
+                    f"(FORMAT PARQUET, COMPRESSION ZSTD, PARTITION_BY (purchase_month))"
+                )
+            else:
+                (tmp_path / table_name).mkdir()
+                conn.execute(f"COPY ({select_sql}) TO '{target}/data.parquet' (FORMAT PARQUET, COMPRESSION ZSTD)")
+
+            size = sum(f.stat().st_size for f in (tmp_path / table_name).rglob("*.parquet"))
+            print(f"  ✅ {table_name}: {size / 1e6:.1f} MB")
+    finally:
+        conn.close()
+
+    old_path = path.with_name(path.name + ".old")
+    if path.exists():
+        path.rename(old_path)
+    tmp_path.rename(path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    print(f"  ✅ Snapshot Parquet pronto em {time.perf_counter() - start:.1f}s")
+    return True
+
+
 def main():
     """Executa o setup completo."""
     print("\n" + "="*60)
@@ -215,6 +1050,17 @@ def main():
         print("   Crie uma pasta 'data' com os arquivos CSV")
         sys.exit(1)
     
+    # Backend embarcado: não precisa de MySQL
+    if DB_BACKEND == "duckdb":
+        csv_files = list(DATA_DIR.glob("*.csv"))
+        if not csv_files:
+            print(f"\n❌ Nenhum arquivo CSV encontrado em {DATA_DIR}")
+            sys.exit(1)
+        build_duckdb(csv_files)
+        export_parquet(csv_files, force=True)
+        print("\n🎯 Inicie a API com DB_BACKEND=duckdb")
+        return
+    
     # Garantir database
     print(f"\n🔌 Conectando ao MySQL...")
     try:
@@ -258,21 +1104,24 @@ def main():
     
     # Importar CSVs
     print(f"\n📥 Importando dados...")
-    imported_count = 0
+    ensure_manifest(engine)
+    manifest = read_manifest(engine)
+    jobs = []
     
     for csv_file in sorted(csv_files):
         table_name = csv_file.stem  # Remove .csv
         
-        # Verificar se tabela já existe
-        if table_exists(engine, table_name):
-            print(f"  ⏭️  Pulando '{table_name}' (já existe)")
+        # Tabela nova, CSV alterado (pelo manifesto) ou inalterado
+        mode, sha256 = plan_import(engine, csv_file, table_name, manifest)
+        if mode is None:
             continue
         
-        if import_csv(engine, csv_file, table_name):
-            imported_count += 1
+        jobs.append((csv_file, table_name, mode, sha256))
+    
+    imported_count = len(import_all(engine, jobs)) if jobs else 0
     
     if imported_count == 0:
-        print("  ℹ️  Nenhuma tabela nova foi importada (todas já existem)")
+        print("  ℹ️  Nenhuma tabela importada (todas existem e os CSVs estão inalterados)")
     else:
         print(f"\n✅ {imported_count} tabela(s) importada(s)")
     
@@ -287,6 +1136,16 @@ def main():
     
     # Aplicar índices
     apply_indexes(engine)
+
+    # Rollups (reconstruídos quando algo foi reimportado)
+    build_rollups(engine, force=imported_count > 0)
+
+    # Snapshot Parquet (a partir dos CSVs) para leituras offline via Arrow
+    export_parquet(csv_files, force=imported_count > 0)
+
+    # Nova versão do dataset quando algo foi (re)importado
+    print(f"\n🏷️  Versão do dataset...")
+    write_dataset_version(engine, force=imported_count > 0)
     
     # Estatísticas finais
     print(f"\n📊 Estatísticas finais:")